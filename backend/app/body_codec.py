@@ -0,0 +1,88 @@
+import logging
+import os
+import zlib
+
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# How email bodies are stored: "none" keeps plain strings, "zlib" or "zstd" store
+# compressed bytes in `body` and the codec name in `body_codec`. zstd needs the
+# optional zstandard package and falls back to zlib without it.
+EMAIL_BODY_CODEC = os.getenv("EMAIL_BODY_CODEC", "none")
+# Bodies shorter than this (UTF-8 bytes) are stored as plain strings
+EMAIL_BODY_COMPRESS_MIN_BYTES = int(os.getenv("EMAIL_BODY_COMPRESS_MIN_BYTES", "1024"))
+EMAIL_BODY_COMPRESS_LEVEL = {
+    "zlib": int(os.getenv("EMAIL_BODY_ZLIB_LEVEL", "6")),
+    "zstd": int(os.getenv("EMAIL_BODY_ZSTD_LEVEL", "3")),
+}
+
+CODECS = ("zlib", "zstd")
+
+
+def _resolve_codec(codec):
+    codec = codec or EMAIL_BODY_CODEC
+    if codec == "zstd" and zstandard is None:
+        logger.warning("EMAIL_BODY_CODEC=zstd but zstandard is not installed, using zlib")
+        return "zlib"
+    return codec if codec in CODECS else None
+
+
+def compress_body(text, codec=None):
+    """
+    Return (stored_value, codec_name) for a body. The value stays a plain string, with
+    codec None, when compression is off, the body is short or compressing does not help.
+    """
+    codec = _resolve_codec(codec)
+    if codec is None or not text:
+        return text, None
+    raw = text.encode('utf-8')
+    if len(raw) < EMAIL_BODY_COMPRESS_MIN_BYTES:
+        return text, None
+    if codec == "zstd":
+        compressed = zstandard.ZstdCompressor(level=EMAIL_BODY_COMPRESS_LEVEL["zstd"]).compress(raw)
+    else:
+        compressed = zlib.compress(raw, EMAIL_BODY_COMPRESS_LEVEL["zlib"])
+    if len(compressed) >= len(raw):
+        return text, None
+    return Binary(compressed), codec
+
+
+def decompress_body(value, codec):
+    """Inverse of compress_body."""
+    if codec is None:
+        return value
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Email body is zstd-compressed but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(bytes(value))
+    elif codec == "zlib":
+        raw = zlib.decompress(bytes(value))
+    else:
+        raise ValueError(f"Unknown email body codec: {codec}")
+    return raw.decode('utf-8')
+
+
+def compress_email_fields(fields, codec=None):
+    """Copy of an email document with its body compressed for storage."""
+    stored = dict(fields)
+    if 'body' in stored:
+        stored['body'], stored['body_codec'] = compress_body(stored['body'], codec)
+    return stored
+
+
+def read_body(document):
+    """
+    Body text of a stored email document. Decompression happens here, on first read,
+    and the text replaces the stored bytes so later reads are free.
+    """
+    codec = document.get('body_codec')
+    if codec is not None:
+        document['body'] = decompress_body(document.get('body'), codec)
+        document['body_codec'] = None
+    return document.get('body', '')
@@ -0,0 +1,247 @@
+import base64
+import hashlib
+import json
+import logging
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from app.db import emails_collection, ChunkedBulkWriter
+from app.body_codec import compress_email_fields, read_body
+
+logger = logging.getLogger(__name__)
+
+
+# Fields covered by content_hash; a change to any of them makes the email new content
+CONTENT_HASH_FIELDS = ('subject', 'snippet', 'body')
+
+
+def content_hash(email_item):
+    """Hex sha256 over an email's subject, snippet and body text."""
+    digest = hashlib.sha256()
+    for field in CONTENT_HASH_FIELDS:
+        digest.update((email_item.get(field) or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+async def load_content_ledger(user_id, email_ids):
+    """
+    Content hashes recorded for the user's stored emails among email_ids, as
+    {id: {"content_hash", "mem0_content_hash", "mem0_memory_ids"}}. content_hash is what
+    MongoDB holds, mem0_content_hash what was last uploaded to Mem0 and mem0_memory_ids
+    the memories that upload created. Emails not stored yet are absent.
+    """
+    if not email_ids:
+        return {}
+    cursor = emails_collection.find(
+        {"user_id": user_id, "id": {"$in": list(email_ids)}},
+        {"_id": 0, "id": 1, "content_hash": 1, "mem0_content_hash": 1, "mem0_memory_ids": 1}
+    )
+    return {
+        document["id"]: {
+            "content_hash": document.get("content_hash"),
+            "mem0_content_hash": document.get("mem0_content_hash"),
+            "mem0_memory_ids": document.get("mem0_memory_ids"),
+        }
+        async for document in cursor
+    }
+
+
+async def upsert_emails(user_id, emails, ledger=None):
+    """
+    Write emails for a user as unordered bulk_write upserts keyed by (user_id, id),
+    through ChunkedBulkWriter so a chunk of large bodies is split by BSON size.
+
+    Each email gets its content_hash set (on the passed dict too, for the Mem0 upload).
+    Emails whose hash matches the ledger from load_content_ledger are skipped without a
+    write. Documents whose fields are all unchanged are matched but not rewritten, so a
+    resync of an unchanged mailbox touches no documents or index entries and readers
+    never see the mailbox empty. Bodies are compressed per EMAIL_BODY_CODEC; read them
+    back with app.body_codec.read_body. Returns {"inserted", "updated", "unchanged",
+    "skipped", "failed"} counts and the writer's per-chunk timings under "chunks".
+    """
+    if not emails:
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "failed": 0, "chunks": []}
+
+    ledger = ledger or {}
+    skipped = 0
+    writer = ChunkedBulkWriter(emails_collection)
+    for email_item in emails:
+        email_item['content_hash'] = content_hash(email_item)
+        if ledger.get(email_item['id'], {}).get('content_hash') == email_item['content_hash']:
+            skipped += 1
+            continue
+        fields = {key: value for key, value in email_item.items() if key != '_id'}
+        fields['user_id'] = user_id
+        fields = compress_email_fields(fields)
+        await writer.add(UpdateOne({"user_id": user_id, "id": email_item['id']}, {"$set": fields}, upsert=True), fields)
+    result = await writer.close()
+
+    write_counts = result["counts"]
+    counts = {
+        "inserted": write_counts["upserted"],
+        "updated": write_counts["modified"],
+        "unchanged": write_counts["matched"] - write_counts["modified"],
+        "skipped": skipped,
+        "failed": write_counts["failed"],
+        "chunks": result["chunks"],
+    }
+    if counts["failed"]:
+        logger.error(f"Failed to store {counts['failed']} emails for user_id {user_id}: {result['errors'][:3]}")
+    logger.debug(f"Upserted {len(emails) - skipped} emails ({skipped} unchanged by content hash) for user_id {user_id} in {len(result['chunks'])} chunk(s)")
+    return counts
+
+
+async def mark_uploaded_to_mem0(user_id, emails, memory_ids=None):
+    """
+    Record each email's content_hash as mem0_content_hash once it is in Mem0, so the
+    next sync skips it while the content stays the same, and the ids of its own memories
+    (memory_ids, from upload_emails_to_mem0) as mem0_memory_ids, which the next upload of
+    changed content deletes.
+    The update only applies while the stored content_hash still matches what was uploaded.
+    """
+    memory_ids = memory_ids or {}
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "id": email_item['id'], "content_hash": email_item['content_hash']},
+            {"$set": {
+                "mem0_content_hash": email_item['content_hash'],
+                **({"mem0_memory_ids": memory_ids[email_item['id']]} if email_item['id'] in memory_ids else {}),
+            }}
+        )
+        for email_item in emails if email_item.get('content_hash')
+    ]
+    if operations:
+        await emails_collection.bulk_write(operations, ordered=False)
+
+
+async def has_emails(user_id):
+    """
+    Whether the user has any stored email. A find_one on user_id projected to that
+    field is answered from the (user_id, id) index alone, reading one key however
+    large the mailbox is.
+    """
+    return await emails_collection.find_one({"user_id": user_id}, {"_id": 0, "user_id": 1}) is not None
+
+
+async def delete_missing_emails(user_id, keep_ids):
+    """Delete the user's stored emails whose id is not in keep_ids. Returns the deleted count."""
+    result = await emails_collection.delete_many({"user_id": user_id, "id": {"$nin": list(keep_ids)}})
+    return result.deleted_count
+
+
+async def delete_emails(user_id, email_ids):
+    """Delete the given emails of a user. Returns the deleted count."""
+    if not email_ids:
+        return 0
+    result = await emails_collection.delete_many({"user_id": user_id, "id": {"$in": list(email_ids)}})
+    return result.deleted_count
+
+
+def encode_cursor(values):
+    """Opaque pagination cursor for a dict of sort key values (ObjectIds as strings)."""
+    raw = json.dumps({key: str(value) if isinstance(value, ObjectId) else value for key, value in values.items()})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """
+    Inverse of encode_cursor, with "_id" turned back into an ObjectId. Raises ValueError
+    if the cursor is malformed or lacks one of keys.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        missing = [key for key in keys if key not in values]
+        if missing:
+            raise KeyError(missing)
+        if '_id' in values:
+            values['_id'] = ObjectId(values['_id'])
+        return values
+    except (ValueError, TypeError, KeyError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+# Fields returned for search hits; bodies stay on the server
+SEARCH_RESULT_FIELDS = {"_id": 1, "id": 1, "subject": 1, "snippet": 1}
+
+
+async def search_emails(user_id, query, limit=20, cursor=None):
+    """
+    Keyword search over the user's subjects, snippets and bodies using the emails text
+    index, best matches first. Hits are ordered by (score desc, _id asc); cursor is the
+    next_cursor of the previous page and resumes strictly after its last hit.
+    Returns {"results": [{"id", "subject", "snippet", "score"}], "next_cursor"}.
+    """
+    pipeline = [
+        {"$match": {"user_id": user_id, "$text": {"$search": query}}},
+        {"$project": {**SEARCH_RESULT_FIELDS, "score": {"$meta": "textScore"}}},
+    ]
+    if cursor:
+        after = decode_cursor(cursor, ("score", "_id"))
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": after["score"]}},
+            {"score": after["score"], "_id": {"$gt": after["_id"]}},
+        ]}})
+    pipeline += [{"$sort": {"score": -1, "_id": 1}}, {"$limit": limit + 1}]
+
+    hits = await emails_collection.aggregate(pipeline).to_list(length=limit + 1)
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor({"score": hits[-1]["score"], "_id": hits[-1]["_id"]})
+    results = [{key: hit.get(key) for key in ("id", "subject", "snippet", "score")} for hit in hits]
+    return {"results": results, "next_cursor": next_cursor}
+
+
+# Fields returned by the listing, without and with bodies
+LIST_FIELDS = {"_id": 0, "id": 1, "subject": 1, "snippet": 1}
+LIST_FIELDS_WITH_BODY = {**LIST_FIELDS, "body": 1, "body_codec": 1}
+
+
+def _listing_query(user_id, cursor):
+    query = {"user_id": user_id}
+    if cursor:
+        query["id"] = {"$gt": decode_cursor(cursor, ("id",))["id"]}
+    return query
+
+
+def _listed_email(document, include_body):
+    if include_body:
+        document["body"] = read_body(document)
+        document.pop("body_codec", None)
+    return document
+
+
+async def list_emails(user_id, limit=50, cursor=None, include_body=False):
+    """
+    One page of the user's stored emails ordered by Gmail id, read along the
+    (user_id, id) index. Keyset pagination: cursor is the next_cursor of the previous
+    page, so every page costs the same however deep it is and emails stored meanwhile
+    neither shift nor repeat pages. Returns {"emails", "next_cursor"}.
+    """
+    projection = LIST_FIELDS_WITH_BODY if include_body else LIST_FIELDS
+    documents = await emails_collection.find(_listing_query(user_id, cursor), projection) \
+        .sort("id", 1).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor({"id": documents[-1]["id"]})
+    return {"emails": [_listed_email(document, include_body) for document in documents], "next_cursor": next_cursor}
+
+
+def iter_emails(user_id, cursor=None, include_body=True, batch_size=500):
+    """
+    Async iterator over all of the user's stored emails after cursor, in list_emails
+    order. The driver fetches batch_size documents at a time, so memory stays constant
+    however many emails are streamed. A bad cursor raises ValueError here, before
+    anything is read.
+    """
+    query = _listing_query(user_id, cursor)
+    projection = LIST_FIELDS_WITH_BODY if include_body else LIST_FIELDS
+
+    async def _emails():
+        async for document in emails_collection.find(query, projection).sort("id", 1).batch_size(batch_size):
+            yield _listed_email(document, include_body)
+    return _emails()
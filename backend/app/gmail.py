@@ -1,14 +1,21 @@
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient import discovery_cache
+from googleapiclient.http import build_http
 from google.oauth2.credentials import Credentials
-import base64
-import re
+from google_auth_httplib2 import AuthorizedHttp
+import asyncio
 from typing import List
-import html
+import json
 import os
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from fastapi.concurrency import run_in_threadpool
 from googleapiclient.errors import HttpError
+from app.mime_extract import extract_body
+from app.html_to_text import html_to_text
+from app.utils import RetryConfig, retry_async
 
 # Configure logging for this module
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +23,281 @@ logger = logging.getLogger(__name__)
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+GMAIL_DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+# Optional on-disk copy of the Gmail discovery document. When unset we use the copy
+# bundled with googleapiclient and only fall back to the network if it is missing.
+GMAIL_DISCOVERY_CACHE_PATH = os.getenv("GMAIL_DISCOVERY_CACHE_PATH")
+
+# How message details are downloaded: "batch" packs up to GMAIL_BATCH_SIZE
+# messages.get sub-requests into one HTTP call, "concurrent" keeps GMAIL_FETCH_CONCURRENCY
+# single calls in flight, "serial" issues one call at a time.
+GMAIL_FETCH_MODE = os.getenv("GMAIL_FETCH_MODE", "batch")
+# The Gmail batch endpoint accepts at most 100 sub-requests per HTTP call.
+GMAIL_BATCH_SIZE = min(int(os.getenv("GMAIL_BATCH_SIZE", "100")), 100)
+# Resync through users.history.list when the user has a stored historyId.
+GMAIL_INCREMENTAL_SYNC = os.getenv("GMAIL_INCREMENTAL_SYNC", "true").lower() == "true"
+# Emails per chunk yielded by iter_email_chunks (one full batch by default).
+GMAIL_STREAM_CHUNK_SIZE = int(os.getenv("GMAIL_STREAM_CHUNK_SIZE", "100"))
+# What each messages.get returns: "full" MIME tree or "masked" (fields mask with only what
+# parse_gmail_message reads). The mask mostly drops transport headers, a few percent of a
+# typical message, so full stays the default.
+GMAIL_PAYLOAD_MODE = os.getenv("GMAIL_PAYLOAD_MODE", "full")
+# Decoded bodies are capped at this many bytes; only the needed base64 prefix is decoded.
+GMAIL_MAX_BODY_BYTES = int(os.getenv("GMAIL_MAX_BODY_BYTES", str(1024 * 1024)))
+# Text kept from an HTML body after tags, scripts and styles are stripped.
+GMAIL_MAX_HTML_TEXT_CHARS = int(os.getenv("GMAIL_MAX_HTML_TEXT_CHARS", "200000"))
+# Number of Gmail HTTP calls (single requests or batches) kept in flight per sync.
+GMAIL_FETCH_CONCURRENCY = int(os.getenv("GMAIL_FETCH_CONCURRENCY", "4"))
+# Gmail allows 250 quota units per user per second; each method has a fixed unit cost.
+GMAIL_QUOTA_UNITS_PER_SECOND = float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250"))
+GMAIL_QUOTA_COSTS = {
+    "messages.get": 5,
+    "messages.list": 5,
+    "history.list": 2,
+    "getProfile": 1,
+}
+# Calls rejected with 429, 5xx or a 403 rate-limit reason are retried with jittered
+# exponential backoff, waiting at least as long as the response's Retry-After asks.
+GMAIL_RETRY_ATTEMPTS = int(os.getenv("GMAIL_RETRY_ATTEMPTS", "6"))
+GMAIL_RETRY_BASE_DELAY = float(os.getenv("GMAIL_RETRY_BASE_DELAY", "1.0"))
+GMAIL_RETRY_MAX_DELAY = float(os.getenv("GMAIL_RETRY_MAX_DELAY", "32"))
+# Longest Retry-After we are willing to sleep for; longer requests are cut to this.
+GMAIL_RETRY_AFTER_MAX = float(os.getenv("GMAIL_RETRY_AFTER_MAX", "120"))
+GMAIL_RETRY_CONFIG = RetryConfig(
+    max_attempts=GMAIL_RETRY_ATTEMPTS,
+    delay=GMAIL_RETRY_BASE_DELAY,
+    backoff_factor=2.0,
+    max_delay=GMAIL_RETRY_MAX_DELAY,
+    jitter=True,
+)
+# 403 reasons Gmail uses for quota throttling (as opposed to missing permissions)
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "RATE_LIMIT_EXCEEDED"}
+
+
+# Fields masks for messages.get. A mask cannot recurse, so part trees are spelled out
+# _MASKED_PART_DEPTH levels deep, which covers multipart/mixed > multipart/alternative >
+# text/* layouts. Messages nested deeper are fetched again unmasked.
+_PART_FIELDS = "mimeType,filename,headers(name,value),body(data,attachmentId)"
+_SUBPART_FIELDS = f"parts({_PART_FIELDS},parts({_PART_FIELDS},parts({_PART_FIELDS})))"
+_MASKED_PART_DEPTH = 3  # levels of parts in _SUBPART_FIELDS
+GMAIL_REQUEST_KWARGS = {
+    "full": {"format": "full"},
+    "masked": {"format": "full", "fields": f"id,snippet,payload({_PART_FIELDS},{_SUBPART_FIELDS})"},
+}
+
+
+# Messages carrying any of these labels are not synced: messages.list leaves out spam and
+# trash, and the full sync query leaves out drafts. Incremental syncs filter history the same way.
+GMAIL_SYNC_EXCLUDED_LABELS = {"SPAM", "TRASH", "DRAFT"}
+
+
+class HistoryExpiredError(Exception):
+    """The stored historyId is too old for users.history.list; a full sync is needed."""
+
+
+class GmailQuotaBucket:
+    """
+    Token bucket metering Gmail per-user quota units.
+    acquire() waits until enough units have accumulated; a request costing more than the
+    bucket holds (e.g. a 100-message batch) is let through once the bucket is full and
+    leaves it in debt, so the long-run rate still matches units_per_second.
+    """
+
+    def __init__(self, units_per_second=None, capacity=None):
+        self.units_per_second = units_per_second or GMAIL_QUOTA_UNITS_PER_SECOND
+        self.capacity = capacity or self.units_per_second
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.units_consumed = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.units_per_second)
+        self.updated_at = now
+
+    async def acquire(self, units):
+        # Waiters queue on the lock, so units are granted in FIFO order
+        async with self._lock:
+            self._refill()
+            needed = min(units, self.capacity)
+            if self.tokens < needed:
+                await asyncio.sleep((needed - self.tokens) / self.units_per_second)
+                self._refill()
+            self.tokens -= units
+            self.units_consumed += units
+
+# One bucket per Gmail user so concurrent syncs for the same mailbox share its quota
+_quota_buckets = {}
+
+def get_quota_bucket(user_id):
+    """Return the process-wide quota bucket for a Gmail user."""
+    if user_id not in _quota_buckets:
+        _quota_buckets[user_id] = GmailQuotaBucket()
+    return _quota_buckets[user_id]
+
+
+class _ThrottledBatchError(Exception):
+    """Some sub-requests of a batch were rejected with a retryable error; raised to retry just those."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} batch sub-request(s) need a retry, e.g. {errors[0]}")
+
+def _is_rate_limit_error(e):
+    if isinstance(e, _ThrottledBatchError):
+        return any(_is_rate_limit_error(error) for error in e.errors)
+    if not isinstance(e, HttpError):
+        return False
+    if e.resp.status == 429:
+        return True
+    details = e.error_details if isinstance(e.error_details, list) else []
+    return e.resp.status == 403 and any(
+        isinstance(detail, dict) and detail.get('reason') in _RATE_LIMIT_REASONS for detail in details
+    )
+
+def _is_retryable_gmail_error(e):
+    """429, 5xx and rate-limit 403s are transient; everything else is final."""
+    if isinstance(e, _ThrottledBatchError):
+        return True
+    return isinstance(e, HttpError) and (e.resp.status >= 500 or _is_rate_limit_error(e))
+
+def _retry_after_seconds(e):
+    """Seconds requested by the Retry-After header (delta-seconds or HTTP-date), or None."""
+    if isinstance(e, _ThrottledBatchError):
+        waits = [wait for wait in map(_retry_after_seconds, e.errors) if wait is not None]
+        return max(waits) if waits else None
+    value = e.resp.get('retry-after') if isinstance(e, HttpError) else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), GMAIL_RETRY_AFTER_MAX)
+
+async def _retry_gmail_call(func, stats, context):
+    """Run func() with the Gmail retry policy, counting retries in stats."""
+    return await retry_async(
+        func,
+        config=GMAIL_RETRY_CONFIG,
+        exceptions=(HttpError, _ThrottledBatchError),
+        context=context,
+        should_retry=_is_retryable_gmail_error,
+        retry_after=_retry_after_seconds,
+        on_retry=stats.record_retry,
+    )
+
+async def _execute_gmail_request(request, method, stats, quota_bucket, context, http=None):
+    """
+    Execute one Gmail API request under the retry policy. Every attempt waits for and is
+    charged to the quota bucket, so retries are paced like any other call.
+    """
+    units = GMAIL_QUOTA_COSTS[method]
+
+    async def _attempt():
+        await quota_bucket.acquire(units)
+        stats.round_trips += 1
+        stats.quota_units += units
+        return await run_in_threadpool(request.execute, http=http)
+
+    return await _retry_gmail_call(_attempt, stats, context)
+
+
+class GmailFetchStats:
+    """Counters describing the Gmail API traffic of a single fetch."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.list_calls = 0
+        self.get_calls = 0
+        self.successful = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.refetched = 0
+        self.quota_units = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.backoff_seconds = 0.0
+
+    def record_retry(self, error, delay):
+        """Account for one retried call and the backoff before it."""
+        self.retries += 1
+        if _is_rate_limit_error(error):
+            self.rate_limited += 1
+        self.backoff_seconds += delay
+
+    def record_payload(self, message):
+        """Account for one downloaded message, measured as compact JSON."""
+        self.bytes_received += len(json.dumps(message, separators=(',', ':')))
+
+    def as_dict(self):
+        return {
+            "round_trips": self.round_trips,
+            "list_calls": self.list_calls,
+            "get_calls": self.get_calls,
+            "successful": self.successful,
+            "failed": self.failed,
+            "bytes_received": self.bytes_received,
+            "refetched": self.refetched,
+            "quota_units": self.quota_units,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "backoff_seconds": round(self.backoff_seconds, 2),
+        }
+
+def _mask_truncated(part, depth=0):
+    """Whether the masked part tree stops at a multipart part whose children were cut off."""
+    if depth == _MASKED_PART_DEPTH:
+        return part.get('mimeType', '').startswith('multipart/')
+    return any(_mask_truncated(child, depth + 1) for child in part.get('parts', []))
+
+_gmail_discovery_document = None
+
+def get_gmail_discovery_document():
+    """
+    Return the Gmail discovery document as JSON text, loading it once per process.
+    Callers get the text rather than a shared dict because build_from_document mutates
+    the dict it is given, so every build parses its own copy.
+    """
+    global _gmail_discovery_document
+    if _gmail_discovery_document is None:
+        _gmail_discovery_document = _load_gmail_discovery_document()
+    return _gmail_discovery_document
+
+def _load_gmail_discovery_document():
+    if GMAIL_DISCOVERY_CACHE_PATH and os.path.exists(GMAIL_DISCOVERY_CACHE_PATH):
+        logger.info(f"Loading Gmail discovery document from {GMAIL_DISCOVERY_CACHE_PATH}")
+        with open(GMAIL_DISCOVERY_CACHE_PATH, encoding='utf-8') as cache_file:
+            return cache_file.read()
+
+    content = discovery_cache.get_static_doc('gmail', 'v1')
+    if content is None:
+        logger.info("No bundled Gmail discovery document, fetching it from Google")
+        resp, content = build_http().request(GMAIL_DISCOVERY_URL)
+        if resp.status >= 400:
+            raise Exception(f"Failed to fetch Gmail discovery document: HTTP {resp.status}")
+        content = content.decode('utf-8')
+
+    if GMAIL_DISCOVERY_CACHE_PATH:
+        try:
+            with open(GMAIL_DISCOVERY_CACHE_PATH, 'w', encoding='utf-8') as cache_file:
+                cache_file.write(content)
+            logger.info(f"Cached Gmail discovery document at {GMAIL_DISCOVERY_CACHE_PATH}")
+        except OSError as e:
+            logger.warning(f"Could not write Gmail discovery cache {GMAIL_DISCOVERY_CACHE_PATH}: {str(e)}")
+    return content
+
+def gmail_service_for_credentials(creds):
+    """
+    Bind credentials to a Gmail service built from the cached discovery document.
+    Only the JSON parse is repeated per build; the document is never read or fetched again.
+    """
+    return build_from_document(get_gmail_discovery_document(), credentials=creds)
+
 def build_gmail_service(access_token: str, refresh_token: str = None, user_id: str = None):
     """
     Build Gmail service with proper error handling and logging.
@@ -32,8 +314,8 @@ def build_gmail_service(access_token: str, refresh_token: str = None, user_id: s
             client_secret=os.getenv("GOOGLE_CLIENT_SECRET") if refresh_token else None
         )
         
-        # Build the service
-        service = build('gmail', 'v1', credentials=creds)
+        # Build the service from the process-wide discovery document
+        service = gmail_service_for_credentials(creds)
         logger.info("Gmail service built successfully")
         return service, creds
         
@@ -48,217 +330,528 @@ def build_gmail_service_simple(access_token: str):
     service, _ = build_gmail_service(access_token)
     return service
 
-async def fetch_emails(service, user_id='me', max_results=4500):
+async def fetch_emails(service, user_id='me', max_results=4500, fetch_mode=None, stats=None,
+                       concurrency=None, quota_bucket=None, payload_mode=None):
     """
     Fetch emails with comprehensive logging and error handling for each step.
+
+    fetch_mode selects how message details are downloaded ("batch", "concurrent" or
+    "serial", defaults to GMAIL_FETCH_MODE). concurrency bounds the HTTP calls in flight
+    and quota_bucket paces them (defaults to the user's shared GmailQuotaBucket).
+    payload_mode is passed to fetch_emails_by_id. Pass a GmailFetchStats to collect API
+    counters and bytes received. Collects the whole mailbox in memory; use iter_email_chunks to stream it instead.
+    """
+    emails = []
+    async for chunk in iter_email_chunks(
+        service, user_id=user_id, max_results=max_results, fetch_mode=fetch_mode,
+        stats=stats, concurrency=concurrency, quota_bucket=quota_bucket, payload_mode=payload_mode
+    ):
+        emails.extend(chunk)
+    return emails
+
+async def iter_email_chunks(service, user_id='me', max_results=4500, chunk_size=None, fetch_mode=None,
+                            stats=None, concurrency=None, quota_bucket=None, payload_mode=None,
+                            resume_from=None, cursor=None, listed_ids=None):
+    """
+    Async generator over the mailbox: yields lists of parsed emails (at most chunk_size each,
+    default GMAIL_STREAM_CHUNK_SIZE) as soon as they are downloaded, so callers can process
+    one chunk while the next page is listed and fetched.
+
+    resume_from continues an interrupted listing: a dict with the "page_token" and
+    "listed_count" of the page to start from and the "processed_ids" to leave out.
+    If a cursor dict is passed, it holds the "page_token" and "listed_count" of the page
+    the last yielded chunk came from, which is where a resume has to start.
+    If a listed_ids set is passed, every listed message id is added to it, including
+    messages that are skipped or fail to download.
     """
-    logger.info(f"Starting email fetch for user_id: {user_id}, max_results: {max_results}")
+    fetch_mode = fetch_mode or GMAIL_FETCH_MODE
+    chunk_size = chunk_size or GMAIL_STREAM_CHUNK_SIZE
+    if stats is None:
+        stats = GmailFetchStats()
+    if quota_bucket is None:
+        quota_bucket = get_quota_bucket(user_id)
+    logger.info(f"Starting email fetch for user_id: {user_id}, max_results: {max_results}, fetch_mode: {fetch_mode}")
     
     # Calculate the date 15 days ago for the query
     # Note: Gmail API's 'newer_than:15d' is simpler and often preferred.
     # query_string = 'newer_than:15d'
 
     # Using newer_than:15d for simplicity with Gmail API
-    query_filter = 'newer_than:120d'
+    query_filter = 'newer_than:120d -in:drafts'
     logger.info(f"Using query filter: {query_filter}")
     
-    all_messages = []
-    page_token = None
+    resume_from = resume_from or {}
+    listed_count = resume_from.get('listed_count', 0)
+    page_token = resume_from.get('page_token')
+    skip_ids = set(resume_from.get('processed_ids', []))
     page_count = 0
+    if page_token or skip_ids:
+        logger.info(f"Resuming listing after {listed_count} messages, skipping {len(skip_ids)} already processed")
     
     try:
-        while True:
+        while listed_count < max_results:
             page_count += 1
             logger.info(f"Fetching page {page_count} of messages...")
             
             try:
-                # Wrap the blocking .execute() call in run_in_threadpool
-                results = await run_in_threadpool(
+                stats.list_calls += 1
+                results = await _execute_gmail_request(
                     service.users().messages().list(
                         userId=user_id, 
                         maxResults=500,  # Request 500 per page (API maximum)
                         q=query_filter,
                         pageToken=page_token
-                    ).execute
+                    ),
+                    "messages.list", stats, quota_bucket, f"Gmail list page {page_count}"
                 )
-                
-                messages_on_page = results.get('messages', [])
-                logger.info(f"Page {page_count}: Retrieved {len(messages_on_page)} messages")
-                all_messages.extend(messages_on_page)
-                
-                page_token = results.get('nextPageToken')
-                logger.info(f"Page {page_count}: Next page token: {'Available' if page_token else 'None'}")
-                
-                # Stop if no more pages or if we have enough messages
-                if not page_token or len(all_messages) >= max_results:
-                    logger.info(f"Stopping pagination. Total messages collected: {len(all_messages)}")
-                    break
-                    
             except HttpError as e:
                 logger.error(f"Gmail API HttpError on page {page_count}: {str(e)}", exc_info=True)
                 if e.resp.status == 401:
                     raise Exception(f"Authentication failed: {str(e)}")
+                elif _is_rate_limit_error(e):
+                    # Stopping here would silently store a partial mailbox
+                    raise Exception(f"Rate limit persisted after {GMAIL_RETRY_CONFIG.max_attempts} attempts: {str(e)}")
                 elif e.resp.status == 403:
                     raise Exception(f"Permission denied: {str(e)}")
-                elif e.resp.status == 429:
-                    logger.warning(f"Rate limit hit on page {page_count}, continuing with available messages")
-                    break
                 else:
                     raise Exception(f"Gmail API error: {str(e)}")
             except Exception as e:
                 logger.error(f"Unexpected error on page {page_count}: {str(e)}", exc_info=True)
                 raise Exception(f"Failed to fetch message list: {str(e)}")
                 
-        # If we fetched more than max_results due to page size, trim the list
-        if len(all_messages) > max_results:
-            logger.info(f"Trimming messages from {len(all_messages)} to {max_results}")
-            all_messages = all_messages[:max_results]
-
-        if not all_messages:
-            logger.warning(f"No emails found matching criteria: {query_filter}")
-            return []
-        
-        logger.info(f"Total messages to process: {len(all_messages)}")
-        emails = []
-        successful_emails = 0
-        failed_emails = 0
-        
-        # Process only the messages up to max_results
-        for index, msg_summary in enumerate(all_messages):
-            email_id = msg_summary.get('id', 'unknown')
-            logger.info(f"Processing email {index + 1}/{len(all_messages)} - ID: {email_id}")
+            messages_on_page = results.get('messages', [])
+            logger.info(f"Page {page_count}: Retrieved {len(messages_on_page)} messages")
             
-            try:
-                # Wrap the blocking .execute() call in run_in_threadpool
-                message = await run_in_threadpool(
-                    service.users().messages().get(userId=user_id, id=email_id, format='full').execute
+            # If the page takes us past max_results, trim it
+            if listed_count + len(messages_on_page) > max_results:
+                logger.info(f"Trimming page {page_count} from {len(messages_on_page)} to {max_results - listed_count} messages")
+                messages_on_page = messages_on_page[:max_results - listed_count]
+            if cursor is not None:
+                cursor['page_token'] = page_token
+                cursor['listed_count'] = listed_count
+            listed_count += len(messages_on_page)
+            
+            page_token = results.get('nextPageToken')
+            logger.info(f"Page {page_count}: Next page token: {'Available' if page_token else 'None'}")
+            
+            message_ids = [msg_summary.get('id', 'unknown') for msg_summary in messages_on_page]
+            if listed_ids is not None:
+                listed_ids.update(message_ids)
+            if skip_ids:
+                message_ids = [email_id for email_id in message_ids if email_id not in skip_ids]
+            for chunk_start in range(0, len(message_ids), chunk_size):
+                chunk_ids = message_ids[chunk_start:chunk_start + chunk_size]
+                emails = await fetch_emails_by_id(
+                    service, user_id, chunk_ids, fetch_mode=fetch_mode, stats=stats,
+                    concurrency=concurrency, quota_bucket=quota_bucket, payload_mode=payload_mode
                 )
-                logger.debug(f"Successfully retrieved message details for email ID: {email_id}")
-                
-                # Extract email data with error handling
-                try:
-                    payload = message.get('payload', {})
-                    headers = payload.get('headers', [])
-                    
-                    # Extract subject
-                    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-                    logger.debug(f"Email ID {email_id}: Subject = '{subject}'")
-                    
-                    # Extract snippet
-                    snippet = message.get('snippet', '')
-                    logger.debug(f"Email ID {email_id}: Snippet length = {len(snippet)}")
-                    
-                    # Extract body with detailed logging
-                    body = ""
-                    body_extracted = False
-                    
-                    if 'parts' in payload:
-                        logger.debug(f"Email ID {email_id}: Processing multipart message with {len(payload['parts'])} parts")
-                        for part_index, part in enumerate(payload['parts']):
-                            part_mime_type = part.get('mimeType', 'unknown')
-                            logger.debug(f"Email ID {email_id}: Part {part_index + 1} - MIME type: {part_mime_type}")
-                            
-                            if part_mime_type == 'text/plain':
-                                try:
-                                    if part.get('body', {}).get('data'):
-                                        body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                                        logger.debug(f"Email ID {email_id}: Extracted plain text body (length: {len(body)})")
-                                        body_extracted = True
-                                        break
-                                except Exception as decode_error:
-                                    logger.warning(f"Email ID {email_id}: Failed to decode plain text part: {str(decode_error)}")
-                                    
-                            elif part_mime_type == 'text/html':
-                                try:
-                                    if part.get('body', {}).get('data'):
-                                        raw_html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                                        body = clean_html(raw_html)
-                                        logger.debug(f"Email ID {email_id}: Extracted HTML body (length: {len(body)})")
-                                        body_extracted = True
-                                        break
-                                except Exception as decode_error:
-                                    logger.warning(f"Email ID {email_id}: Failed to decode HTML part: {str(decode_error)}")
-                    else:
-                        logger.debug(f"Email ID {email_id}: Processing single-part message")
-                        if payload.get('body') and payload['body'].get('data'):
-                            try:
-                                body_data = payload['body'].get('data')
-                                if body_data:
-                                    body = base64.urlsafe_b64decode(body_data).decode('utf-8')
-                                    logger.debug(f"Email ID {email_id}: Extracted single-part body (length: {len(body)})")
-                                    body_extracted = True
-                                else:
-                                    logger.warning(f"Email ID {email_id}: Body data is empty")
-                                    body = ""
-                            except Exception as decode_error:
-                                logger.warning(f"Email ID {email_id}: Failed to decode single-part body: {str(decode_error)}")
-                                body = ""
-                        else:
-                            logger.warning(f"Email ID {email_id}: No body data found")
-                            body = ""
-                    
-                    if not body_extracted and not body:
-                        logger.warning(f"Email ID {email_id}: No body content extracted, using snippet as fallback")
-                        body = snippet
-                    
-                    # Create email object
-                    email_data = {
-                        "id": email_id,
-                        "subject": subject,
-                        "snippet": snippet,
-                        "body": body,
-                    }
-                    
-                    emails.append(email_data)
-                    successful_emails += 1
-                    logger.info(f"Email {index + 1}/{len(all_messages)} processed successfully - ID: {email_id}")
-                    
-                except Exception as email_processing_error:
-                    failed_emails += 1
-                    logger.error(f"Email ID {email_id}: Failed to process email data: {str(email_processing_error)}", exc_info=True)
-                    continue
-                    
-            except HttpError as e:
-                failed_emails += 1
-                logger.error(f"Gmail API HttpError for email ID {email_id}: {str(e)}", exc_info=True)
-                if e.resp.status == 401:
-                    raise Exception(f"Authentication failed while fetching email {email_id}: {str(e)}")
-                elif e.resp.status == 403:
-                    logger.error(f"Permission denied for email ID {email_id}: {str(e)}")
-                elif e.resp.status == 404:
-                    logger.warning(f"Email ID {email_id} not found (possibly deleted)")
-                elif e.resp.status == 429:
-                    logger.warning(f"Rate limit hit while fetching email ID {email_id}")
-                else:
-                    logger.error(f"Gmail API error for email ID {email_id}: {str(e)}")
-                continue
-                
-            except Exception as e:
-                failed_emails += 1
-                logger.error(f"Unexpected error processing email ID {email_id}: {str(e)}", exc_info=True)
-                continue
+                if emails:
+                    yield emails
             
-            # Stop fetching details if we've reached max_results
-            if len(emails) >= max_results:
-                logger.info(f"Reached max_results limit ({max_results}), stopping email processing")
+            # Stop if no more pages or if we have enough messages
+            if not page_token:
                 break
-                
-        logger.info(f"Email fetch completed. Successful: {successful_emails}, Failed: {failed_emails}, Total: {len(emails)}")
-        return emails
+        
+        logger.info(f"Stopping pagination. Total messages collected: {listed_count}")
+        if not listed_count:
+            logger.warning(f"No emails found matching criteria: {query_filter}")
         
     except Exception as e:
         logger.error(f"Fatal error during email fetch: {str(e)}", exc_info=True)
         raise Exception(f"Email fetch failed: {str(e)}")
 
-def clean_html(raw_html):
+async def fetch_emails_by_id(service, user_id, message_ids, max_results=None, fetch_mode=None, stats=None,
+                             concurrency=None, quota_bucket=None, payload_mode=None):
+    """
+    Download and parse the given message ids in order, using the same fetch modes and
+    per-message error handling as fetch_emails.
+
+    payload_mode controls what each messages.get returns (defaults to GMAIL_PAYLOAD_MODE):
+    "full" is the complete MIME tree, "masked" applies a fields mask keeping only what we
+    parse. Masked messages nested deeper than the mask reaches are fetched again in full.
+    """
+    fetch_mode = fetch_mode or GMAIL_FETCH_MODE
+    payload_mode = payload_mode or GMAIL_PAYLOAD_MODE
+    concurrency = concurrency or GMAIL_FETCH_CONCURRENCY
+    max_results = max_results or len(message_ids)
+    if stats is None:
+        stats = GmailFetchStats()
+    if quota_bucket is None:
+        quota_bucket = get_quota_bucket(user_id)
+    if not message_ids:
+        return []
+
+    async def _fetch(ids, request_kwargs):
+        if fetch_mode == "batch":
+            return await _fetch_messages_batched(service, user_id, ids, request_kwargs, stats, concurrency, quota_bucket)
+        elif fetch_mode == "concurrent":
+            return await _fetch_messages_concurrent(service, user_id, ids, request_kwargs, stats, concurrency, quota_bucket)
+        return await _fetch_messages_serial(service, user_id, ids, request_kwargs, stats, quota_bucket)
+
+    results = await _fetch(message_ids, GMAIL_REQUEST_KWARGS[payload_mode])
+    if payload_mode == "masked":
+        truncated = [
+            index for index, (message, _) in enumerate(results)
+            if message is not None and _mask_truncated(message.get('payload', {}))
+        ]
+        if truncated:
+            logger.info(f"Fetching {len(truncated)} deeply nested messages again without the fields mask")
+            for message, _ in (results[index] for index in truncated):
+                stats.record_payload(message)
+            refetched = await _fetch([message_ids[index] for index in truncated], GMAIL_REQUEST_KWARGS["full"])
+            for index, result in zip(truncated, refetched):
+                results[index] = result
+            stats.refetched += len(truncated)
+
+    for message, _ in results:
+        if message is not None:
+            stats.record_payload(message)
+
+    emails, successful_emails, failed_emails = _collect_message_results(message_ids, results, max_results)
+    stats.successful += successful_emails
+    stats.failed += failed_emails
+    logger.info(f"Email fetch completed. Successful: {successful_emails}, Failed: {failed_emails}, Total: {len(emails)}")
+    return emails
+
+async def get_mailbox_history_id(service, user_id='me', quota_bucket=None, stats=None):
+    """
+    Return the mailbox's current historyId (users.getProfile).
+    Read it before a full sync so changes made while the sync runs are picked up next time.
+    """
+    if stats is None:
+        stats = GmailFetchStats()
+    if quota_bucket is None:
+        quota_bucket = get_quota_bucket(user_id)
+    profile = await _execute_gmail_request(
+        service.users().getProfile(userId=user_id), "getProfile", stats, quota_bucket, "Gmail getProfile"
+    )
+    history_id = profile.get('historyId')
+    logger.info(f"Mailbox historyId for user_id {user_id}: {history_id}")
+    return history_id
+
+async def fetch_history_changes(service, user_id, start_history_id, stats=None, quota_bucket=None):
+    """
+    List message additions and deletions since start_history_id via users.history.list.
+
+    Returns {"added_ids": [...], "deleted_ids": [...], "history_id": latest_history_id}.
+    A message added and then deleted inside the window only shows up in deleted_ids.
+    Messages in spam, trash or drafts (GMAIL_SYNC_EXCLUDED_LABELS) count as deleted, so
+    moving a message to trash removes it and taking it out again fetches it back.
+    Raises HistoryExpiredError when Gmail no longer has history that far back (HTTP 404),
+    in which case the caller has to fall back to a full sync.
+    """
+    if stats is None:
+        stats = GmailFetchStats()
+    if quota_bucket is None:
+        quota_bucket = get_quota_bucket(user_id)
+    logger.info(f"Fetching mailbox history for user_id: {user_id} since historyId {start_history_id}")
+
+    added_ids = {}
+    deleted_ids = {}
+    latest_history_id = start_history_id
+    page_token = None
+    page_count = 0
+
+    while True:
+        page_count += 1
+        try:
+            stats.list_calls += 1
+            results = await _execute_gmail_request(
+                service.users().history().list(
+                    userId=user_id,
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                    maxResults=500,
+                    pageToken=page_token
+                ),
+                "history.list", stats, quota_bucket, f"Gmail history page {page_count}"
+            )
+        except HttpError as e:
+            if e.resp.status == 404:
+                logger.warning(f"History id {start_history_id} expired for user_id {user_id}, full sync required")
+                raise HistoryExpiredError(f"History id {start_history_id} is no longer available")
+            logger.error(f"Gmail API HttpError on history page {page_count}: {str(e)}", exc_info=True)
+            if e.resp.status == 401:
+                raise Exception(f"Authentication failed: {str(e)}")
+            raise Exception(f"Gmail history API error: {str(e)}")
+
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                _record_history_message(added.get('message', {}), added_ids, deleted_ids)
+            for relabelled in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                # Other label changes (read, starred, ...) do not change what we store
+                if GMAIL_SYNC_EXCLUDED_LABELS.intersection(relabelled.get('labelIds', [])):
+                    _record_history_message(relabelled.get('message', {}), added_ids, deleted_ids)
+            for deleted in record.get('messagesDeleted', []):
+                message_id = deleted.get('message', {}).get('id')
+                if message_id:
+                    added_ids.pop(message_id, None)
+                    deleted_ids[message_id] = True
+
+        latest_history_id = results.get('historyId', latest_history_id)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    logger.info(f"History for user_id {user_id}: {len(added_ids)} added, {len(deleted_ids)} deleted across {page_count} page(s)")
+    return {
+        "added_ids": list(added_ids),
+        "deleted_ids": list(deleted_ids),
+        "history_id": latest_history_id,
+    }
+
+def _record_history_message(message, added_ids, deleted_ids):
+    """File a history message under added or deleted by the labels it has after the change."""
+    message_id = message.get('id')
+    if not message_id:
+        return
+    if GMAIL_SYNC_EXCLUDED_LABELS.intersection(message.get('labelIds', [])):
+        added_ids.pop(message_id, None)
+        deleted_ids[message_id] = True
+    else:
+        deleted_ids.pop(message_id, None)
+        added_ids[message_id] = True
+
+def parse_gmail_message(message, email_id):
+    """
+    Turn a messages.get(format='full') response into the email dict we store.
+    """
+    payload = message.get('payload', {})
+    headers = payload.get('headers', [])
+    
+    # Extract subject
+    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+    logger.debug(f"Email ID {email_id}: Subject = '{subject}'")
+    
+    # Extract snippet
+    snippet = message.get('snippet', '')
+    logger.debug(f"Email ID {email_id}: Snippet length = {len(snippet)}")
+    
+    # Extract body: first text/plain part anywhere in the tree, else the first text/html part
+    body, body_mime_type = extract_body(payload, max_bytes=GMAIL_MAX_BODY_BYTES)
+    if body_mime_type == 'text/html':
+        body = clean_html(body, max_chars=GMAIL_MAX_HTML_TEXT_CHARS)
+    if body_mime_type:
+        logger.debug(f"Email ID {email_id}: Extracted {body_mime_type} body (length: {len(body)})")
+    else:
+        logger.warning(f"Email ID {email_id}: No body data found")
+    
+    if not body:
+        logger.warning(f"Email ID {email_id}: No body content extracted, using snippet as fallback")
+        body = snippet
+    
+    # Create email object
+    return {
+        "id": email_id,
+        "subject": subject,
+        "snippet": snippet,
+        "body": body,
+    }
+
+def _handle_message_http_error(e, email_id):
+    """
+    Log a per-message HttpError. 401 aborts the whole fetch, everything else skips the message.
+    """
+    logger.error(f"Gmail API HttpError for email ID {email_id}: {str(e)}", exc_info=True)
+    if e.resp.status == 401:
+        raise Exception(f"Authentication failed while fetching email {email_id}: {str(e)}")
+    elif e.resp.status == 403:
+        logger.error(f"Permission denied for email ID {email_id}: {str(e)}")
+    elif e.resp.status == 404:
+        logger.warning(f"Email ID {email_id} not found (possibly deleted)")
+    elif e.resp.status == 429:
+        logger.warning(f"Rate limit hit while fetching email ID {email_id}")
+    else:
+        logger.error(f"Gmail API error for email ID {email_id}: {str(e)}")
+
+async def _fetch_messages_serial(service, user_id, message_ids, request_kwargs, stats, quota_bucket):
+    """
+    Fetch messages one messages.get call at a time.
+    Returns a (message, error) tuple per id, in order.
+    """
+    results = [None] * len(message_ids)
+    
+    for index, email_id in enumerate(message_ids):
+        logger.info(f"Processing email {index + 1}/{len(message_ids)} - ID: {email_id}")
+        
+        try:
+            stats.get_calls += 1
+            message = await _execute_gmail_request(
+                service.users().messages().get(userId=user_id, id=email_id, **request_kwargs),
+                "messages.get", stats, quota_bucket, f"Gmail get {email_id}"
+            )
+            logger.debug(f"Successfully retrieved message details for email ID: {email_id}")
+            results[index] = (message, None)
+        except Exception as e:
+            results[index] = (None, e)
+            # An auth failure aborts the fetch; no point requesting the remaining messages
+            if isinstance(e, HttpError) and e.resp.status == 401:
+                break
+    
+    return results
+
+def _new_worker_http(service):
+    """
+    httplib2.Http objects are not thread-safe, so every concurrent worker gets its own
+    authorized transport bound to the service's credentials.
+    """
+    credentials = getattr(service._http, 'credentials', None)
+    if credentials is None:
+        return service._http
+    return AuthorizedHttp(credentials, http=build_http())
+
+async def _run_bounded(count, concurrency, handler, service):
+    """
+    Run handler(index, http) for index in range(count) with at most `concurrency` calls in flight.
+    """
+    indexes = iter(range(count))
+
+    async def _worker():
+        http = _new_worker_http(service)
+        # The shared iterator hands each index to exactly one worker
+        for index in indexes:
+            await handler(index, http)
+
+    await asyncio.gather(*(_worker() for _ in range(max(1, min(concurrency, count)))))
+
+def _collect_message_results(message_ids, results, max_results):
+    """
+    Parse (message, error) results in listing order, applying the per-message error handling.
+    Returns (emails, successful_count, failed_count).
+    """
+    emails = []
+    successful_emails = 0
+    failed_emails = 0
+
+    for index, email_id in enumerate(message_ids):
+        message, error = results[index] or (None, None)
+        if error is not None:
+            failed_emails += 1
+            if isinstance(error, HttpError):
+                _handle_message_http_error(error, email_id)
+            else:
+                logger.error(f"Unexpected error processing email ID {email_id}: {str(error)}")
+            continue
+        if message is None:
+            failed_emails += 1
+            logger.error(f"Email ID {email_id}: No response returned")
+            continue
+        
+        try:
+            emails.append(parse_gmail_message(message, email_id))
+            successful_emails += 1
+            logger.info(f"Email {index + 1}/{len(message_ids)} processed successfully - ID: {email_id}")
+        except Exception as email_processing_error:
+            failed_emails += 1
+            logger.error(f"Email ID {email_id}: Failed to process email data: {str(email_processing_error)}", exc_info=True)
+            continue
+        
+        if len(emails) >= max_results:
+            logger.info(f"Reached max_results limit ({max_results}), stopping email processing")
+            break
+    
+    return emails, successful_emails, failed_emails
+
+async def _fetch_messages_concurrent(service, user_id, message_ids, request_kwargs, stats, concurrency, quota_bucket):
+    """
+    Fetch messages with up to `concurrency` messages.get calls in flight, paced by the
+    user's quota bucket. Returns a (message, error) tuple per id, in order.
+    """
+    results = [None] * len(message_ids)
+
+    async def _fetch_one(index, http):
+        email_id = message_ids[index]
+        stats.get_calls += 1
+        request = service.users().messages().get(userId=user_id, id=email_id, **request_kwargs)
+        try:
+            results[index] = (await _execute_gmail_request(
+                request, "messages.get", stats, quota_bucket, f"Gmail get {email_id}", http=http
+            ), None)
+        except Exception as e:
+            results[index] = (None, e)
+
+    logger.info(f"Fetching {len(message_ids)} messages with concurrency {concurrency}")
+    await _run_bounded(len(message_ids), concurrency, _fetch_one, service)
+    return results
+
+def _execute_message_batch(service, user_id, batch_ids, request_kwargs, http=None):
+    """
+    Send one batch HTTP call with a messages.get sub-request per id.
+    Blocking; returns {email_id: (message, HttpError or None)}.
+    """
+    responses = {}
+
+    def _collect(request_id, response, exception):
+        responses[request_id] = (response, exception)
+
+    batch = service.new_batch_http_request(callback=_collect)
+    for email_id in batch_ids:
+        batch.add(
+            service.users().messages().get(userId=user_id, id=email_id, **request_kwargs),
+            request_id=email_id
+        )
+    batch.execute(http=http)
+    return responses
+
+async def _fetch_messages_batched(service, user_id, message_ids, request_kwargs, stats, concurrency, quota_bucket):
+    """
+    Fetch messages through the Gmail batch endpoint, GMAIL_BATCH_SIZE messages per HTTP call,
+    with up to `concurrency` batches in flight. Every sub-response is kept separately so it
+    gets the same per-message error handling as the serial path; sub-requests that fail
+    with a retryable error are sent again in a smaller batch under the retry policy.
+    Returns a (message, error) tuple per id, in order.
+    """
+    # Batch request ids must be unique, so duplicate message ids are fetched once
+    # and reused; the result keeps the listing order either way.
+    unique_ids = list(dict.fromkeys(message_ids))
+    total_batches = (len(unique_ids) + GMAIL_BATCH_SIZE - 1) // GMAIL_BATCH_SIZE
+    responses = {}
+
+    async def _fetch_batch(batch_index, http):
+        pending = unique_ids[batch_index * GMAIL_BATCH_SIZE:(batch_index + 1) * GMAIL_BATCH_SIZE]
+        logger.info(f"Fetching batch {batch_index + 1}/{total_batches} ({len(pending)} messages)")
+        stats.get_calls += len(pending)
+
+        async def _attempt():
+            nonlocal pending
+            # Gmail charges every sub-request of a batch individually
+            units = GMAIL_QUOTA_COSTS["messages.get"] * len(pending)
+            await quota_bucket.acquire(units)
+            stats.round_trips += 1
+            stats.quota_units += units
+            batch_responses = await run_in_threadpool(_execute_message_batch, service, user_id, pending, request_kwargs, http)
+            responses.update(batch_responses)
+            pending = [
+                email_id for email_id in pending
+                if _is_retryable_gmail_error(batch_responses.get(email_id, (None, None))[1])
+            ]
+            if pending:
+                raise _ThrottledBatchError([responses[email_id][1] for email_id in pending])
+
+        try:
+            await _retry_gmail_call(_attempt, stats, f"Gmail batch {batch_index + 1}/{total_batches}")
+        except _ThrottledBatchError:
+            # The last sub-response errors are already in responses
+            logger.warning(f"Batch {batch_index + 1}/{total_batches}: {len(pending)} messages still failing after retries")
+        except HttpError as e:
+            # The whole batch call failed; report it against every message still pending
+            for email_id in pending:
+                responses[email_id] = (None, e)
+        except Exception as e:
+            logger.error(f"Unexpected error executing batch {batch_index + 1}/{total_batches}: {str(e)}", exc_info=True)
+            for email_id in pending:
+                responses[email_id] = (None, e)
+
+    await _run_bounded(total_batches, concurrency, _fetch_batch, service)
+    return [responses.get(email_id) or (None, None) for email_id in message_ids]
+
+def clean_html(raw_html, max_chars=None):
     """
-    Clean HTML content with error handling and logging.
+    Convert an HTML body to plain text with error handling and logging.
+    Script, style and head content is dropped and output stops after max_chars characters.
     """
     try:
-        # Basic clean-up to remove HTML tags, decode entities
-        text = re.sub('<[^<]+?>', '', raw_html)
-        text = html.unescape(text)
-        cleaned_text = text.strip()
+        cleaned_text = html_to_text(raw_html, max_chars=max_chars)
         logger.debug(f"HTML cleaning: Input length {len(raw_html)} -> Output length {len(cleaned_text)}")
         return cleaned_text
     except Exception as e:
@@ -0,0 +1,222 @@
+import html
+import re
+
+# Elements whose content is never text: everything up to the matching end tag is dropped
+SKIPPED_ELEMENTS = ('script', 'style', 'head')
+# Elements that start a new line in the output
+BLOCK_ELEMENTS = (
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'footer',
+    'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol',
+    'p', 'pre', 'section', 'table', 'tbody', 'tfoot', 'thead', 'tr', 'ul',
+)
+# Table cells are separated by a space rather than a line
+CELL_ELEMENTS = ('td', 'th')
+
+# What each tag is replaced with; tags not listed here are dropped
+_TAG_SEPARATORS = {**{name: '\n' for name in BLOCK_ELEMENTS}, **{name: ' ' for name in CELL_ELEMENTS}}
+
+# Constructs whose content is dropped; these are the only places the scanner stops in Python
+_SKIPPED_START = re.compile(rf'<(?:!--|({"|".join(SKIPPED_ELEMENTS)})(?![a-zA-Z0-9:-]))', re.IGNORECASE)
+_SKIPPED_END = {name: re.compile(f'</{name}', re.IGNORECASE) for name in SKIPPED_ELEMENTS}
+# Any other tag, end tag or declaration, which runs to the next '>'. A '<' that does not
+# start one of these, or that is followed by another '<' first, is text. The tag name is
+# captured in a lookahead, which never backtracks, so an unterminated tag costs one pass.
+_TAG_START = re.compile(r'<(?:/?[a-zA-Z]|[!?])')
+_ANY_TAG = re.compile(r'<(?:/?(?=([a-zA-Z][^\s/<>]*))|[!?])[^<>]*>')
+# Whitespace in the source is only a space; line breaks come from block tags
+_SOURCE_WHITESPACE = str.maketrans('\n\r\t\f\v', '     ')
+# Longest unterminated tag held back between feeds; longer ones are dropped up to their '>'
+_MAX_TAG_HOLDBACK = 4096
+# Longest character reference held back between feeds
+_MAX_ENTITY_HOLDBACK = 40
+
+_TEXT, _TAG, _COMMENT, _SKIP = range(4)
+
+
+class HTMLToText:
+    """
+    Streaming HTML to plain text converter.
+
+    Feed the document in chunks of any size and call close() for the text. Only
+    comments and script/style/head elements are handled token by token; ordinary tags
+    and entities are converted a whole chunk at a time by one regex pass that never
+    backtracks past a '<'. Block elements become line breaks, table cells spaces and
+    other tags nothing; runs of whitespace collapse to one space or line break. At most
+    one unterminated tag is carried between chunks, so the cost is linear in the input
+    even for malformed markup. Conversion stops once max_chars of output have been produced.
+    """
+
+    def __init__(self, max_chars=None):
+        self.max_chars = max_chars
+        self.done = False
+        self._out = []
+        self._length = 0
+        self._separator = ''
+        self._state = _TEXT
+        self._skip_name = None
+        self._tail = ''
+
+    def feed(self, chunk):
+        """Consume the next chunk. Returns False once the output limit has been reached."""
+        if not self.done:
+            self._tail = self._scan(self._tail + chunk, final=False)
+        return not self.done
+
+    def close(self):
+        """Flush whatever is buffered and return the text."""
+        if not self.done:
+            self._scan(self._tail, final=True)
+        self._tail = ''
+        text = ''.join(self._out)
+        if self.max_chars is not None:
+            text = text[:self.max_chars]
+        return text
+
+    def _scan(self, buf, final):
+        """Convert buf and return the unconsumed tail that must be prefixed to the next chunk."""
+        pieces = []
+        pos = 0
+        end = len(buf)
+        tail = ''
+        while pos < end:
+            if self._state == _TEXT:
+                match = _SKIPPED_START.search(buf, pos)
+                # A name ending the buffer may continue in the next chunk ('<scripts')
+                if match is not None and (final or match.end() < end):
+                    pieces.append(_strip_markup(buf[pos:match.start()]))
+                    pos = match.end()
+                    if match.group(1):
+                        self._skip_name = match.group(1).lower()
+                        self._state = _TAG
+                    else:
+                        self._state = _COMMENT
+                    continue
+                text, tail = self._split_unterminated(buf[pos:], final)
+                pieces.append(text)
+                pos = end
+            elif self._state == _TAG:
+                gt = buf.find('>', pos)
+                if gt == -1:
+                    break
+                pos = gt + 1
+                self._state = _TEXT if self._skip_name is None else _SKIP
+            elif self._state == _COMMENT:
+                close = buf.find('-->', pos)
+                if close == -1:
+                    tail = '' if final else buf[max(pos, end - 2):]
+                    break
+                pos = close + 3
+                self._state = _TEXT
+            else:
+                match = _SKIPPED_END[self._skip_name].search(buf, pos)
+                if match is None:
+                    tail = '' if final else buf[max(pos, end - len(self._skip_name) - 1):]
+                    break
+                self._skip_name = None
+                self._state = _TAG
+                pos = match.end()
+        self._flush(''.join(pieces))
+        return tail
+
+    def _split_unterminated(self, text, final):
+        """
+        Convert text up to an unterminated tag or character reference at its end.
+
+        The remainder is returned to be retried with the next chunk. A tag still open
+        after _MAX_TAG_HOLDBACK characters is dropped up to its closing '>', leaving
+        the separator its name calls for.
+        """
+        open_tag = _open_tag(text)
+        if open_tag != -1:
+            if not final and len(text) - open_tag < _MAX_TAG_HOLDBACK:
+                return _strip_markup(text[:open_tag]), text[open_tag:]
+            name = _ANY_TAG.match(text[open_tag:open_tag + 80] + '>')
+            if not final:
+                self._state = _TAG
+            return _strip_markup(text[:open_tag]) + _tag_separator(name), ''
+        if final:
+            return _strip_markup(text), ''
+        cut = len(text)
+        if text.endswith('</'):
+            cut -= 2
+        elif text.endswith('<'):
+            cut -= 1
+        amp = text.rfind('&', max(text.rfind('>') + 1, cut - _MAX_ENTITY_HOLDBACK), cut)
+        if amp != -1 and ';' not in text[amp:cut]:
+            cut = amp
+        return _strip_markup(text[:cut]), text[cut:]
+
+    def _flush(self, raw):
+        """Collapse whitespace in one chunk's converted text and append it to the output."""
+        leading = ' ' if raw[:1].isspace() else ''
+        trailing = ' ' if raw[-1:].isspace() else ''
+        lines = [' '.join(line.split()) for line in raw.split('\n')]
+        if len(lines) > 1:
+            if not lines[0]:
+                leading = '\n'
+            if not lines[-1]:
+                trailing = '\n'
+        text = '\n'.join(filter(None, lines))
+        if not text:
+            self._separator = _stronger_separator(self._separator, leading + trailing)
+            return
+        separator = _stronger_separator(self._separator, leading)
+        if self._length and separator:
+            self._write(separator)
+        self._write(text)
+        self._separator = trailing
+
+    def _write(self, text):
+        self._out.append(text)
+        self._length += len(text)
+        if self.max_chars is not None and self._length >= self.max_chars:
+            self.done = True
+
+
+def _stronger_separator(current, whitespace):
+    """A line break between two pieces of output wins over a space, which wins over nothing."""
+    if '\n' in current or '\n' in whitespace:
+        return '\n'
+    return ' ' if current or whitespace else ''
+
+
+def _tag_separator(match):
+    """The separator a matched tag leaves in the text: a line break, a space or nothing."""
+    if match is None or match.group(1) is None:
+        return ''
+    return _TAG_SEPARATORS.get(match.group(1).lower(), '')
+
+
+def _strip_markup(text):
+    """
+    Replace the tags in a run of text with breaks, spaces or nothing and unescape entities.
+    Each run between dropped constructs is converted on its own so a stray '<' before a
+    comment cannot pair up with text after it.
+    """
+    text = text.translate(_SOURCE_WHITESPACE)
+    if '<' in text and '>' in text:
+        # split() leaves the captured tag names at the odd indexes; replacing them in one
+        # comprehension is much cheaper than a sub() callback per tag
+        parts = _ANY_TAG.split(text)
+        parts[1::2] = [_TAG_SEPARATORS.get(name.lower(), '') if name else '' for name in parts[1::2]]
+        text = ''.join(parts)
+    if '&' in text:
+        text = html.unescape(text)
+    return text
+
+
+def _open_tag(text):
+    """Index of a tag at the end of text that has not seen its '>' yet, or -1."""
+    lt = text.rfind('<')
+    if lt == -1 or '>' in text[lt:] or not _TAG_START.match(text, lt):
+        return -1
+    return lt
+
+
+def html_to_text(raw_html, max_chars=None, chunk_size=64 * 1024):
+    """Convert an HTML document to plain text, stopping after max_chars characters of output."""
+    converter = HTMLToText(max_chars=max_chars)
+    for start in range(0, len(raw_html), chunk_size):
+        if not converter.feed(raw_html[start:start + chunk_size]):
+            break
+    return converter.close()
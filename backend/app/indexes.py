@@ -0,0 +1,104 @@
+import logging
+
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.db import db
+
+logger = logging.getLogger(__name__)
+
+# Indexes every collection should have, by collection name. Queries they serve:
+#   users.user_id             find_one/update_one({"user_id": ...}) everywhere
+#   users.fetched_email       the scheduler's find({"fetched_email": False}); only pending users are indexed
+#   emails.(user_id, id)      upserts, deletes, content ledger lookups, the has_emails probe and list_emails/iter_emails paging
+#   emails.(user_id, text)    search_emails; user_id is an equality prefix, so each search only reads that user's keys
+#   sync_checkpoints.user_id  checkpoint lookups, one checkpoint per user
+#   sync_checkpoints.updated_at  reset_interrupted_syncs, checkpoints without a heartbeat
+#   sync_checkpoints.heartbeat_at  reset_interrupted_syncs
+#   mailbox_stats.user_id     app.mailbox_stats reads and updates, one document per user
+#   mem0_outbox.(user_id, email_id)  enqueue upserts, one entry per email; outbox_counts
+#   mem0_outbox.(status, available_at)  claim_uploads picking the oldest due entry
+#   mem0_outbox.(user_id, status, available_at)  claim_uploads collecting that user's due entries
+#   mem0_outbox.leased_by  claim_uploads reading back the entries stamped with its lease token
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel(
+            [("fetched_email", ASCENDING)], name="fetched_email_pending",
+            partialFilterExpression={"fetched_email": False}
+        ),
+    ],
+    "emails": [
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id_unique", unique=True),
+        # Only string fields are indexed, so bodies stored compressed (EMAIL_BODY_CODEC) are not searchable
+        IndexModel(
+            [("user_id", ASCENDING), ("subject", TEXT), ("snippet", TEXT), ("body", TEXT)],
+            name="user_id_text", weights={"subject": 10, "snippet": 5, "body": 1}
+        ),
+    ],
+    "sync_checkpoints": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+        IndexModel([("heartbeat_at", ASCENDING)], name="heartbeat_at"),
+    ],
+    "mailbox_stats": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "mem0_outbox": [
+        IndexModel([("user_id", ASCENDING), ("email_id", ASCENDING)], name="user_id_email_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)], name="status_available_at"),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("available_at", ASCENDING)],
+            name="user_id_status_available_at"
+        ),
+        IndexModel([("leased_by", ASCENDING)], name="leased_by", sparse=True),
+    ],
+}
+
+
+def _key_pattern(key):
+    # The server reports the text fields of a text index as _fts/_ftsx, whatever they are
+    pattern = []
+    for field, direction in key:
+        if direction == TEXT or field in ("_fts", "_ftsx"):
+            if ("_fts", TEXT) not in pattern:
+                pattern += [("_fts", TEXT), ("_ftsx", 1)]
+            continue
+        pattern.append((field, int(direction)))
+    return tuple(pattern)
+
+
+async def ensure_indexes():
+    """
+    Create the indexes in INDEXES that do not exist yet and log a report per collection.
+
+    create_index is a no-op for an index that already exists with the same options, so
+    this is safe to run on every startup. An index that cannot be built (duplicate keys
+    for a unique index, same keys under other options) is logged and left missing.
+    Indexes whose key pattern is not in INDEXES are reported as extra but kept.
+    Returns {collection: {"missing": [...], "extra": [...]}}.
+    """
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        for model in models:
+            name = model.document["name"]
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                logger.error(f"❌ Could not create index {collection_name}.{name}: {str(e)}")
+
+        existing = {
+            _key_pattern(info["key"]): name
+            for name, info in (await collection.index_information()).items()
+        }
+        expected = {_key_pattern(model.document["key"].items()): model.document["name"] for model in models}
+        missing = sorted(name for key, name in expected.items() if key not in existing)
+        extra = sorted(name for key, name in existing.items() if key not in expected and name != "_id_")
+        report[collection_name] = {"missing": missing, "extra": extra}
+
+        if missing:
+            logger.warning(f"⚠️ Index report for {collection_name}: missing {missing}, extra {extra}")
+        else:
+            logger.info(f"✅ Index report for {collection_name}: all {len(expected)} indexes present, extra {extra}")
+    return report
@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime
+
+from app.db import mailbox_stats_collection, emails_collection
+
+logger = logging.getLogger(__name__)
+
+# Returned for users that have never synced
+EMPTY_MAILBOX_STATS = {
+    "total_emails": 0,
+    "last_sync_status": None,
+    "last_sync_mode": None,
+    "last_sync_started_at": None,
+    "last_sync_finished_at": None,
+    "last_history_id": None,
+    "last_sync_duration_seconds": None,
+    "last_sync_stage_durations": {},
+    "last_sync_counts": {},
+    "last_error": None,
+    "failures": {"syncs": 0, "store": 0, "upload": 0},
+    "mem0_uploads": {"uploaded": 0, "failed": 0, "chars_saved": 0, "tokens_saved": 0, "truncated": 0},
+}
+
+
+async def get_mailbox_stats(user_id):
+    """The user's mailbox_stats document without _id; a single indexed read, emails are never touched."""
+    stats = await mailbox_stats_collection.find_one({"user_id": user_id}, {"_id": 0}) or {}
+    failures = {**EMPTY_MAILBOX_STATS["failures"], **stats.get("failures", {})}
+    mem0_uploads = {**EMPTY_MAILBOX_STATS["mem0_uploads"], **stats.get("mem0_uploads", {})}
+    return {**EMPTY_MAILBOX_STATS, "user_id": user_id, **stats, "failures": failures, "mem0_uploads": mem0_uploads}
+
+
+async def record_sync_started(user_id):
+    await _update(user_id, {"$set": {"last_sync_status": "running", "last_sync_started_at": datetime.now()}})
+
+
+async def record_sync_finished(user_id, result):
+    """
+    Fold a finished sync's result into the stats. A full sync recounts total_emails, since
+    the emails it kept unchanged are not in its result; an incremental one adds inserted
+    minus deleted.
+    """
+    storage = result.get("storage") or {}
+    upload = result.get("upload") or {}
+    fields = {
+        "last_sync_status": result["status"],
+        "last_sync_mode": result.get("sync_mode", "full"),
+        "last_sync_finished_at": datetime.now(),
+        "last_sync_duration_seconds": result.get("processing_time_seconds"),
+        "last_sync_stage_durations": result.get("stage_durations_seconds", {}),
+        "last_sync_counts": {"count": result.get("count", 0), "storage": storage, "upload": upload},
+        "last_error": None,
+    }
+    if result.get("history_id"):
+        fields["last_history_id"] = result["history_id"]
+    update = {
+        "$set": fields,
+        "$inc": {
+            "failures.store": storage.get("failed", 0), "failures.upload": upload.get("failed", 0),
+            **_mem0_upload_increments(upload),
+        },
+    }
+
+    if fields["last_sync_mode"] != "incremental":
+        fields["total_emails"] = await emails_collection.count_documents({"user_id": user_id})
+    else:
+        delta = storage.get("inserted", 0) - storage.get("deleted", 0)
+        if await mailbox_stats_collection.find_one({"user_id": user_id, "total_emails": {"$exists": True}}, {"_id": 1}):
+            update["$inc"]["total_emails"] = delta
+        else:
+            # Users whose last full sync predates these stats: count once, here rather than in the endpoint
+            fields["total_emails"] = await emails_collection.count_documents({"user_id": user_id})
+    await _update(user_id, update)
+
+
+async def record_sync_failed(user_id, error):
+    await _update(user_id, {
+        "$set": {"last_sync_status": "error", "last_sync_finished_at": datetime.now(), "last_error": str(error)},
+        "$inc": {"failures.syncs": 1},
+    })
+
+
+async def record_mem0_uploads(user_id, counts):
+    """Add uploads the Mem0 outbox workers made after the sync to the running mem0_uploads totals."""
+    await _update(user_id, {"$inc": _mem0_upload_increments(counts)})
+
+
+def _mem0_upload_increments(counts):
+    # Mem0 uploads and what preprocessing saved on them, whether made in a sync or by the outbox
+    return {f"mem0_uploads.{key}": counts.get(key, 0) for key in EMPTY_MAILBOX_STATS["mem0_uploads"]}
+
+
+async def _update(user_id, update):
+    # Stats are best effort; a failed write must not fail the sync it describes
+    try:
+        await mailbox_stats_collection.update_one({"user_id": user_id}, update, upsert=True)
+    except Exception as e:
+        logger.error(f"❌ Failed to update mailbox stats for user_id {user_id}: {str(e)}", exc_info=True)
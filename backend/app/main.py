@@ -29,18 +29,42 @@ if not os.getenv("FRONTEND_URL"):
     print("Set default FRONTEND_URL: http://localhost:8000")
 
 # Now proceed with other imports
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from app.auth import verify_google_token, create_jwt_token, decode_jwt_token, refresh_google_access_token, is_google_token_expired, is_user_session_expired
 from app.oauth import generate_auth_url, exchange_code_for_tokens
-from app.db import users_collection, emails_collection
-from app.gmail import build_gmail_service, build_gmail_service_simple, fetch_emails
+from app.db import users_collection, connect_mongo, close_mongo, pool_metrics
+from app.email_store import (
+    upsert_emails, delete_missing_emails, delete_emails, load_content_ledger, mark_uploaded_to_mem0, has_emails,
+    search_emails, list_emails, iter_emails
+)
+from app.indexes import ensure_indexes
+from app.mailbox_stats import get_mailbox_stats, record_sync_started, record_sync_finished, record_sync_failed
+from app.mem0_outbox import (
+    enqueue_mem0_uploads, start_outbox_workers, stop_outbox_workers, outbox_counts, MEM0_OUTBOX_ENABLED
+)
+from app.vector_index import (
+    index_emails, delete_indexed_emails, delete_missing_indexed_emails, close_client as close_vector_index,
+    RETRIEVAL_BACKEND
+)
+from app.gmail import (
+    build_gmail_service, build_gmail_service_simple, fetch_emails, fetch_emails_by_id, iter_email_chunks,
+    fetch_history_changes, get_mailbox_history_id, HistoryExpiredError, GmailFetchStats, GMAIL_INCREMENTAL_SYNC
+)
 from app.mem0_agent import upload_emails_to_mem0, query_mem0
+from app.sync_checkpoints import (
+    load_sync_checkpoint, start_sync_checkpoint, save_sync_checkpoint, clear_sync_checkpoint,
+    reset_interrupted_syncs, sync_checkpoint_heartbeat, STAGE_SYNCING, STAGE_FINALIZING
+)
 from app.models import GoogleToken, GmailFetchPayload
 from app.websocket import router as websocket_router
+import asyncio
+import json
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 from pydantic import BaseModel
@@ -56,7 +80,35 @@ logger = logging.getLogger(__name__)
 # Log environment info on module load
 log_environment_info()
 
-app = FastAPI()
+# Initialize APScheduler
+scheduler = AsyncIOScheduler()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_mongo()
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"❌ Could not ensure MongoDB indexes: {str(e)}", exc_info=True)
+    try:
+        await reset_interrupted_syncs()
+    except Exception as e:
+        logger.error(f"❌ Could not check for interrupted syncs: {str(e)}", exc_info=True)
+    # Schedule the job to run every 2 minutes
+    scheduler.add_job(check_and_fetch_new_user_emails, "interval", minutes=2, id="fetch_new_emails_job")
+    scheduler.start()
+    logger.info("APScheduler started. Job 'fetch_new_emails_job' scheduled every 2 minutes.")
+    outbox_workers = start_outbox_workers() if MEM0_OUTBOX_ENABLED else []
+    logger.info(f"Started {len(outbox_workers)} Mem0 outbox worker(s).")
+    yield
+    scheduler.shutdown()
+    logger.info("APScheduler shut down.")
+    await stop_outbox_workers(outbox_workers)
+    await close_vector_index()
+    logger.info(f"MongoDB connection pool at shutdown: {pool_metrics.as_dict()}")
+    close_mongo()
+
+app = FastAPI(lifespan=lifespan)
 
 # Define the security scheme
 security = HTTPBearer()
@@ -84,8 +136,9 @@ app.add_middleware(
 
 app.include_router(websocket_router)
 
-# Initialize APScheduler
-scheduler = AsyncIOScheduler()
+# Full syncs stream the mailbox in chunks of GMAIL_STREAM_CHUNK_SIZE emails (app.gmail); each
+# queue between pipeline stages holds at most SYNC_PIPELINE_QUEUE_SIZE chunks, which bounds memory per sync.
+SYNC_PIPELINE_QUEUE_SIZE = int(os.getenv("SYNC_PIPELINE_QUEUE_SIZE", "2"))
 
 # Define a Pydantic model for the test query request body
 class TestMem0QueryPayload(BaseModel):
@@ -390,6 +443,9 @@ async def fetch_user_emails_with_token(payload: EmailFetchRequest):
             detail=f"Failed to fetch emails: {str(e)}"
         )
 
+# Fields never sent to the client by /me; excluding them also keeps the read small
+ME_EXCLUDED_FIELDS = {"access_token": 0, "refresh_token": 0, "token_expiry": 0}
+
 @app.get("/me")
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
@@ -411,7 +467,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             )
         
         logger.info(f"Fetching user data for user_id: {user_id}")
-        user_in_db = await users_collection.find_one({"user_id": user_id})
+        user_in_db = await users_collection.find_one({"user_id": user_id}, ME_EXCLUDED_FIELDS)
         
         if not user_in_db:
             logger.warning(f"User not found in database with user_id: {user_id}")
@@ -420,8 +476,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 detail="User not found"
             )
         
-        # Ensure initial_gmailData_sync is accurate
-        has_email_data = await emails_collection.count_documents({"user_id": user_id}) > 0
+        # Ensure initial_gmailData_sync is accurate; an existence probe, not a count
+        has_email_data = await has_emails(user_id)
         current_sync_status_in_db = user_in_db.get("initial_gmailData_sync")
 
         if current_sync_status_in_db is None or current_sync_status_in_db != has_email_data:
@@ -463,6 +519,88 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail=f"An unexpected error occurred: {str(e)}"
         )
 
+def _require_user_id(credentials: HTTPAuthorizationCredentials) -> str:
+    """user_id from the bearer JWT; 401 for a bad token, 400 when it carries no user_id."""
+    user_id = decode_jwt_token(credentials.credentials).get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User ID not found in token")
+    return user_id
+
+@app.get("/mailbox/stats")
+async def get_mailbox_stats_endpoint(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Mailbox statistics for the authenticated user, maintained by the sync: email count,
+    last sync times, status and historyId, per-stage durations and failure counts, plus
+    the user's Mem0 outbox entries by status.
+    Served from the mailbox_stats and mem0_outbox collections, never from emails.
+    """
+    user_id = _require_user_id(credentials)
+    stats = await get_mailbox_stats(user_id)
+    stats["mem0_outbox"] = await outbox_counts(user_id)
+    return convert_objectid_to_str(stats)
+
+@app.get("/emails/search")
+async def search_emails_endpoint(
+    q: str = Query(..., min_length=1, max_length=512),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Keyword search over the authenticated user's stored emails, best matches first,
+    straight from the MongoDB text index (no Mem0 or LLM call). Pass next_cursor from
+    a response as cursor to get the following page.
+    """
+    user_id = _require_user_id(credentials)
+    start = time.monotonic()
+    try:
+        page = await search_emails(user_id, q, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    logger.info(f"🔎 Search for user_id {user_id} returned {len(page['results'])} hits in {(time.monotonic() - start) * 1000:.1f} ms")
+    return page
+
+@app.get("/emails")
+async def list_emails_endpoint(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None,
+    include_body: bool = False,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    The authenticated user's stored emails (id, subject, snippet and optionally body),
+    ordered by Gmail id. format=json returns one page of at most limit emails plus
+    next_cursor for the following page. format=ndjson streams every email after cursor,
+    one JSON object per line, at constant server memory, for exports.
+    """
+    user_id = _require_user_id(credentials)
+    try:
+        if response_format == "ndjson":
+            emails = iter_emails(user_id, cursor=cursor, include_body=include_body)
+        else:
+            return await list_emails(user_id, limit=limit, cursor=cursor, include_body=include_body)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def _lines():
+        count = 0
+        async for email_item in emails:
+            count += 1
+            yield json.dumps(email_item, ensure_ascii=False) + "\n"
+        logger.info(f"📤 Streamed {count} emails for user_id: {user_id}")
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics/mongo-pool")
+async def get_mongo_pool_metrics(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    MongoDB connection pool counters: connections open and checked out, checkouts,
+    failed checkouts and time spent waiting for a connection since startup.
+    Requires a user token like the data endpoints.
+    """
+    _require_user_id(credentials)
+    return pool_metrics.as_dict()
+
 def convert_objectid_to_str(data):
     """Recursively converts ObjectId instances in a dictionary or list to strings."""
     if isinstance(data, list):
@@ -541,8 +679,18 @@ async def get_valid_access_token(user_id: str):
     
     return access_token, refresh_token, user_in_db
 
-# Core email processing function - Updated with automatic token refresh
 async def _trigger_and_process_user_emails(user_id: str, access_token: str = None, max_results: int = 4500):
+    """Run a sync for the user and keep their mailbox_stats document up to date."""
+    await record_sync_started(user_id)
+    result = await _process_user_emails(user_id, access_token=access_token, max_results=max_results)
+    if result["status"] == "success":
+        await record_sync_finished(user_id, result)
+    else:
+        await record_sync_failed(user_id, result["message"])
+    return result
+
+# Core email processing function - Updated with automatic token refresh
+async def _process_user_emails(user_id: str, access_token: str = None, max_results: int = 4500):
     logger.info(f"🚀 Starting comprehensive email processing for user_id: {user_id} (max_results: {max_results})")
     
     processing_start_time = datetime.now()
@@ -585,62 +733,53 @@ async def _trigger_and_process_user_emails(user_id: str, access_token: str = Non
             logger.error(f"❌ Step 3/7: Failed to build Gmail service for user_id {user_id}: {str(service_error)}", exc_info=True)
             raise Exception(f"Gmail service initialization failed: {str(service_error)}")
         
-        # Step 4: Fetch emails from Gmail
-        logger.info(f"📧 Step 4/7: Fetching emails from Gmail for user_id: {user_id} (max: {max_results})...")
-        fetch_start_time = datetime.now()
-        try:
-            emails = await fetch_emails(service, user_id=user_id, max_results=max_results)
-            fetch_duration = (datetime.now() - fetch_start_time).total_seconds()
-            logger.info(f"✅ Step 4/7: Fetched {len(emails)} emails from Gmail for user_id: {user_id} (took {fetch_duration:.2f}s)")
-        except Exception as fetch_error:
-            logger.error(f"❌ Step 4/7: Failed to fetch emails for user_id {user_id}: {str(fetch_error)}", exc_info=True)
-            raise Exception(f"Email fetch failed: {str(fetch_error)}")
-        
-        if emails:
-            # Step 5: Store emails in MongoDB
-            logger.info(f"💾 Step 5/7: Storing {len(emails)} emails in MongoDB for user_id: {user_id}...")
-            storage_start_time = datetime.now()
-            
+        # Step 4: Fetch emails from Gmail, incrementally when we have a historyId from the last sync
+        # and no full sync was interrupted half way
+        checkpoint = await load_sync_checkpoint(user_id)
+        sync_state = await users_collection.find_one({"user_id": user_id}, {"gmail_history_id": 1})
+        start_history_id = (sync_state or {}).get("gmail_history_id")
+        if GMAIL_INCREMENTAL_SYNC and start_history_id and checkpoint is None:
             try:
-                # Add user_id to each email
-                for email_item in emails:
-                    email_item['user_id'] = user_id
-                
-                # Remove existing emails for this user to avoid duplicates before new insertion
-                logger.info(f"🗑️ Step 5/7: Removing existing emails for user_id: {user_id}")
-                delete_result = await emails_collection.delete_many({"user_id": user_id})
-                logger.info(f"🗑️ Step 5/7: Deleted {delete_result.deleted_count} existing emails for user_id: {user_id}")
-                
-                # Insert new emails
-                logger.info(f"📥 Step 5/7: Inserting {len(emails)} new emails for user_id: {user_id}")
-                insert_result = await emails_collection.insert_many(emails)
-                storage_duration = (datetime.now() - storage_start_time).total_seconds()
-                logger.info(f"✅ Step 5/7: {len(insert_result.inserted_ids)} emails stored in MongoDB for user_id: {user_id} (took {storage_duration:.2f}s)")
-                
-            except Exception as storage_error:
-                logger.error(f"❌ Step 5/7: Failed to store emails in MongoDB for user_id {user_id}: {str(storage_error)}", exc_info=True)
-                raise Exception(f"Email storage failed: {str(storage_error)}")
-            
-            # Step 6: Upload to Mem0
-            logger.info(f"🧠 Step 6/7: Uploading {len(emails)} emails to Mem0 for user_id: {user_id}...")
-            mem0_start_time = datetime.now()
-            
+                return await _incremental_sync_user_emails(user_id, service, start_history_id, processing_start_time)
+            except HistoryExpiredError:
+                logger.warning(f"⚠️ Step 4/7: historyId {start_history_id} expired for user_id: {user_id}, falling back to full sync")
+
+        fetch_stats = GmailFetchStats()
+        if checkpoint is not None:
+            logger.info(f"⏯️ Step 4/7: Resuming interrupted sync for user_id: {user_id} at stage '{checkpoint['stage']}' ({len(checkpoint['processed_ids'])} emails already processed)")
+            sync_history_id = checkpoint["history_id"]
+            await save_sync_checkpoint(user_id, stage=checkpoint["stage"])
+        else:
+            # Record where the mailbox history stands before listing, so the next sync can resume from here
             try:
-                await upload_emails_to_mem0(user_id, emails)
-                mem0_duration = (datetime.now() - mem0_start_time).total_seconds()
-                logger.info(f"✅ Step 6/7: Emails uploaded to Mem0 for user_id: {user_id} (took {mem0_duration:.2f}s)")
-            except Exception as mem0_error:
-                logger.error(f"❌ Step 6/7: Failed to upload emails to Mem0 for user_id {user_id}: {str(mem0_error)}", exc_info=True)
-                # Note: We don't raise here to allow the process to continue and mark as synced
-                logger.warning(f"⚠️ Step 6/7: Continuing despite Mem0 upload failure for user_id: {user_id}")
+                sync_history_id = await get_mailbox_history_id(service, user_id, stats=fetch_stats)
+            except Exception as history_error:
+                logger.warning(f"⚠️ Step 4/7: Could not read mailbox historyId for user_id {user_id}, next sync will be full: {str(history_error)}")
+                sync_history_id = None
+            checkpoint = await start_sync_checkpoint(user_id, sync_history_id)
 
+        # Steps 4-6: Fetch, store and upload chunk by chunk so the stages overlap
+        if checkpoint["stage"] == STAGE_FINALIZING:
+            logger.info(f"⏭️ Steps 4-6/7: All chunks were processed before the interruption for user_id: {user_id}")
+            pipeline_result = {
+                "fetched": 0, "stored": 0, "storage": {}, "upload": {}, "durations": {}, "gmail": fetch_stats.as_dict()
+            }
+        else:
+            logger.info(f"📧 Steps 4-6/7: Streaming emails from Gmail to MongoDB and Mem0 for user_id: {user_id} (max: {max_results})...")
+            async with sync_checkpoint_heartbeat(user_id):
+                pipeline_result = await _run_sync_pipeline(user_id, service, max_results, fetch_stats, checkpoint)
+            await save_sync_checkpoint(user_id, stage=STAGE_FINALIZING)
+        stored_count = pipeline_result["stored"] + len(checkpoint["processed_ids"])
+        
+        if stored_count:
             # Step 7: Update initial_gmailData_sync for the user as process completed  
             logger.info(f"🏁 Step 7/7: Updating initial_gmailData_sync to true for user_id: {user_id}")
             try:
                 await users_collection.update_one(
                     {"user_id": user_id},
-                    {"$set": {"initial_gmailData_sync": True}}
+                    _sync_completed_update(sync_history_id, fetch_stats)
                 )
+                await clear_sync_checkpoint(user_id)
                 
                 total_duration = (datetime.now() - processing_start_time).total_seconds()
                 logger.info(f"✅ Step 7/7: initial_gmailData_sync updated for user_id: {user_id}")
@@ -648,8 +787,18 @@ async def _trigger_and_process_user_emails(user_id: str, access_token: str = Non
                 
                 return {
                     "status": "success", 
-                    "message": f"Successfully fetched and processed {len(emails)} emails for user {user_id}", 
-                    "count": len(emails),
+                    "message": f"Successfully fetched and processed {stored_count} emails for user {user_id}", 
+                    "count": stored_count,
+                    "sync_mode": "full",
+                    "history_id": sync_history_id,
+                    "storage": pipeline_result["storage"],
+                    "upload": pipeline_result["upload"],
+                    "skipped": {
+                        "store": pipeline_result["storage"].get("skipped", 0),
+                        "upload": pipeline_result["upload"].get("skipped", 0),
+                    },
+                    "stage_durations_seconds": pipeline_result["durations"],
+                    "gmail_stats": pipeline_result["gmail"],
                     "processing_time_seconds": total_duration
                 }
                 
@@ -661,8 +810,8 @@ async def _trigger_and_process_user_emails(user_id: str, access_token: str = Non
                 
                 return {
                     "status": "success", 
-                    "message": f"Successfully fetched and processed {len(emails)} emails for user {user_id} (final status update failed)", 
-                    "count": len(emails),
+                    "message": f"Successfully fetched and processed {stored_count} emails for user {user_id} (final status update failed)", 
+                    "count": stored_count,
                     "processing_time_seconds": total_duration
                 }
         else:
@@ -673,8 +822,9 @@ async def _trigger_and_process_user_emails(user_id: str, access_token: str = Non
             try:
                 await users_collection.update_one(
                     {"user_id": user_id},
-                    {"$set": {"initial_gmailData_sync": True}} # Mark as synced even if no emails
+                    _sync_completed_update(sync_history_id, fetch_stats) # Mark as synced even if no emails
                 )
+                await clear_sync_checkpoint(user_id)
                 
                 total_duration = (datetime.now() - processing_start_time).total_seconds()
                 logger.info(f"✅ initial_gmailData_sync updated (no emails found) for user_id: {user_id} (total time: {total_duration:.2f}s)")
@@ -701,7 +851,7 @@ async def _trigger_and_process_user_emails(user_id: str, access_token: str = Non
         total_duration = (datetime.now() - processing_start_time).total_seconds()
         logger.error(f"💥 Critical error during email processing for user_id {user_id} (after {total_duration:.2f}s): {str(e)}", exc_info=True)
         
-        # Reset fetched_email to false so the user can retry
+        # Reset fetched_email to false so the user can retry; the sync checkpoint is kept so the retry resumes
         try:
             await users_collection.update_one(
                 {"user_id": user_id},
@@ -717,9 +867,289 @@ async def _trigger_and_process_user_emails(user_id: str, access_token: str = Non
             "processing_time_seconds": total_duration
         }
 
+# Counters of _upload_and_record, for syncs that upload nothing
+EMPTY_UPLOAD_COUNTS = {
+    "enqueued": 0, "uploaded": 0, "skipped": 0, "failed": 0, "requests": 0, "requests_saved": 0, "seconds_saved": 0.0,
+    "chars_saved": 0, "tokens_saved": 0, "truncated": 0, "indexed": 0,
+}
+
+async def _upload_and_record(user_id: str, emails: list, ledger: dict):
+    """
+    Hand emails to Mem0, skipping those already there with the same content hash. With
+    MEM0_OUTBOX_ENABLED they are only queued in the outbox and counted as enqueued.
+    Otherwise they are uploaded here and the uploaded hashes recorded in the ledger.
+    With RETRIEVAL_BACKEND=qdrant the emails are also indexed locally first.
+    Returns EMPTY_UPLOAD_COUNTS-shaped counts.
+    """
+    indexed = await _update_local_index(user_id, emails=emails) if RETRIEVAL_BACKEND == "qdrant" else 0
+    if MEM0_OUTBOX_ENABLED:
+        queued = await enqueue_mem0_uploads(user_id, emails, ledger)
+        return {**EMPTY_UPLOAD_COUNTS, **queued, "indexed": indexed}
+    result = await upload_emails_to_mem0(user_id, emails, ledger)
+    uploaded_ids = set(result["uploaded"])
+    await mark_uploaded_to_mem0(
+        user_id, [email_item for email_item in emails if email_item['id'] in uploaded_ids], result["memory_ids"]
+    )
+    return {
+        "uploaded": len(uploaded_ids),
+        "skipped": result["skipped"],
+        "failed": result["failed"],
+        "requests": result["requests"],
+        "requests_saved": result["requests_saved"],
+        "seconds_saved": result["seconds_saved"],
+        "chars_saved": result["chars_saved"],
+        "tokens_saved": result["tokens_saved"],
+        "truncated": result["truncated"],
+        "indexed": indexed,
+    }
+
+
+async def _update_local_index(user_id: str, emails=None, deleted_ids=None, keep_ids=None):
+    """
+    Apply stored or deleted emails to the local Qdrant index; returns the number of
+    emails (re)indexed. The index is a secondary copy: a failure is logged and the sync
+    goes on, and the next sync reindexes whatever is missing.
+    """
+    try:
+        if emails:
+            return (await index_emails(user_id, emails))["indexed"]
+        if deleted_ids:
+            await delete_indexed_emails(user_id, deleted_ids)
+        if keep_ids is not None:
+            await delete_missing_indexed_emails(user_id, keep_ids)
+    except Exception as index_error:
+        logger.error(f"❌ Failed to update the local Qdrant index for user_id {user_id}: {str(index_error)}", exc_info=True)
+    return 0
+
+
+async def _run_sync_pipeline(user_id: str, service, max_results: int, fetch_stats=None, checkpoint=None):
+    """
+    Full sync as a streaming pipeline: Gmail chunks are fetched, stored in MongoDB and
+    uploaded to Mem0 concurrently. Bounded queues between the stages apply backpressure,
+    so only a few chunks are ever held in memory regardless of mailbox size.
+    With a sync checkpoint, listing resumes from its page and skips its processed ids,
+    and every chunk that leaves the last stage is recorded in it with the ids listed so far.
+    Emails are upserted, and once the whole mailbox has been listed the stored emails
+    that were not listed any more are deleted.
+    Emails whose content hash matches what MongoDB or Mem0 already holds skip that write.
+    Returns {"fetched", "stored", "storage", "upload", "durations", "gmail"} where storage
+    counts inserted/updated/unchanged/skipped/failed/deleted emails, upload counts
+    enqueued/uploaded/skipped/failed Mem0 uploads, the requests made and saved and the
+    characters/tokens preprocessing saved, durations are per-stage busy seconds and
+    gmail holds the GmailFetchStats counters (API calls, quota units, retries, bytes
+    received and messages fetched again unmasked). Pass fetch_stats to accumulate into counters the caller already holds.
+    """
+    store_queue = asyncio.Queue(maxsize=SYNC_PIPELINE_QUEUE_SIZE)
+    upload_queue = asyncio.Queue(maxsize=SYNC_PIPELINE_QUEUE_SIZE)
+    totals = {
+        "fetched": 0,
+        "stored": 0,
+        "storage": {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "failed": 0, "deleted": 0},
+        "upload": dict(EMPTY_UPLOAD_COUNTS),
+        "durations": {"fetch": 0.0, "store": 0.0, "upload": 0.0},
+    }
+    if fetch_stats is None:
+        fetch_stats = GmailFetchStats()
+    listed_ids = set()
+    # Listed ids already recorded in the checkpoint
+    saved_listed_ids = set()
+
+    async def _fetch_stage():
+        cursor = {}
+        chunks = iter_email_chunks(
+            service, user_id=user_id, max_results=max_results, stats=fetch_stats,
+            resume_from=checkpoint, cursor=cursor, listed_ids=listed_ids
+        )
+        while True:
+            stage_start = time.monotonic()
+            try:
+                chunk = await anext(chunks)
+            except StopAsyncIteration:
+                break
+            except Exception as fetch_error:
+                logger.error(f"❌ Step 4/7: Failed to fetch emails for user_id {user_id}: {str(fetch_error)}", exc_info=True)
+                raise Exception(f"Email fetch failed: {str(fetch_error)}")
+            totals["durations"]["fetch"] += time.monotonic() - stage_start
+            totals["fetched"] += len(chunk)
+            logger.info(f"✅ Step 4/7: Fetched {len(chunk)} emails ({totals['fetched']} so far) for user_id: {user_id}")
+            await store_queue.put((chunk, dict(cursor)))
+        await store_queue.put(None)
+
+    async def _store_stage():
+        # Upserts are idempotent, so a resumed sync can safely rewrite a chunk it stored
+        # just before the interruption
+        while (item := await store_queue.get()) is not None:
+            chunk, position = item
+            stage_start = time.monotonic()
+            try:
+                for email_item in chunk:
+                    email_item['user_id'] = user_id
+                ledger = await load_content_ledger(user_id, [email_item['id'] for email_item in chunk])
+                counts = await upsert_emails(user_id, chunk, ledger)
+            except Exception as storage_error:
+                logger.error(f"❌ Step 5/7: Failed to store emails in MongoDB for user_id {user_id}: {str(storage_error)}", exc_info=True)
+                raise Exception(f"Email storage failed: {str(storage_error)}")
+            totals["durations"]["store"] += time.monotonic() - stage_start
+            write_chunks = counts.pop("chunks")
+            totals["stored"] += len(chunk) - counts["failed"]
+            for key, count in counts.items():
+                totals["storage"][key] += count
+            logger.info(f"✅ Step 5/7: {len(chunk)} emails stored in {len(write_chunks)} write(s) ({counts['inserted']} new, {counts['updated']} updated, {counts['unchanged']} unchanged, {counts['skipped']} skipped, {counts['failed']} failed; {totals['stored']} so far) for user_id: {user_id}")
+            await upload_queue.put((chunk, position, ledger))
+        await upload_queue.put(None)
+
+    async def _upload_stage():
+        while (item := await upload_queue.get()) is not None:
+            chunk, position, ledger = item
+            stage_start = time.monotonic()
+            try:
+                upload = await _upload_and_record(user_id, chunk, ledger)
+                for key, count in upload.items():
+                    totals["upload"][key] += count
+                logger.info(f"✅ Step 6/7: Uploaded {upload['uploaded']} emails to Mem0 in {upload['requests']} request(s), queued {upload['enqueued']} ({upload['skipped']} unchanged skipped) for user_id: {user_id}")
+            except Exception as mem0_error:
+                logger.error(f"❌ Step 6/7: Failed to upload emails to Mem0 for user_id {user_id}: {str(mem0_error)}", exc_info=True)
+                # Note: We don't raise here to allow the process to continue and mark as synced
+                logger.warning(f"⚠️ Step 6/7: Continuing despite Mem0 upload failure for user_id: {user_id}")
+            totals["durations"]["upload"] += time.monotonic() - stage_start
+            if checkpoint is not None:
+                # Chunks leave this stage in listing order, so everything before this page is done
+                new_listed_ids = listed_ids - saved_listed_ids
+                saved_listed_ids.update(new_listed_ids)
+                await save_sync_checkpoint(
+                    user_id, stage=STAGE_SYNCING, position=position,
+                    processed_ids=[email_item['id'] for email_item in chunk], listed_ids=new_listed_ids
+                )
+
+    tasks = [asyncio.create_task(stage()) for stage in (_fetch_stage, _store_stage, _upload_stage)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception():
+                raise task.exception()
+    finally:
+        # A failed stage would leave its neighbours blocked on a queue; stop them
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Only now is the listing complete; anything stored that Gmail no longer lists is gone.
+    # A resumed sync does not list the pages before its checkpoint again; what the
+    # interrupted run listed there, fetched or not, is still in the mailbox.
+    keep_ids = listed_ids.union(
+        checkpoint.get("processed_ids", []) if checkpoint else [],
+        checkpoint.get("listed_ids", []) if checkpoint else []
+    )
+    try:
+        totals["storage"]["deleted"] = await delete_missing_emails(user_id, keep_ids)
+    except Exception as storage_error:
+        logger.error(f"❌ Step 5/7: Failed to remove deleted emails for user_id {user_id}: {str(storage_error)}", exc_info=True)
+        raise Exception(f"Email storage failed: {str(storage_error)}")
+    logger.info(f"🗑️ Step 5/7: Removed {totals['storage']['deleted']} emails no longer in the mailbox for user_id: {user_id}")
+    if RETRIEVAL_BACKEND == "qdrant":
+        await _update_local_index(user_id, keep_ids=keep_ids)
+
+    totals["gmail"] = fetch_stats.as_dict()
+    logger.info(f"📊 Pipeline for user_id {user_id}: fetched {totals['fetched']}, stored {totals['stored']}, stage seconds {totals['durations']}")
+    logger.info(f"📊 Gmail payload for user_id {user_id}: {fetch_stats.bytes_received / 1024:.0f} KiB received, {fetch_stats.refetched} messages fetched again unmasked")
+    logger.info(f"📊 Gmail quota for user_id {user_id}: {fetch_stats.quota_units} units, {fetch_stats.retries} retries ({fetch_stats.rate_limited} rate limited, {fetch_stats.backoff_seconds:.1f}s backoff)")
+    return totals
+
+def _sync_completed_update(history_id, fetch_stats):
+    """
+    User document update once a sync has finished: the new history position and the Gmail
+    quota units the sync consumed, added to the user's running total.
+    """
+    fields = {"initial_gmailData_sync": True, "gmail_last_sync_quota_units": fetch_stats.quota_units}
+    if history_id:
+        fields["gmail_history_id"] = history_id
+    return {"$set": fields, "$inc": {"gmail_quota_units_total": fetch_stats.quota_units}}
+
+async def _incremental_sync_user_emails(user_id: str, service, start_history_id: str, processing_start_time: datetime):
+    """
+    Apply only the mailbox changes since start_history_id: fetch added messages, drop deleted ones.
+    Raises HistoryExpiredError when Gmail no longer has that history, so the caller can run a full sync.
+    """
+    logger.info(f"📧 Step 4/7: Fetching mailbox changes since historyId {start_history_id} for user_id: {user_id}...")
+    fetch_start_time = datetime.now()
+    fetch_stats = GmailFetchStats()
+    changes = await fetch_history_changes(service, user_id, start_history_id, stats=fetch_stats)
+    added_ids = changes["added_ids"]
+    deleted_ids = changes["deleted_ids"]
+    try:
+        emails = await fetch_emails_by_id(service, user_id, added_ids, stats=fetch_stats)
+    except Exception as fetch_error:
+        logger.error(f"❌ Step 4/7: Failed to fetch changed emails for user_id {user_id}: {str(fetch_error)}", exc_info=True)
+        raise Exception(f"Email fetch failed: {str(fetch_error)}")
+    fetch_duration = (datetime.now() - fetch_start_time).total_seconds()
+    durations = {"fetch": fetch_duration, "store": 0.0, "upload": 0.0}
+    logger.info(f"✅ Step 4/7: {len(emails)} added and {len(deleted_ids)} deleted emails for user_id: {user_id} (took {fetch_duration:.2f}s)")
+
+    # Step 5: Apply the changes in MongoDB without touching unchanged emails
+    logger.info(f"💾 Step 5/7: Applying mailbox changes in MongoDB for user_id: {user_id}...")
+    stage_start = time.monotonic()
+    try:
+        for email_item in emails:
+            email_item['user_id'] = user_id
+        ledger = await load_content_ledger(user_id, [email_item['id'] for email_item in emails])
+        storage = await upsert_emails(user_id, emails, ledger)
+        storage.pop("chunks")
+        storage["deleted"] = await delete_emails(user_id, deleted_ids)
+        if RETRIEVAL_BACKEND == "qdrant":
+            await _update_local_index(user_id, deleted_ids=deleted_ids)
+        logger.info(f"✅ Step 5/7: Stored {len(emails)} emails ({storage['inserted']} new, {storage['updated']} updated, {storage['unchanged']} unchanged, {storage['skipped']} skipped) and removed {storage['deleted']} for user_id: {user_id}")
+    except Exception as storage_error:
+        logger.error(f"❌ Step 5/7: Failed to apply mailbox changes for user_id {user_id}: {str(storage_error)}", exc_info=True)
+        raise Exception(f"Email storage failed: {str(storage_error)}")
+    durations["store"] = time.monotonic() - stage_start
+
+    # Step 6: Upload only the new emails to Mem0
+    upload = dict(EMPTY_UPLOAD_COUNTS)
+    if emails:
+        logger.info(f"🧠 Step 6/7: Uploading {len(emails)} new emails to Mem0 for user_id: {user_id}...")
+        stage_start = time.monotonic()
+        try:
+            upload = await _upload_and_record(user_id, emails, ledger)
+        except Exception as mem0_error:
+            logger.error(f"❌ Step 6/7: Failed to upload emails to Mem0 for user_id {user_id}: {str(mem0_error)}", exc_info=True)
+            logger.warning(f"⚠️ Step 6/7: Continuing despite Mem0 upload failure for user_id: {user_id}")
+        durations["upload"] = time.monotonic() - stage_start
+
+    # Step 7: Remember the new history position. Messages that could not be fetched are only
+    # listed in this stretch of history, so after a failure keep the old position and list it
+    # again next time; the emails stored now are skipped as unchanged then.
+    history_id = changes["history_id"]
+    if fetch_stats.failed:
+        history_id = start_history_id
+        logger.warning(f"⚠️ Step 7/7: {fetch_stats.failed} changed emails could not be fetched for user_id: {user_id}, keeping historyId {start_history_id} to retry them")
+    else:
+        logger.info(f"🏁 Step 7/7: Saving historyId {history_id} for user_id: {user_id}")
+    await users_collection.update_one(
+        {"user_id": user_id},
+        _sync_completed_update(history_id, fetch_stats)
+    )
+    total_duration = (datetime.now() - processing_start_time).total_seconds()
+    logger.info(f"🎉 Incremental sync completed for user_id: {user_id} (total time: {total_duration:.2f}s)")
+    return {
+        "status": "success",
+        "message": f"Incremental sync for user {user_id}: {len(emails)} new emails, {len(deleted_ids)} removed",
+        "count": len(emails),
+        "deleted_count": len(deleted_ids),
+        "sync_mode": "incremental",
+        "history_id": history_id,
+        "storage": storage,
+        "upload": upload,
+        "skipped": {"store": storage["skipped"], "upload": upload["skipped"]},
+        "stage_durations_seconds": durations,
+        "gmail_stats": fetch_stats.as_dict(),
+        "processing_time_seconds": total_duration
+    }
+
 async def check_and_fetch_new_user_emails():
     logger.info("Background worker: Checking for users with fetched_email=false")
     try:
+        # Syncs cut short by a restart show up as stale checkpoints; queue them to resume
+        await reset_interrupted_syncs()
         users_to_fetch = users_collection.find({"fetched_email": False})
         async for user in users_to_fetch:
             user_id = user.get("user_id")
@@ -741,15 +1171,3 @@ async def check_and_fetch_new_user_emails():
         logger.info("Background worker: Finished checking for users.")
     except Exception as e:
         logger.error(f"Background worker: Error during check_and_fetch_new_user_emails: {str(e)}", exc_info=True)
-
-@app.on_event("startup")
-async def startup_event():
-    # Schedule the job to run every 2 minutes
-    scheduler.add_job(check_and_fetch_new_user_emails, "interval", minutes=2, id="fetch_new_emails_job")
-    scheduler.start()
-    logger.info("APScheduler started. Job 'fetch_new_emails_job' scheduled every 2 minutes.")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    scheduler.shutdown()
-    logger.info("APScheduler shut down.")
@@ -4,8 +4,12 @@ from agno.models.openai import OpenAIChat
 import os
 import asyncio
 import logging
+import time
 import openai # Import the openai library
 from fastapi.concurrency import run_in_threadpool # Added import
+from app.mem0_ingest import preprocess_body, count_tokens
+from app.vector_index import search_index, RETRIEVAL_BACKEND
+from app.utils import validate_email_data
 
 # Configure logging for this module
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +25,17 @@ except ImportError:
 # These environment variables are crucial for the agent and Mem0 client
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MEM0_API_KEY = os.getenv("MEM0_API_KEY") 
+# Mem0 adds in flight at once per upload_emails_to_mem0 call
+MEM0_UPLOAD_CONCURRENCY = int(os.getenv("MEM0_UPLOAD_CONCURRENCY", "8"))
+# Emails packed into one Mem0 add, capped by count and by total content characters.
+# 1 sends every email on its own. A packed add sends one message per email with infer=False,
+# so Mem0 stores each email as one memory and returns them in message order; that is the
+# only way to know which memory belongs to which email. Emails split into several chunks
+# by preprocessing are always sent alone.
+MEM0_UPLOAD_BATCH_SIZE = int(os.getenv("MEM0_UPLOAD_BATCH_SIZE", "1"))
+MEM0_UPLOAD_BATCH_MAX_CHARS = int(os.getenv("MEM0_UPLOAD_BATCH_MAX_CHARS", "20000"))
+# Memory ids per batch_delete request (the Mem0 API takes at most 1000)
+MEM0_DELETE_BATCH_SIZE = int(os.getenv("MEM0_DELETE_BATCH_SIZE", "1000"))
 
 # Initialize OpenAI client
 if OPENAI_API_KEY:
@@ -65,9 +80,102 @@ except Exception as e:
 #     add_context=True, 
 # )
 
-async def upload_emails_to_mem0(user_id: str, emails: list):
+def _email_content(email_data):
+    """
+    The texts stored in Mem0 for one email, one per body chunk (see
+    app.mem0_ingest.preprocess_body), and the preprocessing stats: characters and tokens
+    of the verbatim content and of the texts, and the preprocess_body flags.
+    Raises ValueError when validate_email_data rejects the email.
+    """
+    gmail_message_id = email_data.get('id')
+    email_subject = email_data.get('subject') or 'N/A'
+    email_snippet = email_data.get('snippet') or ''
+    email_body = email_data.get('body') or ''
+    
+    logger.debug(f"Email ID {gmail_message_id}: Subject length = {len(email_subject)}, Snippet length = {len(email_snippet)}, Body length = {len(email_body)}")
+    
+    # The content as it was sent before preprocessing, the baseline for what it saves
+    raw_content = f"Subject: {email_subject}\\nSnippet: {email_snippet}\\nBody: {email_body}"
+    chunks, flags = preprocess_body(email_body)
+    is_valid, validation_errors = validate_email_data({
+        "id": gmail_message_id, "subject": email_subject, "snippet": email_snippet, "body": max(chunks, key=len)
+    })
+    if not is_valid:
+        raise ValueError("; ".join(validation_errors))
+    
+    # Construct the content to be stored in Mem0; later chunks repeat the subject for context
+    contents = [f"Subject: {email_subject}\\nSnippet: {email_snippet}\\nBody: {chunks[0]}"]
+    contents += [
+        f"Subject: {email_subject}\\nBody (part {part}/{len(chunks)}): {chunk}"
+        for part, chunk in enumerate(chunks[1:], start=2)
+    ]
+    stats = {
+        "chars_in": len(raw_content),
+        "chars_out": sum(len(content) for content in contents),
+        "tokens_in": count_tokens(raw_content),
+        "tokens_out": sum(count_tokens(content) for content in contents),
+        **flags,
+    }
+    
+    logger.debug(f"Email ID {gmail_message_id}: Final content length = {stats['chars_out']} in {len(contents)} message(s)")
+    return contents, stats
+
+def _response_memory_ids(response):
+    """Ids of the memories an add created or updated, from a v1.0 (list) or v1.1 ({"results"}) response."""
+    results = response.get("results") if isinstance(response, dict) else response
+    return [result["id"] for result in results or [] if isinstance(result, dict) and result.get("id")]
+
+async def delete_memories(user_id: str, memory_ids: list):
+    """
+    Delete Mem0 memories by id, MEM0_DELETE_BATCH_SIZE per batch_delete request.
+    Returns the number of ids whose request failed; those memories are left behind.
+    """
+    failed = 0
+    for start in range(0, len(memory_ids), MEM0_DELETE_BATCH_SIZE):
+        batch = memory_ids[start:start + MEM0_DELETE_BATCH_SIZE]
+        try:
+            await aclient.batch_delete([{"memory_id": memory_id} for memory_id in batch])
+        except Exception as delete_error:
+            failed += len(batch)
+            logger.error(f"Failed to delete {len(batch)} Mem0 memories for user {user_id}: {str(delete_error)}", exc_info=True)
+    return failed
+
+def _batch_emails(prepared, max_count, max_chars):
+    """
+    Group (index, email_data, contents) items in order into batches of at most max_count
+    items and max_chars content characters. An item longer than max_chars goes alone.
+    """
+    batches, batch, batch_chars = [], [], 0
+    for item in prepared:
+        item_chars = sum(len(content) for content in item[2])
+        if batch and (len(batch) >= max_count or batch_chars + item_chars > max_chars):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(item)
+        batch_chars += item_chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def upload_emails_to_mem0(user_id: str, emails: list, ledger: dict = None):
     """
     Upload emails to Mem0 with comprehensive logging and error handling for each email.
+
+    Emails whose content_hash equals the mem0_content_hash in ledger (see
+    app.email_store.load_content_ledger) are already in Mem0 as they are and are skipped.
+    Emails are sent in batches of up to MEM0_UPLOAD_BATCH_SIZE emails and
+    MEM0_UPLOAD_BATCH_MAX_CHARS characters per add, each add tagged with the Gmail ids
+    in its metadata. An email that was uploaded before (mem0_memory_ids on it or in
+    ledger) is replaced: once its new content is in, its old memories are deleted by id.
+    Contents are preprocessed first (see _email_content), which may split an email into
+    several messages; such an email goes in an add of its own.
+    Returns {"uploaded": [ids], "skipped", "failed", "errors", "requests",
+    "requests_saved", "seconds", "seconds_saved", "chars_saved", "tokens_saved",
+    "truncated", "memory_ids", "replaced"}; errors are the upload_errors entries,
+    seconds_saved is an upper estimate of the upload time batching saved, from the mean
+    request time, chars/tokens_saved are what preprocessing removed from the prepared
+    emails, memory_ids maps each uploaded email id to the ids of its own memories and
+    replaced counts the old memories deleted.
     """
     logger.info(f"Starting email upload process to Mem0 for user_id: {user_id}. Total emails to process: {len(emails)}")
     
@@ -77,13 +185,46 @@ async def upload_emails_to_mem0(user_id: str, emails: list):
     
     if not emails:
         logger.warning(f"No emails provided for upload to Mem0 for user_id: {user_id}")
-        return
+        return {
+            "uploaded": [], "skipped": 0, "failed": 0, "errors": [], "requests": 0, "requests_saved": 0,
+            "seconds": 0.0, "seconds_saved": 0.0, "chars_saved": 0, "tokens_saved": 0, "truncated": 0,
+            "memory_ids": {}, "replaced": 0,
+        }
+    
+    ledger = ledger or {}
+    changed_emails = [
+        email_data for email_data in emails
+        if not email_data.get('content_hash')
+        or ledger.get(email_data.get('id'), {}).get('mem0_content_hash') != email_data['content_hash']
+    ]
+    skipped_count = len(emails) - len(changed_emails)
+    if skipped_count:
+        logger.info(f"Skipping {skipped_count} emails already in Mem0 with the same content for user_id: {user_id}")
+    emails = changed_emails
     
+    uploaded_ids = []
+    memory_ids = {}
+    orphaned_memory_ids = []
     successful_uploads = 0
     failed_uploads = 0
     upload_errors = []
+    request_count = 0
+    request_seconds = 0.0
+    preprocessing = {"chars_in": 0, "chars_out": 0, "tokens_in": 0, "tokens_out": 0,
+                     "quotes_stripped": 0, "signature_stripped": 0, "truncated": 0}
     
-    # Ensure each email is uploaded to Mem0, using its Gmail ID as memory_id for de-duplication/update.
+    def _record_failure(index, email_data, error):
+        nonlocal failed_uploads
+        failed_uploads += 1
+        upload_errors.append({
+            "email_index": index + 1,
+            "email_id": email_data.get('id'),
+            "subject": email_data.get('subject', 'N/A'),
+            "error": error
+        })
+
+    # Build the content of every email first; emails without a Gmail ID cannot be uploaded
+    prepared = []
     for index, email_data in enumerate(emails):
         gmail_message_id = email_data.get('id') # Assumes email_data from MongoDB has 'id' field from Gmail message ID
         email_subject = email_data.get('subject', 'N/A')
@@ -91,108 +232,122 @@ async def upload_emails_to_mem0(user_id: str, emails: list):
         logger.info(f"Processing email {index + 1}/{len(emails)} for Mem0 upload - ID: {gmail_message_id}, Subject: '{email_subject}'")
 
         if not gmail_message_id:
-            failed_uploads += 1
-            error_msg = f"Skipping email upload to Mem0 for user {user_id} due to missing Gmail message ID. Subject: {email_subject}"
-            logger.warning(error_msg)
-            upload_errors.append({
-                "email_index": index + 1,
-                "subject": email_subject,
-                "error": "Missing Gmail message ID"
-            })
+            logger.warning(f"Skipping email upload to Mem0 for user {user_id} due to missing Gmail message ID. Subject: {email_subject}")
+            _record_failure(index, email_data, "Missing Gmail message ID")
             continue # Skip this email if it doesn't have a unique ID
+        try:
+            contents, stats = _email_content(email_data)
+            prepared.append((index, email_data, contents))
+            for key, value in stats.items():
+                preprocessing[key] += value
+        except Exception as email_processing_error:
+            logger.error(f"Error processing email data for Mem0 upload (ID: {gmail_message_id}): {str(email_processing_error)}", exc_info=True)
+            _record_failure(index, email_data, str(email_processing_error))
+
+    # Only emails that fit in one message can share an add
+    batches = [[item] for item in prepared if len(item[2]) > 1] + _batch_emails(
+        [item for item in prepared if len(item[2]) == 1], MEM0_UPLOAD_BATCH_SIZE, MEM0_UPLOAD_BATCH_MAX_CHARS
+    )
+    
+    # Up to MEM0_UPLOAD_CONCURRENCY adds are in flight at once; the counters are only touched
+    # between awaits, so the concurrent uploads can share them.
+    semaphore = asyncio.Semaphore(MEM0_UPLOAD_CONCURRENCY)
 
+    async def _upload_batch(batch):
+        nonlocal successful_uploads, request_count, request_seconds
+        email_ids = [email_data['id'] for _, email_data, _ in batch]
+        if len(batch) == 1:
+            # Every memory Mem0 extracts from this add belongs to this one email
+            messages_to_add = [{"role": "user", "content": content} for content in batch[0][2]]
+            add_kwargs = {"metadata": {"email_id": email_ids[0]}}
+        else:
+            # One message per email, stored verbatim so the n-th memory is the n-th email's
+            messages_to_add = [{"role": "user", "content": contents[0]} for _, _, contents in batch]
+            add_kwargs = {"metadata": {"email_ids": email_ids}, "infer": False}
+        logger.info(f"Uploading/updating {len(batch)} email(s) {email_ids[:3]}{'...' if len(batch) > 3 else ''} to Mem0 for user {user_id}...")
+
+        request_start = time.monotonic()
         try:
-            # Validate email data
-            email_snippet = email_data.get('snippet', '')
-            email_body = email_data.get('body', '')
-            
-            logger.debug(f"Email ID {gmail_message_id}: Subject length = {len(email_subject)}, Snippet length = {len(email_snippet)}, Body length = {len(email_body)}")
-            
-            # Construct the content to be stored in Mem0
-            content = f"Subject: {email_subject}\\nSnippet: {email_snippet}\\nBody: {email_body}"
-            
-            if len(content.strip()) == 0:
-                logger.warning(f"Email ID {gmail_message_id}: Content is empty, using subject as fallback")
-                content = f"Subject: {email_subject}"
-            
-            logger.debug(f"Email ID {gmail_message_id}: Final content length = {len(content)}")
+            response = await aclient.add(messages=messages_to_add, user_id=user_id, **add_kwargs)
             
-            # Mem0 expects a list of messages for the .add() method
-            messages_to_add = [
-                {
-                    "role": "user", # Or another role that semantically represents the email data source
-                    "content": content
-                }
-            ]
+            # Log the response for debugging
+            logger.debug(f"Mem0 response for email IDs {email_ids} (user {user_id}): {response}")
             
-            logger.debug(f"Email ID {gmail_message_id}: Prepared message for Mem0 upload")
-            
-            # Use Gmail's message ID as Mem0's memory_id.
-            # This tells Mem0 to update the memory if this ID already exists for the user, otherwise create it.
-            logger.info(f"Uploading/updating email with ID {gmail_message_id} to Mem0 for user {user_id}...")
-            
-            try:
-                response = await aclient.add(
-                    messages=messages_to_add, 
-                    user_id=user_id,
-                    memory_id=gmail_message_id 
-                )
-                
-                # Log the response for debugging
-                logger.debug(f"Mem0 response for memory_id {gmail_message_id} (user {user_id}): {response}")
-                
-                # Check if the response indicates success
-                if response:
-                    successful_uploads += 1
-                    logger.info(f"✅ Email {index + 1}/{len(emails)} uploaded successfully to Mem0 - ID: {gmail_message_id}")
+            response_memory_ids = _response_memory_ids(response) if response else []
+            # Check if the response indicates success
+            if response and len(batch) > 1 and len(response_memory_ids) != len(batch):
+                # Without one memory per email the memories cannot be told apart; drop them
+                # and let the emails be uploaded again
+                logger.error(f"Mem0 returned {len(response_memory_ids)} memories for {len(batch)} packed emails {email_ids}")
+                orphaned_memory_ids.extend(response_memory_ids)
+                for index, email_data, _ in batch:
+                    _record_failure(index, email_data, f"Mem0 returned {len(response_memory_ids)} memories for {len(batch)} emails")
+            elif response:
+                successful_uploads += len(batch)
+                uploaded_ids.extend(email_ids)
+                if len(batch) == 1:
+                    memory_ids[email_ids[0]] = response_memory_ids
                 else:
-                    failed_uploads += 1
-                    error_msg = f"Mem0 returned empty response for email ID {gmail_message_id}"
-                    logger.warning(error_msg)
-                    upload_errors.append({
-                        "email_index": index + 1,
-                        "email_id": gmail_message_id,
-                        "subject": email_subject,
-                        "error": "Empty response from Mem0"
-                    })
-                    
-            except Exception as mem0_api_error:
-                failed_uploads += 1
-                error_msg = f"Mem0 API error for email ID {gmail_message_id}: {str(mem0_api_error)}"
-                logger.error(error_msg, exc_info=True)
-                upload_errors.append({
-                    "email_index": index + 1,
-                    "email_id": gmail_message_id,
-                    "subject": email_subject,
-                    "error": str(mem0_api_error)
-                })
-                
-                # Check if it's a rate limiting or quota issue
-                if "rate limit" in str(mem0_api_error).lower() or "quota" in str(mem0_api_error).lower():
-                    logger.warning(f"Rate limit or quota issue detected for user {user_id}. Consider implementing retry with backoff.")
-                
-                # Check if it's an authentication issue
-                if "auth" in str(mem0_api_error).lower() or "unauthorized" in str(mem0_api_error).lower():
-                    logger.error(f"Authentication issue with Mem0 for user {user_id}. Check API key configuration.")
-                
-                continue
+                    for email_id, memory_id in zip(email_ids, response_memory_ids):
+                        memory_ids[email_id] = [memory_id]
+                logger.info(f"✅ {len(batch)} email(s) uploaded successfully to Mem0 - IDs: {email_ids}")
+            else:
+                logger.warning(f"Mem0 returned empty response for email IDs {email_ids}")
+                for index, email_data, _ in batch:
+                    _record_failure(index, email_data, "Empty response from Mem0")
                 
-        except Exception as email_processing_error:
-            failed_uploads += 1
-            error_msg = f"Error processing email data for Mem0 upload (ID: {gmail_message_id}): {str(email_processing_error)}"
-            logger.error(error_msg, exc_info=True)
-            upload_errors.append({
-                "email_index": index + 1,
-                "email_id": gmail_message_id,
-                "subject": email_subject,
-                "error": str(email_processing_error)
-            })
-            continue
+        except Exception as mem0_api_error:
+            logger.error(f"Mem0 API error for email IDs {email_ids}: {str(mem0_api_error)}", exc_info=True)
+            for index, email_data, _ in batch:
+                _record_failure(index, email_data, str(mem0_api_error))
+            
+            # Check if it's a rate limiting or quota issue
+            if "rate limit" in str(mem0_api_error).lower() or "quota" in str(mem0_api_error).lower():
+                logger.warning(f"Rate limit or quota issue detected for user {user_id}. Consider implementing retry with backoff.")
+            
+            # Check if it's an authentication issue
+            if "auth" in str(mem0_api_error).lower() or "unauthorized" in str(mem0_api_error).lower():
+                logger.error(f"Authentication issue with Mem0 for user {user_id}. Check API key configuration.")
+        finally:
+            request_count += 1
+            request_seconds += time.monotonic() - request_start
+
+    async def _upload_bounded(batch):
+        async with semaphore:
+            await _upload_batch(batch)
+
+    upload_start = time.monotonic()
+    await asyncio.gather(*(_upload_bounded(batch) for batch in batches))
+    upload_seconds = time.monotonic() - upload_start
+    # The new memories are in; the ones the replaced emails had before can go
+    replaced_memory_ids = [
+        memory_id
+        for email_data in emails if email_data.get('id') in memory_ids
+        for memory_id in email_data.get('mem0_memory_ids') or ledger.get(email_data['id'], {}).get('mem0_memory_ids') or []
+    ]
+    stale_memories = await delete_memories(user_id, replaced_memory_ids)
+    replaced_count = len(replaced_memory_ids) - stale_memories
+    stale_memories += await delete_memories(user_id, orphaned_memory_ids)
+    # Completion order is arbitrary; report in input order as before
+    upload_errors.sort(key=lambda error: error["email_index"])
+    uploaded_order = {email_data.get('id'): index for index, email_data in enumerate(emails)}
+    uploaded_ids.sort(key=uploaded_order.get)
+    # Without batching every prepared email would have been its own request. Counting each
+    # at the mean request time assumes that time is mostly per-request overhead (true for
+    # Mem0's extraction call), so this is an upper estimate when bodies are large
+    requests_saved = len(prepared) - request_count
+    seconds_saved = requests_saved * (request_seconds / request_count) / MEM0_UPLOAD_CONCURRENCY if request_count else 0.0
+    chars_saved = preprocessing["chars_in"] - preprocessing["chars_out"]
+    tokens_saved = preprocessing["tokens_in"] - preprocessing["tokens_out"]
     
     # Final summary
     logger.info(f"📊 Mem0 upload summary for user_id {user_id}:")
     logger.info(f"   ✅ Successful uploads: {successful_uploads}")
     logger.info(f"   ❌ Failed uploads: {failed_uploads}")
+    logger.info(f"   ⏭️ Skipped (unchanged): {skipped_count}")
+    logger.info(f"   ♻️ Old memories deleted: {replaced_count} ({stale_memories} left behind)")
+    logger.info(f"   📨 Mem0 requests: {request_count} ({requests_saved} saved by batching, ~{seconds_saved:.2f}s) in {upload_seconds:.2f}s")
+    logger.info(f"   ✂️ Preprocessing saved {chars_saved} chars / {tokens_saved} tokens (quotes stripped from {preprocessing['quotes_stripped']}, signatures from {preprocessing['signature_stripped']}, {preprocessing['truncated']} truncated)")
     logger.info(f"   📧 Total emails processed: {len(emails)}")
     
     if upload_errors:
@@ -208,10 +363,28 @@ async def upload_emails_to_mem0(user_id: str, emails: list):
     # Raise an exception if all uploads failed
     if failed_uploads == len(emails) and len(emails) > 0:
         raise Exception(f"All {len(emails)} email uploads failed for user {user_id}")
+    
+    return {
+        "uploaded": uploaded_ids,
+        "skipped": skipped_count,
+        "failed": failed_uploads,
+        "errors": upload_errors,
+        "requests": request_count,
+        "requests_saved": requests_saved,
+        "seconds": upload_seconds,
+        "seconds_saved": seconds_saved,
+        "chars_saved": chars_saved,
+        "tokens_saved": tokens_saved,
+        "truncated": preprocessing["truncated"],
+        "memory_ids": memory_ids,
+        "replaced": replaced_count,
+    }
 
 async def query_mem0(user_id: str, query: str):
     """
     Query Mem0 with comprehensive logging and error handling.
+    With RETRIEVAL_BACKEND=qdrant the context comes from the local Qdrant index
+    (app.vector_index) instead of a Mem0 search.
     """
     logger.info(f"Starting Mem0 query for user_id: {user_id}, query: '{query}'")
     
@@ -239,17 +412,24 @@ async def query_mem0(user_id: str, query: str):
     retrieved_memories = []
     
     try:
-        if agent_memory_platform_client:
-            logger.info(f"Searching Mem0 for user {user_id} with query: '{query}'")
-            # Wrap the blocking .search() call in run_in_threadpool
-            retrieved_memories = await run_in_threadpool(
-                agent_memory_platform_client.search, 
-                query=query, 
-                user_id=user_id, 
-                limit=25
-            )
-            logger.info(f"Mem0 search returned {len(retrieved_memories) if retrieved_memories else 0} results for user {user_id}")
-            logger.debug(f"DEBUG [query_mem0]: Mem0 search results for user {user_id}, query '{query}': {retrieved_memories}")
+        if RETRIEVAL_BACKEND == "qdrant" or agent_memory_platform_client:
+            search_start = time.monotonic()
+            search_backend = "Qdrant" if RETRIEVAL_BACKEND == "qdrant" else "Mem0"
+            if RETRIEVAL_BACKEND == "qdrant":
+                logger.info(f"Searching local Qdrant index for user {user_id} with query: '{query}'")
+                retrieved_memories = await search_index(user_id, query, limit=25)
+            else:
+                logger.info(f"Searching Mem0 for user {user_id} with query: '{query}'")
+                # Wrap the blocking .search() call in run_in_threadpool
+                retrieved_memories = await run_in_threadpool(
+                    agent_memory_platform_client.search, 
+                    query=query, 
+                    user_id=user_id, 
+                    limit=25
+                )
+            logger.info(f"{search_backend} search took {(time.monotonic() - search_start) * 1000:.1f}ms")
+            logger.info(f"{search_backend} search returned {len(retrieved_memories) if retrieved_memories else 0} results for user {user_id}")
+            logger.debug(f"DEBUG [query_mem0]: {search_backend} search results for user {user_id}, query '{query}': {retrieved_memories}")
             
             if retrieved_memories:
                 context_str = "\\n\\nRelevant email snippets:\\n"
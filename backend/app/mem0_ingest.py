@@ -0,0 +1,162 @@
+import logging
+import os
+import re
+
+from app.utils import sanitize_email_content
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens of email body sent to Mem0 per message; 0 sends the body whole
+MEM0_INGEST_TOKEN_BUDGET = int(os.getenv("MEM0_INGEST_TOKEN_BUDGET", "2000"))
+# Messages a long body is split into, each within the budget; the rest is cut.
+# 1 truncates the body to the budget.
+MEM0_INGEST_MAX_CHUNKS = int(os.getenv("MEM0_INGEST_MAX_CHUNKS", "1"))
+# Drop quoted reply chains and signatures; the quoted mail is stored as its own email
+MEM0_INGEST_STRIP_QUOTES = os.getenv("MEM0_INGEST_STRIP_QUOTES", "true").lower() == "true"
+# Hard cap on body characters, applied by sanitize_email_content before anything else
+MEM0_INGEST_MAX_CHARS = int(os.getenv("MEM0_INGEST_MAX_CHARS", "40000"))
+
+# Without tiktoken, tokens are estimated at this many characters each
+CHARS_PER_TOKEN = 4
+
+# Lines that start the quoted part of a reply; everything from them on is dropped
+_REPLY_HEADER = re.compile(
+    r'^(?:'
+    r'On\s[^\n]{1,200}?(?:\n[^\n]{0,200}?)?\swrote:[ \t]*$'                # Gmail, Apple Mail
+    r'|-{2,}\s*Original Message\s*-{2,}'                                   # Outlook, Lotus
+    r'|From:\s[^\n]+\n(?:(?:To|Cc|Reply-To):\s[^\n]*\n)*(?:Sent|Date):\s'  # Outlook without the banner
+    r')',
+    re.MULTILINE | re.IGNORECASE,
+)
+# RFC 3676 signature delimiter, "-- " with the trailing space; the last one in the body
+# starts the signature unless more than MAX_SIGNATURE_LINES lines follow it
+_SIGNATURE_DELIMITER = re.compile(r'^-- $', re.MULTILINE)
+MAX_SIGNATURE_LINES = 10
+# Mobile client footers, dropped wherever they stand
+_CLIENT_FOOTER = re.compile(
+    r'^(?:Sent from my \w[^\n]{0,40}|Get Outlook for \w[^\n]{0,40}|Sent from (?:Mail|Yahoo Mail) for \w[^\n]{0,40})$\n?',
+    re.MULTILINE | re.IGNORECASE,
+)
+_QUOTED_LINE = re.compile(r'^[ \t]*>[^\n]*\n?', re.MULTILINE)
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken's cl100k_base encoding, or None without tiktoken or when it cannot be loaded."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # The encoding is downloaded on first use; offline hosts estimate instead
+                logger.warning(f"⚠️ tiktoken encoding unavailable, estimating tokens from length: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text):
+    """Tokens in text with tiktoken's cl100k_base encoding, or estimated from its length."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def split_by_tokens(text, budget, max_chunks):
+    """
+    Split text into at most max_chunks pieces of at most budget tokens each, in order,
+    preferring to cut at whitespace. Returns (chunks, cut) where cut tells whether text
+    went past max_chunks pieces and its tail was dropped.
+    """
+    if budget <= 0 or not text:
+        return [text], False
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= budget:
+            return [text], False
+        chunks = []
+        start = 0
+        while len(tokens) - start > budget:
+            # Back up to the last token starting with whitespace in the final tenth of the piece
+            end = start + budget
+            cut = next(
+                (index for index in range(end, end - budget // 10, -1)
+                 if index > start and encoding.decode_single_token_bytes(tokens[index])[:1].isspace()),
+                end
+            )
+            chunks.append(encoding.decode(tokens[start:cut]))
+            start = cut
+        chunks.append(encoding.decode(tokens[start:]))
+    else:
+        size = budget * CHARS_PER_TOKEN
+        chunks = []
+        rest = text
+        while len(rest) > size:
+            # Back up to the last whitespace in the final tenth of the piece, if there is one
+            cut = rest.rfind(' ', size - size // 10, size) + 1 or rest.rfind('\n', size - size // 10, size) + 1 or size
+            chunks.append(rest[:cut])
+            rest = rest[cut:]
+        chunks.append(rest)
+    return chunks[:max_chunks], len(chunks) > max_chunks
+
+
+def strip_quotes_and_signature(body):
+    """
+    Drop the quoted reply chain, '>' quoted lines, the signature and mobile client
+    footers from a plain text body. Returns (body, quotes_stripped, signature_stripped);
+    a body that would be left empty is returned unchanged.
+    """
+    stripped = body
+    header = _REPLY_HEADER.search(stripped)
+    if header:
+        stripped = stripped[:header.start()]
+    stripped = _QUOTED_LINE.sub('', stripped)
+    quotes_stripped = len(stripped) != len(body)
+
+    signature_stripped = False
+    delimiters = list(_SIGNATURE_DELIMITER.finditer(stripped))
+    if delimiters and stripped.count('\n', delimiters[-1].end()) <= MAX_SIGNATURE_LINES:
+        stripped = stripped[:delimiters[-1].start()]
+        signature_stripped = True
+    without_footer = _CLIENT_FOOTER.sub('', stripped)
+    signature_stripped = signature_stripped or len(without_footer) != len(stripped)
+
+    stripped = _BLANK_LINES.sub('\n\n', without_footer).strip()
+    if not stripped:
+        return body, False, False
+    return stripped, quotes_stripped, signature_stripped
+
+
+def preprocess_body(body, token_budget=None, max_chunks=None):
+    """
+    Prepare an email body for Mem0: sanitize it, strip quotes and signature (with
+    MEM0_INGEST_STRIP_QUOTES) and split it by token_budget (MEM0_INGEST_TOKEN_BUDGET)
+    into at most max_chunks (MEM0_INGEST_MAX_CHUNKS) pieces. Returns (chunks, flags)
+    where flags holds "quotes_stripped", "signature_stripped" and "truncated".
+    """
+    token_budget = MEM0_INGEST_TOKEN_BUDGET if token_budget is None else token_budget
+    max_chunks = MEM0_INGEST_MAX_CHUNKS if max_chunks is None else max_chunks
+    body = body or ''
+    over_cap = len(body) > MEM0_INGEST_MAX_CHARS
+    body = sanitize_email_content(body, max_length=MEM0_INGEST_MAX_CHARS)
+    quotes_stripped = signature_stripped = False
+    if MEM0_INGEST_STRIP_QUOTES:
+        body, quotes_stripped, signature_stripped = strip_quotes_and_signature(body)
+    chunks, truncated = split_by_tokens(body, token_budget, max(max_chunks, 1))
+    return chunks, {
+        "quotes_stripped": quotes_stripped,
+        "signature_stripped": signature_stripped,
+        "truncated": truncated or over_cap,
+    }
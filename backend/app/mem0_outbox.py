@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from app.db import mem0_outbox_collection, emails_collection
+from app.body_codec import read_body
+from app.email_store import mark_uploaded_to_mem0
+from app.mailbox_stats import record_mem0_uploads
+from app.mem0_agent import upload_emails_to_mem0
+from app.utils import RetryConfig
+
+logger = logging.getLogger(__name__)
+
+# When enabled, syncs only enqueue Mem0 uploads here and return once emails are stored;
+# the worker pool started by the app uploads them in the background, so a slow or failing
+# Mem0 never holds up a sync. Disabling it uploads inline, within the sync.
+MEM0_OUTBOX_ENABLED = os.getenv("MEM0_OUTBOX_ENABLED", "true").lower() == "true"
+MEM0_OUTBOX_WORKERS = int(os.getenv("MEM0_OUTBOX_WORKERS", "2"))
+# Entries a worker claims (for one user) and uploads in one upload_emails_to_mem0 call
+MEM0_OUTBOX_BATCH_SIZE = int(os.getenv("MEM0_OUTBOX_BATCH_SIZE", "50"))
+# A claimed entry whose worker has not finished within this long is claimable again
+MEM0_OUTBOX_LEASE_SECONDS = int(os.getenv("MEM0_OUTBOX_LEASE_SECONDS", "600"))
+MEM0_OUTBOX_POLL_SECONDS = float(os.getenv("MEM0_OUTBOX_POLL_SECONDS", "5"))
+# Failed uploads back off exponentially; after this many attempts an entry is dead-lettered
+MEM0_OUTBOX_RETRY_CONFIG = RetryConfig(
+    max_attempts=int(os.getenv("MEM0_OUTBOX_MAX_ATTEMPTS", "8")),
+    delay=float(os.getenv("MEM0_OUTBOX_RETRY_BASE_DELAY", "30")),
+    max_delay=float(os.getenv("MEM0_OUTBOX_RETRY_MAX_DELAY", "3600")),
+    jitter=True,
+)
+
+# Entry states. Uploaded entries are deleted, so "done" is never stored.
+STATUS_PENDING = "pending"   # waiting for available_at
+STATUS_LEASED = "leased"     # claimed by a worker until available_at, under the lease token in leased_by
+STATUS_DEAD = "dead"         # out of attempts, kept for inspection and requeue_dead_uploads
+
+# Fields the upload needs from the stored email
+_EMAIL_FIELDS = {
+    "_id": 0, "id": 1, "subject": 1, "snippet": 1, "body": 1, "body_codec": 1, "content_hash": 1, "mem0_content_hash": 1,
+    "mem0_memory_ids": 1,
+}
+
+
+async def enqueue_mem0_uploads(user_id, emails, ledger=None):
+    """
+    Queue Mem0 uploads for the emails whose content_hash differs from the
+    mem0_content_hash in ledger. An email already queued is reset to pending with fresh
+    attempts. Returns {"enqueued", "skipped"}.
+    """
+    ledger = ledger or {}
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "email_id": email_item['id']},
+            {
+                "$set": {
+                    "status": STATUS_PENDING, "available_at": now, "attempts": 0,
+                    "content_hash": email_item.get('content_hash'), "last_error": None, "updated_at": now,
+                },
+                "$setOnInsert": {"created_at": now},
+                "$unset": {"leased_by": ""},
+            },
+            upsert=True
+        )
+        for email_item in emails
+        if not email_item.get('content_hash')
+        or ledger.get(email_item['id'], {}).get('mem0_content_hash') != email_item['content_hash']
+    ]
+    if operations:
+        await mem0_outbox_collection.bulk_write(operations, ordered=False)
+    return {"enqueued": len(operations), "skipped": len(emails) - len(operations)}
+
+
+async def claim_uploads(worker_id, limit=None):
+    """
+    Lease up to limit due entries of one user for worker_id: the oldest due entry picks
+    the user, the rest are that user's next due entries. Expired leases are due too.
+    Each claim counts as an attempt. Returns the claimed entries, which carry the lease
+    token in leased_by.
+
+    The claim costs four round trips however many entries it takes: find the user, find
+    the candidate ids, stamp the still-due ones with a fresh lease token in one
+    update_many, and read back what carries the token. Candidates another worker leased
+    in between fail the due filter of the update and are left out.
+    """
+    limit = limit or MEM0_OUTBOX_BATCH_SIZE
+    now = datetime.now()
+    due = {"status": {"$in": [STATUS_PENDING, STATUS_LEASED]}, "available_at": {"$lte": now}}
+    oldest = await mem0_outbox_collection.find_one(due, {"user_id": 1}, sort=[("available_at", 1)])
+    if oldest is None:
+        return []
+    user_due = {**due, "user_id": oldest["user_id"]}
+    candidates = await mem0_outbox_collection.find(user_due, {"_id": 1}).sort("available_at", 1).limit(limit).to_list(length=limit)
+
+    lease = f"{worker_id}:{uuid.uuid4().hex}"
+    await mem0_outbox_collection.update_many(
+        {**user_due, "_id": {"$in": [entry["_id"] for entry in candidates]}},
+        {
+            "$set": {
+                "status": STATUS_LEASED, "leased_by": lease, "updated_at": now,
+                "available_at": now + timedelta(seconds=MEM0_OUTBOX_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        }
+    )
+    return await mem0_outbox_collection.find({"leased_by": lease}).sort("available_at", 1).to_list(length=limit)
+
+
+async def _settle_failed(entries, errors):
+    """Back off the failed entries, or dead-letter them when they are out of attempts."""
+    now = datetime.now()
+    operations = []
+    for entry in entries:
+        error = errors.get(entry["email_id"], "Upload failed")
+        if entry["attempts"] >= MEM0_OUTBOX_RETRY_CONFIG.max_attempts:
+            update = {"status": STATUS_DEAD, "last_error": error, "updated_at": now, "dead_at": now}
+            logger.error(f"☠️ Mem0 upload of email {entry['email_id']} for user_id {entry['user_id']} dead-lettered after {entry['attempts']} attempts: {error}")
+        else:
+            delay = MEM0_OUTBOX_RETRY_CONFIG.get_delay(entry["attempts"] - 1)
+            update = {"status": STATUS_PENDING, "last_error": error, "updated_at": now,
+                      "available_at": now + timedelta(seconds=delay)}
+        # Only while we still hold the lease; otherwise another worker owns the entry now
+        operations.append(UpdateOne({"_id": entry["_id"], "leased_by": entry["leased_by"]}, {"$set": update}))
+    if operations:
+        await mem0_outbox_collection.bulk_write(operations, ordered=False)
+
+
+async def process_uploads(entries):
+    """
+    Upload the claimed entries of one user to Mem0 from the stored emails and settle them:
+    uploaded entries are deleted, failed ones retried later or dead-lettered. Entries
+    whose email is no longer stored are dropped. Returns {"uploaded", "failed", "dropped",
+    "chars_saved", "tokens_saved", "truncated"}, which are also added to the user's
+    mailbox stats.
+    """
+    counts = {"uploaded": 0, "failed": 0, "dropped": 0, "chars_saved": 0, "tokens_saved": 0, "truncated": 0}
+    if not entries:
+        return counts
+    user_id = entries[0]["user_id"]
+    email_ids = [entry["email_id"] for entry in entries]
+    emails = await emails_collection.find({"user_id": user_id, "id": {"$in": email_ids}}, _EMAIL_FIELDS).to_list(length=None)
+    for email_item in emails:
+        email_item["body"] = read_body(email_item)
+        email_item.pop("body_codec", None)
+    stored_ids = {email_item["id"] for email_item in emails}
+
+    uploaded_ids, errors = set(), {}
+    if emails:
+        try:
+            result = await upload_emails_to_mem0(user_id, emails)
+            uploaded_ids = set(result["uploaded"])
+            for key in ("chars_saved", "tokens_saved", "truncated"):
+                counts[key] = result[key]
+            errors = {error.get("email_id"): error["error"] for error in result.get("errors", [])}
+            await mark_uploaded_to_mem0(
+                user_id, [email_item for email_item in emails if email_item["id"] in uploaded_ids], result["memory_ids"]
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Mem0 outbox upload failed for user_id {user_id}: {str(e)}")
+            errors = {email_id: str(e) for email_id in stored_ids}
+
+    finished = [entry["_id"] for entry in entries if entry["email_id"] in uploaded_ids or entry["email_id"] not in stored_ids]
+    if finished:
+        # The entries of one claim share its lease token
+        await mem0_outbox_collection.delete_many({"_id": {"$in": finished}, "leased_by": entries[0]["leased_by"]})
+    failed = [entry for entry in entries if entry["email_id"] in stored_ids and entry["email_id"] not in uploaded_ids]
+    await _settle_failed(failed, errors)
+    counts.update(uploaded=len(uploaded_ids), failed=len(failed), dropped=len(entries) - len(stored_ids))
+    await record_mem0_uploads(user_id, counts)
+    return counts
+
+
+async def run_outbox_worker(worker_id=None, poll_seconds=None):
+    """Claim and process outbox entries until cancelled, sleeping when nothing is due."""
+    worker_id = worker_id or f"mem0-outbox-{uuid.uuid4().hex[:8]}"
+    poll_seconds = MEM0_OUTBOX_POLL_SECONDS if poll_seconds is None else poll_seconds
+    logger.info(f"📮 Mem0 outbox worker {worker_id} started")
+    while True:
+        try:
+            entries = await claim_uploads(worker_id)
+            if not entries:
+                await asyncio.sleep(poll_seconds)
+                continue
+            counts = await process_uploads(entries)
+            logger.info(f"📮 Mem0 outbox worker {worker_id}: user_id {entries[0]['user_id']} uploaded {counts['uploaded']}, failed {counts['failed']}, dropped {counts['dropped']}, saved {counts['chars_saved']} chars / {counts['tokens_saved']} tokens")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Leases of the entries in hand expire and another pass picks them up
+            logger.error(f"❌ Mem0 outbox worker {worker_id} error: {str(e)}", exc_info=True)
+            await asyncio.sleep(poll_seconds)
+
+
+def start_outbox_workers(count=None):
+    """Start the worker pool as tasks on the running loop and return them."""
+    count = MEM0_OUTBOX_WORKERS if count is None else count
+    return [asyncio.create_task(run_outbox_worker()) for _ in range(count)]
+
+
+async def stop_outbox_workers(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def outbox_counts(user_id):
+    """{status: count} of the user's outbox entries."""
+    pipeline = [{"$match": {"user_id": user_id}}, {"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+    counts = {STATUS_PENDING: 0, STATUS_LEASED: 0, STATUS_DEAD: 0}
+    async for row in mem0_outbox_collection.aggregate(pipeline):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+
+async def requeue_dead_uploads(user_id=None):
+    """Give dead-lettered entries (of one user, or all) a fresh set of attempts. Returns the count."""
+    query = {"status": STATUS_DEAD}
+    if user_id:
+        query["user_id"] = user_id
+    now = datetime.now()
+    result = await mem0_outbox_collection.update_many(
+        query, {"$set": {"status": STATUS_PENDING, "attempts": 0, "available_at": now, "updated_at": now}}
+    )
+    return result.modified_count
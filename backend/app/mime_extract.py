@@ -0,0 +1,121 @@
+import base64
+import binascii
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHARSET = 'utf-8'
+
+
+def _header_value(part, name):
+    """Case-insensitive lookup of a header on a Gmail payload part."""
+    name = name.lower()
+    for header in part.get('headers') or []:
+        if header.get('name', '').lower() == name:
+            return header.get('value', '')
+    return ''
+
+
+def _content_type_params(value):
+    """Split 'text/plain; charset="UTF-8"' into ('text/plain', {'charset': 'UTF-8'})."""
+    pieces = value.split(';')
+    params = {}
+    for piece in pieces[1:]:
+        key, sep, param_value = piece.partition('=')
+        if sep:
+            params[key.strip().lower()] = param_value.strip().strip('"\'')
+    return pieces[0].strip().lower(), params
+
+
+def get_part_charset(part, default=DEFAULT_CHARSET):
+    """Charset declared in the part's Content-Type header, normalised to a known codec name."""
+    _, params = _content_type_params(_header_value(part, 'Content-Type'))
+    charset = params.get('charset') or default
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        logger.debug(f"Unknown charset '{charset}', falling back to {default}")
+        return default
+
+
+def is_attachment(part):
+    """Attachments are recognised from Gmail's metadata alone, before any data is decoded."""
+    if part.get('filename'):
+        return True
+    if part.get('body', {}).get('attachmentId'):
+        return True
+    return _header_value(part, 'Content-Disposition').lower().startswith('attachment')
+
+
+def decode_part_data(data, charset=DEFAULT_CHARSET, max_bytes=None):
+    """
+    Decode a part's base64url body into text.
+
+    With max_bytes only the base64 prefix needed for that many bytes is decoded, so huge
+    parts are never materialised in full. A multibyte character cut by the limit is
+    dropped rather than replaced.
+    """
+    truncated = False
+    if max_bytes is not None and len(data) > (max_bytes // 3 + 1) * 4:
+        data = data[:(max_bytes // 3 + 1) * 4]
+        truncated = True
+    # Gmail usually pads, but tolerate unpadded base64url
+    data += '=' * (-len(data) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(data)
+    except (binascii.Error, ValueError) as e:
+        logger.warning(f"Failed to base64-decode body part: {str(e)}")
+        return ''
+    if max_bytes is not None and len(raw) > max_bytes:
+        raw = raw[:max_bytes]
+        truncated = True
+    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    return decoder.decode(raw, final=not truncated)
+
+
+def iter_parts(payload):
+    """Depth-first walk of a payload's part tree in document order, skipping attachment subtrees."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        if is_attachment(part):
+            continue
+        yield part
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+
+
+def extract_body(payload, max_bytes=None):
+    """
+    Find the message text in a Gmail messages.get payload.
+
+    Walks the part tree once, preferring the first text/plain part over the first
+    text/html part, honours each part's charset and never decodes attachments.
+    Returns (text, mime_type); mime_type is 'text/plain', 'text/html' or None when the
+    message has no usable text part. HTML is returned as-is for the caller to convert.
+    """
+    top_level_charset = get_part_charset(payload)
+    html_part = None
+
+    for part in iter_parts(payload):
+        mime_type = (part.get('mimeType') or '').lower()
+        if mime_type not in ('text/plain', 'text/html'):
+            continue
+        if not part.get('body', {}).get('data'):
+            continue
+        if mime_type == 'text/plain':
+            return _decode(part, payload, top_level_charset, max_bytes), mime_type
+        if html_part is None:
+            html_part = part
+
+    if html_part is not None:
+        return _decode(html_part, payload, top_level_charset, max_bytes), 'text/html'
+    return '', None
+
+
+def _decode(part, payload, top_level_charset, max_bytes):
+    # Single-part messages carry Content-Type on the payload itself
+    charset = top_level_charset if part is payload else get_part_charset(part, default=top_level_charset)
+    return decode_part_data(part['body']['data'], charset=charset, max_bytes=max_bytes)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from app.db import sync_checkpoints_collection, users_collection
+
+logger = logging.getLogger(__name__)
+
+# A running sync refreshes its checkpoint's heartbeat this often, however slow its stages are
+SYNC_CHECKPOINT_HEARTBEAT_SECONDS = int(os.getenv("SYNC_CHECKPOINT_HEARTBEAT_SECONDS", "60"))
+# A checkpoint whose heartbeat is this old belongs to a sync that is no longer running
+SYNC_CHECKPOINT_STALE_SECONDS = int(os.getenv("SYNC_CHECKPOINT_STALE_SECONDS", "600"))
+# Gmail page tokens do not live forever; older checkpoints are dropped and the sync starts over
+SYNC_CHECKPOINT_MAX_AGE_SECONDS = int(os.getenv("SYNC_CHECKPOINT_MAX_AGE_SECONDS", str(24 * 3600)))
+
+# Checkpoint stages, in order
+STAGE_STARTED = "started"          # historyId recorded, nothing stored yet
+STAGE_SYNCING = "syncing"          # chunks are being stored and uploaded
+STAGE_FINALIZING = "finalizing"    # every chunk is done, the user document is not updated yet
+
+
+async def load_sync_checkpoint(user_id):
+    """
+    Return the checkpoint of an interrupted full sync for this user, or None.
+    Checkpoints older than SYNC_CHECKPOINT_MAX_AGE_SECONDS are discarded.
+    """
+    checkpoint = await sync_checkpoints_collection.find_one({"user_id": user_id})
+    if checkpoint is None:
+        return None
+    if datetime.now() - checkpoint["started_at"] > timedelta(seconds=SYNC_CHECKPOINT_MAX_AGE_SECONDS):
+        logger.warning(f"⚠️ Discarding sync checkpoint for user_id {user_id} started at {checkpoint['started_at']}")
+        await clear_sync_checkpoint(user_id)
+        return None
+    return checkpoint
+
+
+async def start_sync_checkpoint(user_id, history_id):
+    """Create the checkpoint for a new full sync and return it."""
+    now = datetime.now()
+    checkpoint = {
+        "user_id": user_id,
+        "stage": STAGE_STARTED,
+        "history_id": history_id,
+        "page_token": None,
+        "listed_count": 0,
+        "processed_ids": [],
+        "listed_ids": [],
+        "started_at": now,
+        "updated_at": now,
+        "heartbeat_at": now,
+    }
+    await sync_checkpoints_collection.replace_one({"user_id": user_id}, checkpoint, upsert=True)
+    return checkpoint
+
+
+async def save_sync_checkpoint(user_id, stage=STAGE_SYNCING, position=None, processed_ids=None, listed_ids=None, **fields):
+    """
+    Advance a checkpoint. position is the iter_email_chunks cursor of the chunk that just
+    finished ({"page_token", "listed_count"}), processed_ids the emails it carried and
+    listed_ids the ids listed since the last save. Listed ids include emails whose fetch
+    failed, which a resumed sync does not list again but must not delete.
+    """
+    now = datetime.now()
+    update = {"$set": {"stage": stage, "updated_at": now, "heartbeat_at": now, **fields}}
+    if position is not None:
+        update["$set"]["page_token"] = position.get("page_token")
+        update["$set"]["listed_count"] = position.get("listed_count", 0)
+    if processed_ids:
+        update.setdefault("$push", {})["processed_ids"] = {"$each": list(processed_ids)}
+    if listed_ids:
+        update.setdefault("$push", {})["listed_ids"] = {"$each": list(listed_ids)}
+    await sync_checkpoints_collection.update_one({"user_id": user_id}, update)
+
+
+async def heartbeat_sync_checkpoint(user_id):
+    """Mark the user's sync as still running without advancing its checkpoint."""
+    await sync_checkpoints_collection.update_one({"user_id": user_id}, {"$set": {"heartbeat_at": datetime.now()}})
+
+
+@asynccontextmanager
+async def sync_checkpoint_heartbeat(user_id, interval=None):
+    """
+    Refresh the checkpoint's heartbeat every interval (SYNC_CHECKPOINT_HEARTBEAT_SECONDS)
+    seconds while the block runs, so a slow chunk does not look like a dead sync.
+    """
+    interval = SYNC_CHECKPOINT_HEARTBEAT_SECONDS if interval is None else interval
+
+    async def beat():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await heartbeat_sync_checkpoint(user_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not refresh sync heartbeat for user_id {user_id}: {str(e)}")
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+async def clear_sync_checkpoint(user_id):
+    await sync_checkpoints_collection.delete_one({"user_id": user_id})
+
+
+async def reset_interrupted_syncs(stale_seconds=None):
+    """
+    Hand syncs that stopped without finishing (process restart, crash) back to the scheduler.
+
+    A running sync refreshes its heartbeat (sync_checkpoint_heartbeat), so a stale one
+    means nobody is working on that sync any more, but the user still has
+    fetched_email=true and the background worker would never pick it up again.
+    Checkpoints written before heartbeats existed are judged by updated_at.
+    Returns the ids of the users that were reset.
+    """
+    stale_seconds = SYNC_CHECKPOINT_STALE_SECONDS if stale_seconds is None else stale_seconds
+    cutoff = datetime.now() - timedelta(seconds=stale_seconds)
+    stale = {"$or": [
+        {"heartbeat_at": {"$lt": cutoff}},
+        {"heartbeat_at": {"$exists": False}, "updated_at": {"$lt": cutoff}},
+    ]}
+    user_ids = [
+        checkpoint["user_id"]
+        async for checkpoint in sync_checkpoints_collection.find(stale, {"user_id": 1})
+    ]
+    if user_ids:
+        result = await users_collection.update_many(
+            {"user_id": {"$in": user_ids}, "fetched_email": True},
+            {"$set": {"fetched_email": False}}
+        )
+        logger.info(f"🔄 Found {len(user_ids)} interrupted sync(s), {result.modified_count} user(s) queued to resume")
+    return user_ids
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import random
 from typing import Any, Callable, Dict, List, Optional
 from functools import wraps
 import traceback
@@ -9,19 +10,42 @@ logger = logging.getLogger(__name__)
 
 class RetryConfig:
     """Configuration for retry mechanisms"""
-    def __init__(self, max_attempts: int = 3, delay: float = 1.0, backoff_factor: float = 2.0):
+    def __init__(self, max_attempts: int = 3, delay: float = 1.0, backoff_factor: float = 2.0,
+                 max_delay: Optional[float] = None, jitter: bool = False):
         self.max_attempts = max_attempts
         self.delay = delay
         self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Backoff before retry number attempt + 1, capped at max_delay. With jitter the
+        delay is drawn uniformly from [0, backoff] so concurrent callers spread out.
+        """
+        delay = self.delay * (self.backoff_factor ** attempt)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
 
 async def retry_async(
     func: Callable,
     config: RetryConfig = None,
     exceptions: tuple = (Exception,),
-    context: str = "operation"
+    context: str = "operation",
+    should_retry: Optional[Callable[[Exception], bool]] = None,
+    retry_after: Optional[Callable[[Exception], Optional[float]]] = None,
+    on_retry: Optional[Callable[[Exception, float], None]] = None
 ) -> Any:
     """
     Retry an async function with exponential backoff.
+
+    should_retry decides whether a caught exception is worth another attempt (others are
+    re-raised at once). retry_after may return a server-requested wait in seconds, which
+    is used when it is longer than the backoff. on_retry(exception, delay) is called
+    before each sleep.
     """
     if config is None:
         config = RetryConfig()
@@ -37,11 +61,18 @@ async def retry_async(
             return result
             
         except exceptions as e:
+            if should_retry is not None and not should_retry(e):
+                raise
             last_exception = e
             logger.warning(f"⚠️ {context} failed on attempt {attempt + 1}: {str(e)}")
             
             if attempt < config.max_attempts - 1:
-                delay = config.delay * (config.backoff_factor ** attempt)
+                delay = config.get_delay(attempt)
+                requested = retry_after(e) if retry_after is not None else None
+                if requested is not None:
+                    delay = max(delay, requested)
+                if on_retry is not None:
+                    on_retry(e, delay)
                 logger.info(f"⏰ Retrying {context} in {delay:.2f} seconds...")
                 await asyncio.sleep(delay)
             else:
@@ -0,0 +1,248 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import re
+import uuid
+
+import numpy as np
+
+from app.mem0_ingest import preprocess_body
+
+try:
+    from qdrant_client import AsyncQdrantClient, models
+except ImportError:
+    AsyncQdrantClient = None
+    models = None
+
+logger = logging.getLogger(__name__)
+
+# Where query_mem0 looks for context: "mem0" (remote Mem0 search) or "qdrant" (the local
+# index below). With "qdrant", syncs also keep the index up to date.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "mem0").lower()
+# Embedded, on-disk Qdrant storage. Only one process can open it at a time, and search is
+# a brute-force scan of the user's chunks; set QDRANT_URL to use a Qdrant server instead.
+QDRANT_PATH = os.getenv("QDRANT_PATH", "./qdrant_data")
+QDRANT_URL = os.getenv("QDRANT_URL")
+# "hash" (local, deterministic, no network) or "openai"
+QDRANT_EMBEDDER = os.getenv("QDRANT_EMBEDDER", "hash").lower()
+QDRANT_HASH_DIM = int(os.getenv("QDRANT_HASH_DIM", "512"))
+QDRANT_OPENAI_MODEL = os.getenv("QDRANT_OPENAI_MODEL", "text-embedding-3-small")
+# Email bodies are indexed in chunks of this many tokens, at most QDRANT_MAX_CHUNKS per email
+QDRANT_CHUNK_TOKENS = int(os.getenv("QDRANT_CHUNK_TOKENS", "256"))
+QDRANT_MAX_CHUNKS = int(os.getenv("QDRANT_MAX_CHUNKS", "32"))
+QDRANT_SEARCH_LIMIT = int(os.getenv("QDRANT_SEARCH_LIMIT", "25"))
+
+# Point ids are uuid5 of "<email id>:<chunk>" in this namespace, so reindexing overwrites
+_POINT_NAMESPACE = uuid.UUID("6f1c1a52-3f0e-4c59-9a43-8d1d2f0e7b11")
+_WORD = re.compile(r'\w+')
+
+
+@functools.lru_cache(maxsize=65536)
+def _feature_bucket(feature, dim):
+    # Mail vocabulary repeats heavily, so most features are hashed once per process
+    digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+    return digest % dim, 1.0 if digest >> 63 else -1.0
+
+
+class HashEmbedder:
+    """
+    Deterministic local embedder: words and word pairs are hashed into dim signed
+    buckets (the hashing trick), counts are damped with log1p and the vector is
+    normalized. No model or network; close texts share words, so they land close.
+    """
+
+    def __init__(self, dim=None):
+        self.dim = dim or QDRANT_HASH_DIM
+        self.name = f"hash{self.dim}"
+
+    def embed_one(self, text):
+        words = _WORD.findall(text.lower())
+        buckets = [_feature_bucket(feature, self.dim) for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]]
+        if not buckets:
+            return [0.0] * self.dim
+        indexes, signs = zip(*buckets)
+        vector = np.bincount(indexes, weights=signs, minlength=self.dim)
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector) or 1.0
+        return (vector / norm).tolist()
+
+    def embed(self, texts):
+        return [self.embed_one(text) for text in texts]
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI API (OPENAI_API_KEY)."""
+
+    # Output sizes of the OpenAI embedding models
+    DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+    def __init__(self, model=None):
+        import openai
+        self._openai = openai
+        self.model = model or QDRANT_OPENAI_MODEL
+        self.dim = self.DIMENSIONS.get(self.model, 1536)
+        self.name = f"openai-{self.model}"
+
+    def embed(self, texts):
+        response = self._openai.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in response.data]
+
+
+# Any object with dim, name and embed(texts) -> vectors can stand in; see set_embedder
+EMBEDDERS = {"hash": HashEmbedder, "openai": OpenAIEmbedder}
+
+_embedder = None
+_client = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        if QDRANT_EMBEDDER not in EMBEDDERS:
+            raise ValueError(f"Unknown QDRANT_EMBEDDER {QDRANT_EMBEDDER!r}, expected one of {sorted(EMBEDDERS)}")
+        _embedder = EMBEDDERS[QDRANT_EMBEDDER]()
+    return _embedder
+
+
+def set_embedder(embedder):
+    """Use embedder for indexing and search from now on. Its vectors go to their own collections."""
+    global _embedder
+    _embedder = embedder
+
+
+def get_client():
+    """The Qdrant client, embedded unless QDRANT_URL is set, opened on first use."""
+    global _client
+    if AsyncQdrantClient is None:
+        raise ImportError("qdrant-client is not installed. Install it using `pip install qdrant-client`.")
+    if _client is None:
+        if QDRANT_URL:
+            _client = AsyncQdrantClient(url=QDRANT_URL)
+            logger.info(f"Qdrant client connected to {QDRANT_URL}")
+        else:
+            _client = AsyncQdrantClient(path=QDRANT_PATH)
+            logger.info(f"Embedded Qdrant opened at {QDRANT_PATH}")
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("Qdrant client closed")
+
+
+def collection_name(user_id, embedder=None):
+    """One collection per user and embedder; vectors of different embedders never mix."""
+    embedder = embedder or get_embedder()
+    user_key = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()[:24]
+    return f"emails_{embedder.name}_{user_key}"
+
+
+def _point_id(email_id, chunk):
+    return str(uuid.uuid5(_POINT_NAMESPACE, f"{email_id}:{chunk}"))
+
+
+def email_chunks(email_item):
+    """The texts indexed for an email: its body in chunks, each headed by the subject."""
+    subject = email_item.get('subject') or 'N/A'
+    chunks, _ = preprocess_body(email_item.get('body'), QDRANT_CHUNK_TOKENS, QDRANT_MAX_CHUNKS)
+    return [f"Subject: {subject}\n{chunk}" for chunk in chunks]
+
+
+async def _ensure_collection(name, dim):
+    client = get_client()
+    if not await client.collection_exists(name):
+        await client.create_collection(name, vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE))
+
+
+async def index_emails(user_id, emails):
+    """
+    Index the emails' chunks in the user's collection. Emails indexed before with the
+    same content_hash are skipped; changed ones have their old chunks replaced.
+    Returns {"indexed", "skipped", "chunks"}.
+    """
+    if not emails:
+        return {"indexed": 0, "skipped": 0, "chunks": 0}
+    embedder = get_embedder()
+    name = collection_name(user_id, embedder)
+    await _ensure_collection(name, embedder.dim)
+    client = get_client()
+
+    # The first chunk of every indexed email carries its content_hash
+    existing = await client.retrieve(name, ids=[_point_id(email_item['id'], 0) for email_item in emails], with_payload=["email_id", "content_hash"])
+    indexed_hashes = {point.payload["email_id"]: point.payload.get("content_hash") for point in existing}
+    changed = [
+        email_item for email_item in emails
+        if not email_item.get('content_hash') or indexed_hashes.get(email_item['id']) != email_item['content_hash']
+    ]
+    if not changed:
+        return {"indexed": 0, "skipped": len(emails), "chunks": 0}
+
+    texts, payloads = [], []
+    for email_item in changed:
+        for chunk, text in enumerate(email_chunks(email_item)):
+            texts.append(text)
+            payloads.append({
+                "email_id": email_item['id'], "chunk": chunk, "text": text,
+                "subject": email_item.get('subject'), "content_hash": email_item.get('content_hash'),
+            })
+    # Embedding is CPU or network bound; keep it off the event loop
+    vectors = await asyncio.to_thread(embedder.embed, texts)
+
+    reindexed = [email_item['id'] for email_item in changed if email_item['id'] in indexed_hashes]
+    if reindexed:
+        await _delete_points(name, models.FieldCondition(key="email_id", match=models.MatchAny(any=reindexed)))
+    # One Batch rather than a PointStruct per chunk: the client inspects every PointStruct
+    # for inference objects, which costs more than the upsert itself
+    await client.upsert(name, points=models.Batch(
+        ids=[_point_id(payload["email_id"], payload["chunk"]) for payload in payloads],
+        vectors=vectors,
+        payloads=payloads,
+    ))
+    return {"indexed": len(changed), "skipped": len(emails) - len(changed), "chunks": len(texts)}
+
+
+async def _delete_points(name, condition, negate=False):
+    query_filter = models.Filter(must_not=[condition]) if negate else models.Filter(must=[condition])
+    await get_client().delete(name, points_selector=models.FilterSelector(filter=query_filter))
+
+
+async def delete_indexed_emails(user_id, email_ids):
+    """Remove the given emails from the user's index."""
+    name = collection_name(user_id)
+    if email_ids and await get_client().collection_exists(name):
+        await _delete_points(name, models.FieldCondition(key="email_id", match=models.MatchAny(any=list(email_ids))))
+
+
+async def delete_missing_indexed_emails(user_id, keep_ids):
+    """Remove the user's indexed emails whose id is not in keep_ids."""
+    name = collection_name(user_id)
+    if not await get_client().collection_exists(name):
+        return
+    if not keep_ids:
+        await get_client().delete_collection(name)
+        return
+    await _delete_points(name, models.FieldCondition(key="email_id", match=models.MatchAny(any=list(keep_ids))), negate=True)
+
+
+async def search_index(user_id, query, limit=None):
+    """
+    The user's chunks closest to query, best first, shaped like Mem0 search results:
+    [{"memory": text, "email_id", "subject", "score"}]. Empty if nothing is indexed.
+    """
+    embedder = get_embedder()
+    name = collection_name(user_id, embedder)
+    client = get_client()
+    if not await client.collection_exists(name):
+        return []
+    # As an array the client takes the vector as is instead of inspecting every element
+    vector = np.asarray((await asyncio.to_thread(embedder.embed, [query]))[0])
+    response = await client.query_points(name, query=vector, limit=limit or QDRANT_SEARCH_LIMIT, with_payload=True)
+    return [
+        {"memory": point.payload["text"], "email_id": point.payload["email_id"], "subject": point.payload.get("subject"), "score": point.score}
+        for point in response.points
+    ]
@@ -0,0 +1,53 @@
+"""
+Benchmark: serial vs concurrent vs batched Gmail message detail fetches.
+
+Runs app.gmail.fetch_emails against FakeGmailHttp and reports HTTP round trips
+and wall-clock time normalised to 1000 messages. Every run is paced by its own
+GmailQuotaBucket (250 units/s by default, like the real per-user Gmail quota).
+
+    cd backend && python -m benchmarks.bench_gmail_batch --messages 1000 --latency 0.02
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app.gmail import fetch_emails, GmailFetchStats, GmailQuotaBucket
+from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service
+
+
+def run(mode, messages, latency, per_item_latency, quota, concurrency):
+    http = FakeGmailHttp(messages, latency=latency, per_item_latency=per_item_latency)
+    service = build_fake_service(http)
+    stats = GmailFetchStats()
+    start = time.perf_counter()
+    bucket = GmailQuotaBucket(units_per_second=quota)
+    emails = asyncio.run(fetch_emails(
+        service, 'me', max_results=messages, fetch_mode=mode, stats=stats,
+        concurrency=concurrency, quota_bucket=bucket
+    ))
+    elapsed = time.perf_counter() - start
+    scale = 1000 / max(len(emails), 1)
+    print(
+        f"{mode:>10}: {len(emails)} emails | round trips {http.round_trips} "
+        f"({http.round_trips * scale:.0f} per 1000) | {elapsed:.2f}s ({elapsed * scale:.2f}s per 1000)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per HTTP round trip")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="simulated server seconds per message")
+    parser.add_argument("--quota", type=float, default=250, help="quota units per second for the token bucket")
+    parser.add_argument("--concurrency", type=int, default=None, help="HTTP calls in flight (default GMAIL_FETCH_CONCURRENCY)")
+    parser.add_argument("--modes", default="serial,concurrent,batch")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    for mode in args.modes.split(","):
+        run(mode, args.messages, args.latency, args.per_item_latency, args.quota, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
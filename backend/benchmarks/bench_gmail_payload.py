@@ -0,0 +1,65 @@
+"""
+Benchmark: bytes over the wire for full and masked messages.get payloads.
+
+Runs app.gmail.fetch_emails (batch mode) against FakeGmailHttp, which honours the
+`fields` mask, and reports the response bytes FakeGmailHttp actually sent per message,
+the saving against the full run, quota units and wall-clock time. Every --nested-every
+message gets --nested-depth extra multipart levels, deeper than the mask reaches, so
+those are fetched again unmasked.
+
+    cd backend && python -m benchmarks.bench_gmail_payload --messages 1000
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app.gmail import fetch_emails, GmailFetchStats, GmailQuotaBucket
+from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service, nest_message
+
+
+def run(payload_mode, messages, latency, nested_every, nested_depth):
+    http = FakeGmailHttp(messages, latency=latency)
+    if nested_every:
+        for message in http.messages[::nested_every]:
+            nest_message(message, nested_depth)
+    service = build_fake_service(http)
+    stats = GmailFetchStats()
+    bucket = GmailQuotaBucket(units_per_second=1e9)
+    start = time.perf_counter()
+    emails = asyncio.run(fetch_emails(
+        service, 'me', max_results=messages, fetch_mode="batch", stats=stats,
+        quota_bucket=bucket, payload_mode=payload_mode
+    ))
+    elapsed = time.perf_counter() - start
+    return emails, http.bytes_sent, stats, bucket.units_consumed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per HTTP round trip")
+    parser.add_argument("--modes", default="full,masked")
+    parser.add_argument("--nested-every", type=int, default=20, help="0 keeps every message shallow")
+    parser.add_argument("--nested-depth", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    bodies = {}
+    full_bytes = None
+    for mode in args.modes.split(","):
+        emails, wire_bytes, stats, units, elapsed = run(mode, args.messages, args.latency, args.nested_every, args.nested_depth)
+        full_bytes = wire_bytes if mode == "full" else full_bytes
+        saved = f"saved {(1 - wire_bytes / full_bytes) * 100:.1f}% vs full" if full_bytes else "no full run to compare"
+        print(
+            f"{mode:>6}: {len(emails)} emails | wire {wire_bytes / 1024:.0f} KiB "
+            f"({wire_bytes / max(len(emails), 1):.0f} B/msg), {saved} | refetched {stats.refetched} | "
+            f"quota units {units} | {elapsed:.2f}s"
+        )
+        bodies[mode] = [(e["id"], e["subject"], e["body"]) for e in emails]
+    reference = next(iter(bodies.values()))
+    print("parsed emails identical across modes:", all(b == reference for b in bodies.values()))
+
+
+if __name__ == "__main__":
+    main()
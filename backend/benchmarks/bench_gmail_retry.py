@@ -0,0 +1,73 @@
+"""
+Benchmark: sync completeness and cost under Gmail throttling, with and without retries.
+
+FakeGmailHttp rejects a share of list/get calls (batched sub-requests included) with
+429 and a Retry-After header. Each fetch mode is run once with a single attempt per
+call, which is how the fetch behaved before retries (throttled messages dropped, a
+throttled list page ending the sync), and once with the jittered-backoff policy of
+app.gmail. We report how much of the mailbox arrived, retries, backoff time, quota
+units consumed and wall-clock time. Delays are scaled down so the run stays short.
+
+    cd backend && python -m benchmarks.bench_gmail_retry --messages 1000 --throttle-rate 0.1
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import app.gmail as gmail
+from app.gmail import fetch_emails, GmailFetchStats, GmailQuotaBucket
+from app.utils import RetryConfig
+from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service
+
+
+def run(label, mode, retry_config, args):
+    http = FakeGmailHttp(
+        args.messages, latency=args.latency, per_item_latency=args.per_item_latency,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed
+    )
+    service = build_fake_service(http)
+    stats = GmailFetchStats()
+    gmail.GMAIL_RETRY_CONFIG = retry_config
+    start = time.perf_counter()
+    try:
+        emails = asyncio.run(fetch_emails(
+            service, 'me', max_results=args.messages, fetch_mode=mode, stats=stats,
+            quota_bucket=GmailQuotaBucket(units_per_second=args.quota)
+        ))
+        outcome = f"{len(emails)}/{args.messages} emails"
+    except Exception as e:
+        outcome = f"sync failed ({str(e)[:40]}...)"
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>8} {mode:>10}: {outcome} | throttled {http.throttled} | retries {stats.retries} "
+        f"| backoff {stats.backoff_seconds:.1f}s | quota units {stats.quota_units} | {elapsed:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.01, help="simulated seconds per HTTP round trip")
+    parser.add_argument("--per-item-latency", type=float, default=0.0002, help="simulated server seconds per message")
+    parser.add_argument("--quota", type=float, default=2500, help="quota units per second for the token bucket")
+    parser.add_argument("--throttle-rate", type=float, default=0.1, help="share of calls rejected with 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--base-delay", type=float, default=0.02, help="first backoff step in seconds")
+    parser.add_argument("--attempts", type=int, default=gmail.GMAIL_RETRY_ATTEMPTS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", default="concurrent,batch")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    policies = {
+        "no retry": RetryConfig(max_attempts=1),
+        "retry": RetryConfig(max_attempts=args.attempts, delay=args.base_delay, max_delay=args.base_delay * 32, jitter=True),
+    }
+    for mode in args.modes.split(","):
+        for label, config in policies.items():
+            run(label, mode, config, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark: cost of building a Gmail service per sync, before and after caching the
+discovery document.
+
+"before" is the old googleapiclient.discovery.build('gmail', 'v1', ...) call, which
+re-reads and parses the discovery document every time. "after" is
+app.gmail.build_gmail_service, which loads the document text once per process and
+parses a fresh copy per build, as build_from_document mutates the dict it is given.
+
+    cd backend && python -m benchmarks.bench_gmail_service_build --iterations 200
+"""
+import argparse
+import logging
+import time
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+import app.gmail as gmail
+
+
+def timed(label, func, iterations):
+    start = time.perf_counter()
+    func()
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call = (time.perf_counter() - start) / iterations
+    print(f"{label:>7}: first call {first * 1000:.2f} ms | steady state {per_call * 1000:.3f} ms/build")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    creds = Credentials(token="benchmark-token")
+    before = timed("before", lambda: build('gmail', 'v1', credentials=creds, cache_discovery=False), args.iterations)
+    gmail._gmail_discovery_document = None
+    after = timed("after", lambda: gmail.build_gmail_service("benchmark-token"), args.iterations)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
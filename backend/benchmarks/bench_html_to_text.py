@@ -0,0 +1,106 @@
+"""
+Benchmark: HTML-to-text throughput of app.html_to_text against the old regex clean_html.
+
+Inputs are a synthetic marketing newsletter (inline-styled nested tables, a large
+<style> block, MSO conditional comments, a tracking script), a plain transactional
+email and a few pathological documents (thousands of unterminated tags or comments).
+For each input we report MB/s for both converters (best of --repeat runs), the output
+size and whether script/style text leaked into the output.
+
+    cd backend && python -m benchmarks.bench_html_to_text --repeat 20
+"""
+import argparse
+import html
+import re
+import time
+
+from app.html_to_text import html_to_text
+
+STYLE_MARKER = "mso-line-height-rule"
+SCRIPT_MARKER = "trackOpen"
+
+
+def legacy_clean_html(raw_html):
+    """app.gmail.clean_html before app.html_to_text."""
+    text = re.sub('<[^<]+?>', '', raw_html)
+    text = html.unescape(text)
+    return text.strip()
+
+
+def marketing_email(products=120):
+    css = "".join(
+        f".c{i} {{ font-family: Helvetica, Arial, sans-serif; {STYLE_MARKER}: exactly; color: #{i:06x}; padding: 0 {i % 20}px; }}\n"
+        for i in range(600)
+    )
+    cell_style = 'style="padding:12px 24px;font-family:Helvetica,Arial,sans-serif;font-size:14px;line-height:20px;color:#333333;"'
+    rows = "".join(
+        f'<tr><td class="c{i}" {cell_style} align="left" valign="top">'
+        f'<a href="https://shop.example.com/p/{i}?utm_source=newsletter&amp;utm_medium=email&amp;utm_campaign=spring" '
+        f'style="color:#0066cc;text-decoration:none;" target="_blank"><img src="https://cdn.example.com/img/{i}.jpg" '
+        f'width="180" height="180" alt="Product {i}" style="display:block;border:0;" /></a></td>'
+        f'<td {cell_style}><h3 style="margin:0;font-size:18px;">Product {i} &ndash; now 20&#37; off</h3>'
+        f'<p style="margin:8px 0 0 0;">Limited time offer on our best-selling item&nbsp;#{i}. '
+        f'Free shipping on orders over &pound;50.</p></td></tr>\n'
+        for i in range(products)
+    )
+    return (
+        "<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.0 Transitional//EN\" \"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd\">"
+        f"<html><head><meta charset=\"utf-8\"><title>Spring sale</title><style type=\"text/css\">{css}</style>"
+        "<!--[if mso]><xml><o:OfficeDocumentSettings><o:PixelsPerInch>96</o:PixelsPerInch></o:OfficeDocumentSettings></xml><![endif]-->"
+        "</head><body style=\"margin:0;padding:0;\">"
+        f"<script type=\"text/javascript\">function {SCRIPT_MARKER}(){{var i=new Image();i.src='https://t.example.com/o?id=1';}}</script>"
+        "<table role=\"presentation\" width=\"100%\" cellpadding=\"0\" cellspacing=\"0\" border=\"0\"><tbody>"
+        f"{rows}</tbody></table>"
+        "<p style=\"font-size:11px;color:#999999;\">You received this email because you subscribed. "
+        "<a href=\"https://shop.example.com/unsubscribe\">Unsubscribe</a></p></body></html>"
+    )
+
+
+def transactional_email():
+    return (
+        "<html><body><div>Hi Alex,</div><div><br></div><div>Your order #10423 has shipped and should arrive "
+        "on Tuesday.</div><div><br></div><div>Thanks,<br>The Example team</div></body></html>"
+    )
+
+
+CORPUS = {
+    "marketing": marketing_email(),
+    "transactional": transactional_email() * 200,
+    "unterminated tags": "<a" * 200000,
+    "unterminated comment": "<!--" + "x" * 400000,
+    "bare brackets": "1 < 2 and 3 <4 " * 30000,
+    "many tiny tags": "<b>a</b>" * 100000,
+}
+
+
+def throughput(func, document, repeat):
+    """MB/s of the fastest of repeat runs, which is far less noisy than the mean, and the text."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(document)
+        best = min(best, time.perf_counter() - start)
+    return len(document.encode("utf-8")) / best / 1e6, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-chars", type=int, default=None, help="output limit passed to html_to_text")
+    args = parser.parse_args()
+
+    print(f"{'input':<22}{'size':>9}{'legacy MB/s':>13}{'new MB/s':>10}{'legacy out':>12}{'new out':>9}  leaks (legacy/new)")
+    for name, document in CORPUS.items():
+        legacy_speed, legacy_text = throughput(legacy_clean_html, document, args.repeat)
+        new_speed, new_text = throughput(lambda d: html_to_text(d, max_chars=args.max_chars), document, args.repeat)
+        leaks = [
+            f"{STYLE_MARKER in text or SCRIPT_MARKER in text}" for text in (legacy_text, new_text)
+        ]
+        print(
+            f"{name:<22}{len(document) / 1024:>7.0f}KB{legacy_speed:>13.1f}{new_speed:>10.1f}"
+            f"{len(legacy_text):>12}{len(new_text):>9}  {'/'.join(leaks)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: upload_emails_to_mem0 throughput by MEM0_UPLOAD_CONCURRENCY and
+MEM0_UPLOAD_BATCH_SIZE.
+
+The real AsyncMemoryClient talks HTTP to a local FakeMem0Server that answers each add
+after --latency seconds plus --per-message seconds per email in it, and fails
+--error-rate of the adds with HTTP 500. For every concurrency level and batch size we
+report emails per second, the requests made, the peak number of adds the server saw in
+flight and the success/failure counts. A failed batch fails all of its emails. Compare the
+times across batch sizes with the "saved" estimate, which assumes fixed cost per request.
+
+    cd backend && python -m benchmarks.bench_mem0_upload --messages 500
+    cd backend && python -m benchmarks.bench_mem0_upload --concurrency 8 --batch-size 1,5,10,20
+"""
+import argparse
+import asyncio
+import logging
+import time
+import warnings
+
+from benchmarks.fake_mem0 import FakeMem0Server
+
+from mem0 import AsyncMemoryClient
+
+from app import mem0_agent
+
+
+def build_mailbox(count):
+    return [
+        {"id": f"msg{i:06d}", "subject": f"Subject {i}", "snippet": "snippet " * 10, "body": "body text " * 80}
+        for i in range(count)
+    ]
+
+
+async def run(server, mailbox, concurrency, batch_size):
+    mem0_agent.aclient = AsyncMemoryClient(api_key="bench", host=server.url)
+    mem0_agent.MEM0_UPLOAD_CONCURRENCY = concurrency
+    mem0_agent.MEM0_UPLOAD_BATCH_SIZE = batch_size
+    server.reset()
+    start = time.perf_counter()
+    try:
+        result = await mem0_agent.upload_emails_to_mem0("bench", mailbox)
+    finally:
+        await mem0_agent.aclient.async_client.aclose()
+    elapsed = time.perf_counter() - start
+    print(
+        f"concurrency {concurrency:>3}, batch {batch_size:>3}: {len(mailbox) / elapsed:7.1f} emails/s | {elapsed:6.2f}s "
+        f"| {result['requests']:>4} requests ({result['requests_saved']} saved, ~{result['seconds_saved']:.2f}s) "
+        f"| max in flight {server.max_in_flight:>3} | uploaded {len(result['uploaded'])}, failed {result['failed']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per Mem0 add")
+    parser.add_argument("--per-message", type=float, default=0.002, help="simulated seconds per email in an add")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--concurrency", default="1,4,8,16,32", help="comma separated levels")
+    parser.add_argument("--batch-size", default="1", help="comma separated emails per add")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    warnings.simplefilter("ignore")
+    server = FakeMem0Server(latency=args.latency, per_message=args.per_message, error_rate=args.error_rate).start()
+    mailbox = build_mailbox(args.messages)
+    try:
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            for batch_size in (int(size) for size in args.batch_size.split(",")):
+                server._random.seed(0)
+                asyncio.run(run(server, mailbox, concurrency, batch_size))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
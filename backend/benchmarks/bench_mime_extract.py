@@ -0,0 +1,136 @@
+"""
+Benchmark: MIME body extraction over a synthetic corpus of Gmail payloads.
+
+The corpus mixes the message shapes seen in a real mailbox: single-part plain and
+HTML, multipart/alternative, alternative nested in multipart/mixed and
+multipart/related, non-UTF-8 charsets and messages with large attachments whose
+data is inlined. Each shape is run through the old top-level-parts extraction and
+app.mime_extract.extract_body, reporting throughput and how many messages yield a
+real body instead of falling back to the snippet.
+
+    cd backend && python -m benchmarks.bench_mime_extract --messages 2000
+"""
+import argparse
+import base64
+import logging
+import random
+import time
+from collections import Counter
+
+from app.mime_extract import extract_body
+from app.gmail import GMAIL_MAX_BODY_BYTES
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _text(mime_type, text, charset='utf-8', filename=''):
+    return {
+        "mimeType": mime_type,
+        "filename": filename,
+        "headers": [{"name": "Content-Type", "value": f'{mime_type}; charset="{charset}"'}],
+        "body": {"data": _b64(text.encode(charset))},
+    }
+
+
+def _multi(mime_type, *parts):
+    return {"mimeType": mime_type, "filename": "", "headers": [], "body": {"size": 0}, "parts": list(parts)}
+
+
+def _attachment(size, inline_data):
+    body = {"size": size}
+    if inline_data:
+        body["data"] = _b64(bytes(random.getrandbits(8) for _ in range(256)) * (size // 256))
+    else:
+        body["attachmentId"] = "ANGjdJ" + "x" * 40
+    return {"mimeType": "application/pdf", "filename": "report.pdf", "headers": [], "body": body}
+
+
+def build_corpus(count, seed=7):
+    random.seed(seed)
+    plain = "Hi team,\n\nNotes from today's sync follow. " + "Lorem ipsum dolor sit amet. " * 60
+    html_body = "<html><body>" + "<p>Lorem ipsum dolor sit amet.</p>" * 60 + "</body></html>"
+    shapes = {
+        "plain": lambda: _text("text/plain", plain),
+        "html": lambda: _text("text/html", html_body),
+        "alternative": lambda: _multi("multipart/alternative", _text("text/plain", plain), _text("text/html", html_body)),
+        "mixed/alternative": lambda: _multi(
+            "multipart/mixed",
+            _multi("multipart/alternative", _text("text/plain", plain), _text("text/html", html_body)),
+            _attachment(200 * 1024, inline_data=False),
+        ),
+        "mixed/related/alternative": lambda: _multi(
+            "multipart/mixed",
+            _multi("multipart/related",
+                   _multi("multipart/alternative", _text("text/plain", plain), _text("text/html", html_body)),
+                   {"mimeType": "image/png", "filename": "logo.png", "headers": [], "body": {"attachmentId": "img"}}),
+        ),
+        "latin-1": lambda: _multi("multipart/alternative", _text("text/plain", "Grüße, café, naïve. " * 80, charset='iso-8859-1')),
+        "inline-attachment": lambda: _multi("multipart/mixed", _attachment(512 * 1024, inline_data=True), _text("text/plain", plain)),
+        "huge-plain": lambda: _text("text/plain", "A long log dump line.\n" * 200000),
+    }
+    names = list(shapes)
+    corpus = []
+    for i in range(count):
+        name = names[i % len(names)]
+        corpus.append((name, {"id": f"msg{i:06d}", "snippet": "snippet", "payload": shapes[name]()}))
+    return corpus
+
+
+def legacy_extract(payload):
+    """The extraction parse_gmail_message used before app.mime_extract: top-level parts, UTF-8 only."""
+    if 'parts' in payload:
+        for part in payload['parts']:
+            if part.get('mimeType') in ('text/plain', 'text/html') and part.get('body', {}).get('data'):
+                try:
+                    return base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+                except Exception:
+                    continue
+        return ""
+    data = payload.get('body', {}).get('data')
+    if not data:
+        return ""
+    try:
+        return base64.urlsafe_b64decode(data).decode('utf-8')
+    except Exception:
+        return ""
+
+
+def new_extract(payload):
+    return extract_body(payload, max_bytes=GMAIL_MAX_BODY_BYTES)[0]
+
+
+def run(label, extractor, corpus, repeat):
+    extracted = Counter()
+    total = Counter()
+    output_chars = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for shape, message in corpus:
+            body = extractor(message["payload"])
+            total[shape] += 1
+            if body:
+                extracted[shape] += 1
+            output_chars += len(body)
+    elapsed = time.perf_counter() - start
+    messages = len(corpus) * repeat
+    print(f"{label:>7}: {messages / elapsed:,.0f} msg/s | {elapsed:.2f}s | {output_chars / repeat / 1024 / 1024:.1f} MiB of text per pass")
+    for shape in total:
+        print(f"         {shape:<26} body found {extracted[shape] / total[shape]:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    corpus = build_corpus(args.messages)
+    run("legacy", legacy_extract, corpus, args.repeat)
+    run("new", new_extract, corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: one insert_many for the whole mailbox against app.db.ChunkedBulkWriter.
+
+FakeCollection stands in for a Motor collection. bulk_write encodes the documents to
+BSON one wire message at a time (48 MB, like the driver) and charges a simulated round
+trip plus transfer time per message. Both writers run on a clean mailbox and on a
+faulty one, where two documents fail validation and --transient-rate of the writes in
+each call fail with PrimarySteppedDown. We report peak traced memory, when the first
+call returns (the first documents the caller can act on), total time and how many
+documents were stored.
+
+    cd backend && python -m benchmarks.bench_mongo_writer --messages 2000
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+import tracemalloc
+
+import bson
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from app.db import ChunkedBulkWriter
+from app.utils import RetryConfig
+
+MAX_MESSAGE_BYTES = 48 * 1000 * 1000
+
+
+class _Result:
+    def __init__(self, inserted):
+        self.inserted_count = inserted
+        self.upserted_count = self.matched_count = self.modified_count = self.deleted_count = 0
+
+
+class FakeCollection:
+    def __init__(self, latency, bandwidth, bad_ids, transient_rate, seed=0):
+        self.name = "emails"
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.bad_ids = bad_ids
+        self.transient_rate = transient_rate
+        self.stored = set()
+        self.first_return = None
+        self._random = random.Random(seed)
+        self._start = time.perf_counter()
+
+    async def insert_many(self, documents, ordered=True):
+        return await self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+
+    async def bulk_write(self, operations, ordered=True):
+        errors, inserted, message, message_bytes = [], 0, [], 0
+        for index, operation in enumerate(operations):
+            document = operation._doc
+            encoded = bson.encode(document)
+            if message_bytes + len(encoded) > MAX_MESSAGE_BYTES:
+                await self._send(message_bytes)
+                message, message_bytes = [], 0
+            message.append(encoded)
+            message_bytes += len(encoded)
+            if document["id"] in self.bad_ids:
+                errors.append({"index": index, "code": 121, "errmsg": "Document failed validation"})
+            elif self._random.random() < self.transient_rate:
+                errors.append({"index": index, "code": 189, "errmsg": "PrimarySteppedDown"})
+            else:
+                self.stored.add(document["id"])
+                inserted += 1
+                continue
+            if ordered:
+                break
+        await self._send(message_bytes)
+        if self.first_return is None:
+            self.first_return = time.perf_counter() - self._start
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+        return _Result(inserted)
+
+    async def _send(self, size):
+        await asyncio.sleep(self.latency + size / self.bandwidth)
+
+
+def build_mailbox(count, seed=3):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"msg{i:06d}", "user_id": "bench", "subject": f"Subject {i}", "snippet": "snippet " * 10,
+            "body": "x" * (400_000 if rng.random() < 0.02 else 8_000),
+        }
+        for i in range(count)
+    ]
+
+
+async def insert_all(collection, mailbox):
+    try:
+        await collection.insert_many(mailbox)
+    except BulkWriteError:
+        pass
+
+
+async def chunked(collection, mailbox, max_ops, max_bytes):
+    writer = ChunkedBulkWriter(collection, max_ops=max_ops, max_bytes=max_bytes,
+                               retry_config=RetryConfig(max_attempts=3, delay=0.01, jitter=True))
+    for document in mailbox:
+        await writer.add(InsertOne(document), document)
+    return await writer.close()
+
+
+def run(label, coroutine_factory, mailbox, args, faulty):
+    bad_ids = {mailbox[i]["id"] for i in (10, len(mailbox) // 2)} if faulty else set()
+    collection = FakeCollection(args.latency, args.bandwidth * 1e6, bad_ids, args.transient_rate if faulty else 0.0)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = asyncio.run(coroutine_factory(collection))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    chunks = f" | {len(result['chunks'])} chunks, max {max(c['seconds'] for c in result['chunks']):.3f}s" if result else ""
+    print(
+        f"{label:>13} {'faulty' if faulty else 'clean':>7}: stored {len(collection.stored)}/{len(mailbox)} | peak {peak / 1e6:.1f} MB "
+        f"| first return {collection.first_return:.3f}s | total {elapsed:.2f}s{chunks}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated seconds per wire message")
+    parser.add_argument("--bandwidth", type=float, default=100, help="simulated MB/s to the server")
+    parser.add_argument("--transient-rate", type=float, default=0.01, help="share of writes failing transiently")
+    parser.add_argument("--max-ops", type=int, default=500)
+    parser.add_argument("--max-bytes", type=int, default=8 * 1024 * 1024)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    mailbox = build_mailbox(args.messages)
+    print(f"mailbox: {args.messages} emails, {sum(len(m['body']) for m in mailbox) / 1e6:.0f} MB of bodies")
+    for faulty in (False, True):
+        run("insert_many", lambda c: insert_all(c, mailbox), mailbox, args, faulty)
+        run("chunked", lambda c: chunked(c, mailbox, args.max_ops, args.max_bytes), mailbox, args, faulty)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: work saved by resuming an interrupted full sync from its checkpoint.
+
+A full sync over FakeGmailHttp is cut off once --interrupt-at of the mailbox has been
+processed, recording the same checkpoint the sync pipeline keeps in Mongo (page token
+and listed count of the last finished chunk, ids processed so far). The sync is then
+finished twice: restarting from page 1, as before checkpoints, and resuming from the
+checkpoint. Store and Mem0 upload are simulated by --process-latency seconds per
+email. We report Gmail round trips, quota units, emails processed again and time.
+
+    cd backend && python -m benchmarks.bench_sync_resume --messages 2000 --interrupt-at 0.5
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app.gmail import iter_email_chunks, GmailFetchStats, GmailQuotaBucket
+from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service
+
+
+async def sync(service, args, checkpoint, stop_after=None):
+    """Run the sync, advancing checkpoint after every chunk. Returns (stats, processed ids)."""
+    stats = GmailFetchStats()
+    cursor = {}
+    processed = []
+    chunks = iter_email_chunks(
+        service, 'me', max_results=args.messages, chunk_size=100, fetch_mode="batch", stats=stats,
+        quota_bucket=GmailQuotaBucket(units_per_second=args.quota), resume_from=checkpoint, cursor=cursor
+    )
+    try:
+        async for chunk in chunks:
+            await asyncio.sleep(args.process_latency * len(chunk))
+            ids = [email["id"] for email in chunk]
+            processed.extend(ids)
+            checkpoint.update(cursor)
+            checkpoint["processed_ids"] = checkpoint.get("processed_ids", []) + ids
+            if stop_after is not None and len(checkpoint["processed_ids"]) >= stop_after:
+                break
+    finally:
+        await chunks.aclose()
+    return stats, processed
+
+
+def run(label, args, checkpoint):
+    http = FakeGmailHttp(args.messages, latency=args.latency, per_item_latency=args.per_item_latency)
+    service = build_fake_service(http)
+    start = time.perf_counter()
+    stats, processed = asyncio.run(sync(service, args, checkpoint))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>8}: processed {len(processed)} emails | round trips {http.round_trips} "
+        f"| quota units {stats.quota_units} | {elapsed:.2f}s"
+    )
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--interrupt-at", type=float, default=0.5, help="share of the mailbox processed before the crash")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per HTTP round trip")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="simulated server seconds per message")
+    parser.add_argument("--process-latency", type=float, default=0.002, help="simulated store + upload seconds per email")
+    parser.add_argument("--quota", type=float, default=250, help="quota units per second for the token bucket")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    http = FakeGmailHttp(args.messages, latency=args.latency, per_item_latency=args.per_item_latency)
+    checkpoint = {}
+    asyncio.run(sync(build_fake_service(http), args, checkpoint, stop_after=int(args.messages * args.interrupt_at)))
+    done = list(checkpoint["processed_ids"])
+    print(f"interrupted after {len(done)} emails (page offset {checkpoint['listed_count']}), {http.round_trips} round trips")
+
+    run("restart", args, {})
+    resumed = run("resume", args, checkpoint)
+    covered = set(done) | set(resumed)
+    print(f"resume covers {len(covered)}/{args.messages} emails, {len(set(done) & set(resumed))} processed twice")
+
+
+if __name__ == "__main__":
+    main()
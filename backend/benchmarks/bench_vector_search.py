@@ -0,0 +1,84 @@
+"""
+Benchmark: local Qdrant retrieval (app.vector_index) indexing throughput and search latency.
+
+A synthetic mailbox is indexed with the deterministic HashEmbedder into an embedded
+Qdrant store in a temporary directory, then --queries searches are timed in-process.
+Every email mentions one topic word, and a search for a topic counts as a hit when the
+best chunk comes from an email about it, a rough check that the embedder retrieves.
+
+    cd backend && python -m benchmarks.bench_vector_search --messages 2000
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import tempfile
+import time
+
+from app import vector_index
+from app.email_store import content_hash
+
+TOPICS = ["invoice", "flight", "interview", "mortgage", "concert", "prescription", "warranty", "newsletter"]
+FILLER = "please let me know if you have any questions about the details below thanks again".split()
+
+
+def build_mailbox(count, seed=0):
+    rng = random.Random(seed)
+    mailbox = []
+    for i in range(count):
+        topic = TOPICS[i % len(TOPICS)]
+        words = [rng.choice(FILLER) for _ in range(rng.randint(80, 600))]
+        for _ in range(3):
+            words.insert(rng.randrange(len(words)), topic)
+        email_item = {"id": f"msg{i:06d}", "subject": f"About your {topic} #{i}", "snippet": "", "body": " ".join(words)}
+        email_item["content_hash"] = content_hash(email_item)
+        mailbox.append(email_item)
+    return mailbox
+
+
+async def run(mailbox, queries, dim):
+    vector_index.set_embedder(vector_index.HashEmbedder(dim))
+    start = time.perf_counter()
+    counts = {"indexed": 0, "chunks": 0}
+    for offset in range(0, len(mailbox), 500):
+        result = await vector_index.index_emails("bench", mailbox[offset:offset + 500])
+        counts["indexed"] += result["indexed"]
+        counts["chunks"] += result["chunks"]
+    elapsed = time.perf_counter() - start
+    print(f"indexed {counts['indexed']} emails ({counts['chunks']} chunks) in {elapsed:.2f}s: {counts['indexed'] / elapsed:.0f} emails/s")
+
+    start = time.perf_counter()
+    skipped = await vector_index.index_emails("bench", mailbox[:500])
+    print(f"reindexing 500 unchanged emails: {skipped['skipped']} skipped in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    latencies, hits = [], 0
+    for i in range(queries):
+        topic = TOPICS[i % len(TOPICS)]
+        start = time.perf_counter()
+        results = await vector_index.search_index("bench", f"what about my {topic}", limit=25)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += bool(results) and topic in results[0]["subject"]
+    latencies.sort()
+    print(
+        f"search over {counts['chunks']} chunks: p50 {statistics.median(latencies):.2f}ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}ms, max {latencies[-1]:.2f}ms | top hit on topic {hits}/{queries}"
+    )
+    await vector_index.close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=vector_index.QDRANT_HASH_DIM)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as path:
+        vector_index.QDRANT_PATH = path
+        asyncio.run(run(build_mailbox(args.messages), args.queries, args.dim))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+In-process fake of the Gmail REST API for benchmarks.
+
+FakeGmailHttp stands in for the httplib2.Http object a googleapiclient service
+uses, so the real client code (request building, batch serialization, response
+parsing) runs unchanged while every HTTP round trip is answered locally after a
+configurable simulated latency.
+"""
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import Parser
+from urllib.parse import urlparse, parse_qs, unquote
+
+import httplib2
+from googleapiclient.discovery import build
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+# Relay/authentication headers every real message carries; format='full' returns all of them
+_TRANSPORT_HEADERS = [
+    {"name": "Received", "value": f"from mail-out{i}.example.net (mail-out{i}.example.net. [203.0.113.{i}]) by mx.google.com with ESMTPS id x{i}si123456qtb.1.2024.01.01.10.00.00 for <user@example.com> (version=TLS1_3 cipher=TLS_AES_256_GCM_SHA384 bits=256/256); Mon, 01 Jan 2024 10:00:00 -0800 (PST)"}
+    for i in range(4)
+] + [
+    {"name": "ARC-Seal", "value": "i=1; a=rsa-sha256; t=1704132000; cv=none; d=google.com; s=arc-20160816; b=" + "A" * 340},
+    {"name": "ARC-Message-Signature", "value": "i=1; a=rsa-sha256; c=relaxed/relaxed; d=google.com; s=arc-20160816; h=to:subject:message-id:date:from:mime-version; bh=" + "B" * 44 + "; b=" + "C" * 340},
+    {"name": "DKIM-Signature", "value": "v=1; a=rsa-sha256; c=relaxed/relaxed; d=example.com; s=20230601; h=to:subject:message-id:date:from:mime-version:from:to:cc:subject:date:message-id:reply-to; bh=" + "D" * 44 + "; b=" + "E" * 340},
+    {"name": "List-Unsubscribe", "value": "<https://example.com/unsubscribe?token=" + "F" * 120 + ">, <mailto:unsubscribe@example.com>"},
+    {"name": "Message-ID", "value": "<CAF=abcdefghijklmnopqrstuvwxyz0123456789@mail.example.com>"},
+]
+
+
+def parse_fields_mask(fields):
+    """Parse a Google API `fields` selector ("a,b(c,d),e/f") into a nested dict of kept keys."""
+    tree, stack, token = {}, [], ""
+    current = tree
+    for char in fields + ",":
+        if char in ",()":
+            if token:
+                node = current
+                names = token.strip().split("/")
+                for name in names[:-1]:
+                    node = node.setdefault(name, {})
+                last = names[-1]
+                if char == "(":
+                    stack.append(current)
+                    current = node.setdefault(last, {})
+                else:
+                    node.setdefault(last, None)
+            elif char == "(":
+                raise ValueError(f"Bad fields mask: {fields}")
+            if char == ")":
+                current = stack.pop()
+            token = ""
+        else:
+            token += char
+    return tree
+
+
+def apply_fields_mask(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [apply_fields_mask(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: apply_fields_mask(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def make_message(index):
+    """Build a realistic messages.get(format='full') response for message number `index`."""
+    message_id = f"msg{index:06d}"
+    plain = f"Hello,\n\nThis is synthetic email number {index}.\n" + ("Lorem ipsum dolor sit amet. " * 40)
+    html_body = f"<html><body><p>This is synthetic email number {index}.</p>" + ("<p>Lorem ipsum dolor sit amet.</p>" * 40) + "</body></html>"
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "labelIds": ["INBOX", "CATEGORY_UPDATES"],
+        "snippet": f"This is synthetic email number {index}.",
+        "historyId": str(1000 + index),
+        "internalDate": str(1700000000000 + index * 1000),
+        # Raw RFC 822 size: headers plus both bodies and MIME boundaries
+        "sizeEstimate": sum(len(h["name"]) + len(h["value"]) + 4 for h in _TRANSPORT_HEADERS) + len(plain) + len(html_body) + 600,
+        "payload": {
+            "partId": "",
+            "mimeType": "multipart/alternative",
+            "filename": "",
+            "headers": _TRANSPORT_HEADERS + [
+                {"name": "From", "value": "Sender <sender@example.com>"},
+                {"name": "To", "value": "user@example.com"},
+                {"name": "Subject", "value": f"Synthetic subject {index}"},
+                {"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 +0000"},
+                {"name": "Content-Type", "value": "multipart/alternative; boundary=\"b1\""},
+            ],
+            "body": {"size": 0},
+            "parts": [
+                {
+                    "partId": "0",
+                    "mimeType": "text/plain",
+                    "filename": "",
+                    "headers": [{"name": "Content-Type", "value": "text/plain; charset=\"UTF-8\""}],
+                    "body": {"size": len(plain), "data": _b64(plain)},
+                },
+                {
+                    "partId": "1",
+                    "mimeType": "text/html",
+                    "filename": "",
+                    "headers": [{"name": "Content-Type", "value": "text/html; charset=\"UTF-8\""}],
+                    "body": {"size": len(html_body), "data": _b64(html_body)},
+                },
+            ],
+        },
+    }
+
+
+def nest_message(message, depth):
+    """Wrap the message's body parts in depth more multipart/mixed levels, like forwarded mail."""
+    payload = message["payload"]
+    parts = payload["parts"]
+    for level in range(depth):
+        parts = [{"partId": str(level), "mimeType": "multipart/mixed", "filename": "", "body": {"size": 0}, "parts": parts}]
+    payload["mimeType"] = "multipart/mixed"
+    payload["parts"] = parts
+    return message
+
+
+class FakeGmailHttp:
+    """
+    httplib2.Http replacement answering Gmail list/get/batch calls from an in-memory mailbox.
+
+    latency is the simulated network round-trip time (seconds) charged once per HTTP call,
+    per_item_latency is extra server time charged per message returned.
+    errors maps a message id to an HTTP status returned for messages.get on that id.
+    throttle_rate is the chance that a list/get call (batched or not) is rejected with
+    throttle_status, carrying a Retry-After of retry_after seconds when that is set.
+    """
+
+    def __init__(self, message_count=1000, latency=0.05, per_item_latency=0.0, errors=None,
+                 throttle_rate=0.0, throttle_status=429, retry_after=None, seed=0):
+        self.messages = [make_message(i) for i in range(message_count)]
+        self.by_id = {m["id"]: m for m in self.messages}
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.errors = dict(errors or {})
+        self.throttle_rate = throttle_rate
+        self.throttle_status = throttle_status
+        self.retry_after = retry_after
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self.next_index = message_count
+        self.history_id = 1000 + message_count
+        # History older than this is treated as expired (404), like Gmail after ~a week
+        self.oldest_history_id = self.history_id
+        self.history = []
+        self.round_trips = 0
+        self.sub_requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def add_message(self):
+        """Deliver a new message; it is listed first, like Gmail's newest-first order."""
+        message = make_message(self.next_index)
+        self.next_index += 1
+        self.messages.insert(0, message)
+        self.by_id[message["id"]] = message
+        self._record("messagesAdded", message["id"])
+        return message["id"]
+
+    def delete_message(self, message_id):
+        self.messages = [m for m in self.messages if m["id"] != message_id]
+        self.by_id.pop(message_id, None)
+        self._record("messagesDeleted", message_id)
+
+    def relabel_message(self, message_id, add=(), remove=()):
+        """Add and remove labels, e.g. add=["TRASH"] for moving a message to trash."""
+        message = self.by_id[message_id]
+        message["labelIds"] = [label for label in message["labelIds"] if label not in remove] + list(add)
+        if add:
+            self._record("labelsAdded", message_id, list(add))
+        if remove:
+            self._record("labelsRemoved", message_id, list(remove))
+
+    def _record(self, change, message_id, label_ids=None):
+        self.history_id += 1
+        message = self.by_id.get(message_id)
+        entry = {"message": {"id": message_id, "labelIds": list(message["labelIds"]) if message else []}}
+        if label_ids is not None:
+            entry["labelIds"] = label_ids
+        self.history.append({"id": str(self.history_id), change: [entry]})
+
+    # googleapiclient only needs request(); credentials/timeouts are never consulted here
+    def request(self, uri, method="GET", body=None, headers=None, redirections=None, connection_type=None):
+        with self._lock:
+            self.round_trips += 1
+        path = urlparse(uri).path
+        if path == "/batch" or path.startswith("/batch/"):
+            resp, content = self._batch(body, headers or {})
+        else:
+            resp, content = self._single(method, uri)
+        time.sleep(self.latency)
+        with self._lock:
+            self.bytes_sent += len(content)
+        return resp, content
+
+    def _single(self, method, uri):
+        with self._lock:
+            self.sub_requests += 1
+        status, payload = self.handle(method, uri)
+        time.sleep(self.per_item_latency)
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"status": str(status), "content-type": "application/json"}
+        if status == self.throttle_status and self.retry_after is not None:
+            headers["retry-after"] = str(self.retry_after)
+        return httplib2.Response(headers), body
+
+    def _throttle(self):
+        with self._lock:
+            if self._random.random() >= self.throttle_rate:
+                return None
+            self.throttled += 1
+        reason = "rateLimitExceeded" if self.throttle_status in (403, 429) else "backendError"
+        return self.throttle_status, {"error": {
+            "code": self.throttle_status, "message": "Fake throttling",
+            "errors": [{"domain": "usageLimits", "reason": reason, "message": "Fake throttling"}],
+        }}
+
+    def handle(self, method, uri):
+        """Return (status, json_payload) for one Gmail REST call."""
+        parsed = urlparse(uri)
+        query = parse_qs(parsed.query)
+        parts = [unquote(p) for p in parsed.path.split("/") if p]
+        # gmail/v1/users/{userId}/messages[/{id}], .../profile, .../history
+        if parts[-1] == "profile":
+            return 200, {"emailAddress": "user@example.com", "messagesTotal": len(self.messages),
+                         "historyId": str(self.history_id)}
+        if parts[-1] == "history":
+            start = int(query["startHistoryId"][0])
+            if start < self.oldest_history_id:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [h for h in self.history if int(h["id"]) > start]
+            return 200, {"history": records, "historyId": str(self.history_id)}
+        if parts[-1] == "messages":
+            return self._throttle() or (200, self._list(query))
+        if len(parts) >= 2 and parts[-2] == "messages":
+            message_id = parts[-1]
+            throttled = self._throttle()
+            if throttled:
+                return throttled
+            if message_id in self.errors:
+                status = self.errors[message_id]
+                return status, {"error": {"code": status, "message": f"Fake error {status}"}}
+            message = self.by_id.get(message_id)
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            if query.get("format", ["full"])[0] == "metadata":
+                wanted = set(query.get("metadataHeaders", []))
+                payload = message["payload"]
+                message = dict(message, payload={
+                    "mimeType": payload["mimeType"],
+                    "headers": [h for h in payload["headers"] if not wanted or h["name"] in wanted],
+                })
+            if "fields" in query:
+                message = apply_fields_mask(message, parse_fields_mask(query["fields"][0]))
+            return 200, message
+        return 404, {"error": {"code": 404, "message": f"Unknown path {parsed.path}"}}
+
+    def _list(self, query):
+        page_size = int(query.get("maxResults", ["100"])[0])
+        start = int(query.get("pageToken", ["0"])[0])
+        page = self.messages[start:start + page_size]
+        result = {
+            "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+            "resultSizeEstimate": len(self.messages),
+        }
+        if start + page_size < len(self.messages):
+            result["nextPageToken"] = str(start + page_size)
+        return result
+
+    def _batch(self, body, headers):
+        envelope = Parser().parsestr(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in envelope.get_payload():
+            content_id = part["Content-ID"]
+            request_line = part.get_payload().split("\n", 1)[0].strip()
+            method, path, _ = request_line.split(" ", 2)
+            with self._lock:
+                self.sub_requests += 1
+            status, payload = self.handle(method, "https://gmail.googleapis.com" + path)
+            time.sleep(self.per_item_latency)
+            retry_after = ""
+            if status == self.throttle_status and self.retry_after is not None:
+                retry_after = f"Retry-After: {self.retry_after}\r\n"
+            out.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n{retry_after}\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        resp = httplib2.Response({"status": "200", "content-type": f"multipart/mixed; boundary={boundary}"})
+        return resp, "".join(out).encode("utf-8")
+
+
+def build_fake_service(http):
+    """Build a real googleapiclient Gmail service that talks to a FakeGmailHttp."""
+    return build('gmail', 'v1', http=http, static_discovery=True, cache_discovery=False)
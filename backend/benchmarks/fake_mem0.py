@@ -0,0 +1,94 @@
+"""
+Local fake of the Mem0 Platform API for benchmarks.
+
+FakeMem0Server serves the endpoints AsyncMemoryClient needs (GET /v1/ping/,
+POST /v1/memories/ and DELETE /v1/batch/) from a uvicorn server on a background thread, so the real
+client, its httpx connection pool and JSON encoding run unchanged against it.
+Each add is answered after latency seconds plus per_message seconds for every
+message in the request, and error_rate of the adds fail with HTTP 500. An add with
+infer=False returns one memory per message, as Mem0 does when it stores them verbatim.
+"""
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+
+os.environ.setdefault("MEM0_TELEMETRY", "False")
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+
+class FakeMem0Server:
+    def __init__(self, latency=0.05, per_message=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.per_message = per_message
+        self.error_rate = error_rate
+        self.requests = 0
+        self.messages = 0
+        self.failed = 0
+        self.deleted = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._random = random.Random(seed)
+        self._server = None
+        self._thread = None
+        self.url = None
+
+    def _build_app(self):
+        app = FastAPI()
+
+        @app.get("/v1/ping/")
+        async def ping():
+            return {"status": "ok", "user_email": "bench@example.com"}
+
+        @app.post("/v1/memories/")
+        async def add(request: Request):
+            payload = await request.json()
+            self.requests += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            try:
+                messages = payload.get("messages", [])
+                await asyncio.sleep(self.latency + self.per_message * len(messages))
+                if self._random.random() < self.error_rate:
+                    self.failed += 1
+                    raise HTTPException(status_code=500, detail="fake Mem0 failure")
+                self.messages += len(messages)
+                if payload.get("infer") is False:
+                    return {"results": [
+                        {"id": f"mem{self.requests}-{index}", "event": "ADD"} for index in range(len(messages))
+                    ]}
+                return {"results": [{"id": f"mem{self.requests}", "event": "ADD"}]}
+            finally:
+                self._in_flight -= 1
+
+        @app.delete("/v1/batch/")
+        async def batch_delete(request: Request):
+            payload = await request.json()
+            self.deleted += len(payload.get("memories", []))
+            return {"message": "Memories deleted successfully!"}
+
+        return app
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", 0))
+        config = uvicorn.Config(self._build_app(), log_level="error", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+    def reset(self):
+        self.requests = self.messages = self.failed = self.deleted = self.max_in_flight = 0
@@ -0,0 +1,90 @@
+"""
+Shared fixtures for the backend tests.
+
+The backend modules are imported as the app package from backend/, the way uvicorn runs
+them. MongoDB is replaced by mongomock-motor, Gmail by the in-process fake from
+backend/benchmarks/fake_gmail.py and Mem0 by FakeMem0Client below.
+"""
+
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+os.environ.setdefault("MEM0_TELEMETRY", "False")
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """A fresh in-memory database behind every app.db collection."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import mongomock.collection
+    from app import db
+
+    # pymongo 4.11+ passes sort= to UpdateOne, which mongomock's bulk builder does not know
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    monkeypatch.setattr(
+        mongomock.collection.BulkOperationBuilder, "add_update",
+        lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+    )
+    monkeypatch.setattr(db, "client", mongomock_motor.AsyncMongoMockClient())
+    return db.get_database()
+
+
+class FakeMem0Client:
+    """
+    Records AsyncMemoryClient.add and batch_delete calls. add raises when one of its
+    emails (by the Gmail ids in its metadata) is listed in failing, and returns one
+    memory per add, or one per message with infer=False.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.deleted = []
+        self.failing = set()
+        self._memories = 0
+
+    async def add(self, messages, user_id, metadata=None, infer=True, **kwargs):
+        metadata = metadata or {}
+        email_ids = metadata.get("email_ids") or [metadata.get("email_id")]
+        if self.failing.intersection(email_ids):
+            raise RuntimeError(f"fake Mem0 failure for {email_ids}")
+        self.calls.append({"messages": messages, "user_id": user_id, "email_ids": email_ids, "infer": infer})
+        results = []
+        for _ in (messages if infer is False else [None]):
+            self._memories += 1
+            results.append({"id": f"mem{self._memories}", "event": "ADD"})
+        return {"results": results}
+
+    async def batch_delete(self, memories):
+        self.deleted.extend(memory["memory_id"] for memory in memories)
+        return {"message": "Memories deleted successfully!"}
+
+
+@pytest.fixture
+def mem0(monkeypatch):
+    from app import mem0_agent
+    client = FakeMem0Client()
+    monkeypatch.setattr(mem0_agent, "aclient", client)
+    return client
+
+
+@pytest.fixture
+def gmail(monkeypatch):
+    """A FakeGmailHttp with 40 messages, served to the sync through a real Gmail service."""
+    from app import main
+    from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service
+
+    http = FakeGmailHttp(40, latency=0)
+    service = build_fake_service(http)
+    monkeypatch.setattr(main, "build_gmail_service_simple", lambda access_token: service)
+    return http
+
+
+@pytest.fixture(autouse=True)
+def quiet_logs():
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the content hash ledger in backend/app/email_store.py, which lets full syncs
+skip MongoDB writes and Mem0 uploads for emails whose content did not change.
+"""
+
+import asyncio
+
+import pytest
+
+from app import main
+from app.email_store import content_hash
+
+
+@pytest.fixture
+def full_sync(monkeypatch):
+    """
+    Every sync lists the whole mailbox, as a resync without a historyId does, and
+    uploads to Mem0 inline rather than through the outbox.
+    """
+    monkeypatch.setattr(main, "GMAIL_INCREMENTAL_SYNC", False)
+    monkeypatch.setattr(main, "MEM0_OUTBOX_ENABLED", False)
+
+    def sync():
+        result = asyncio.run(main._trigger_and_process_user_emails("u", access_token="token", max_results=100))
+        assert result["status"] == "success"
+        return result
+    return sync
+
+
+def test_content_hash_covers_only_text_fields():
+    email_item = {"id": "1", "subject": "Hi", "snippet": "s", "body": "b"}
+    assert content_hash(email_item) == content_hash(dict(email_item, id="2", labels=["INBOX"]))
+    assert content_hash(email_item) != content_hash(dict(email_item, body="b2"))
+    # Field boundaries are part of the hash
+    assert content_hash(email_item) != content_hash(dict(email_item, subject="Hi s", snippet=""))
+
+
+def test_unchanged_mailbox_skips_mongo_and_mem0(mongo, gmail, mem0, full_sync):
+    first = full_sync()
+    assert first["storage"]["inserted"] == 40
+    assert first["upload"]["uploaded"] == 40
+    adds = len(mem0.calls)
+
+    second = full_sync()
+    assert second["skipped"] == {"store": 40, "upload": 40}
+    assert second["storage"]["inserted"] == second["storage"]["updated"] == 0
+    assert second["upload"]["uploaded"] == 0
+    assert len(mem0.calls) == adds
+
+
+def test_changed_email_is_written_and_uploaded_again(mongo, gmail, mem0, full_sync):
+    full_sync()
+    changed = gmail.messages[5]
+    changed["snippet"] = "Updated snippet"
+    adds = len(mem0.calls)
+    old_memory_ids = asyncio.run(mongo.emails.find_one({"user_id": "u", "id": changed["id"]}))["mem0_memory_ids"]
+
+    result = full_sync()
+    assert result["storage"]["updated"] == 1 and result["storage"]["skipped"] == 39
+    assert result["upload"]["uploaded"] == 1 and result["upload"]["skipped"] == 39
+    assert [call["email_ids"] for call in mem0.calls[adds:]] == [[changed["id"]]]
+    stored = asyncio.run(mongo.emails.find_one({"user_id": "u", "id": changed["id"]}))
+    assert stored["snippet"] == "Updated snippet"
+    assert stored["mem0_content_hash"] == stored["content_hash"]
+    # The memory of the old content is replaced, not kept next to the new one
+    assert mem0.deleted == old_memory_ids != stored["mem0_memory_ids"]
+
+
+def test_failed_upload_is_retried_by_next_sync(mongo, gmail, mem0, full_sync):
+    full_sync()
+    changed, failing = gmail.messages[0], gmail.messages[1]
+    changed["snippet"] = failing["snippet"] = "Updated snippet"
+    mem0.failing.add(failing["id"])
+
+    result = full_sync()
+    assert result["skipped"] == {"store": 38, "upload": 38}
+    assert result["upload"]["uploaded"] == 1 and result["upload"]["failed"] == 1
+    stored = asyncio.run(mongo.emails.find_one({"user_id": "u", "id": failing["id"]}))
+    assert stored["mem0_content_hash"] != stored["content_hash"]
+
+    mem0.failing.clear()
+    result = full_sync()
+    # MongoDB already holds the new content; only the Mem0 upload is repeated
+    assert result["skipped"] == {"store": 40, "upload": 39}
+    assert result["upload"]["uploaded"] == 1
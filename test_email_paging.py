@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the keyset pagination of the /emails listing in backend/app/email_store.py.
+"""
+
+import asyncio
+
+import pytest
+
+from app.email_store import upsert_emails, list_emails, iter_emails, encode_cursor
+
+
+def store(count, start=0, user_id="u"):
+    emails = [
+        {"id": f"msg{index:06d}", "subject": f"Subject {index}", "snippet": "s", "body": f"Body {index}"}
+        for index in range(start, start + count)
+    ]
+    asyncio.run(upsert_emails(user_id, emails))
+    return [email_item["id"] for email_item in emails]
+
+
+def pages(user_id="u", limit=15, cursor=None, **kwargs):
+    """Every page of list_emails from cursor on, as lists of ids."""
+    result = []
+    while True:
+        page = asyncio.run(list_emails(user_id, limit=limit, cursor=cursor, **kwargs))
+        result.append([email_item["id"] for email_item in page["emails"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return result
+
+
+def test_pages_cover_every_email_once(mongo):
+    ids = store(40)
+    store(5, user_id="other")
+    assert [len(page) for page in pages()] == [15, 15, 10]
+    assert sum(pages(), []) == ids
+
+
+def test_exact_multiple_of_limit_has_no_empty_page(mongo):
+    store(30)
+    assert [len(page) for page in pages()] == [15, 15]
+
+
+def test_writes_between_pages_do_not_shift_pages(mongo):
+    ids = store(20, start=10)
+    first = asyncio.run(list_emails("u", limit=10))
+    # Emails sorting before and after the cursor arrive between two page reads
+    store(5, start=0)
+    late = store(5, start=100)
+    rest = sum(pages(cursor=first["next_cursor"], limit=10), [])
+    assert rest == ids[10:] + late
+
+
+def test_iter_emails_streams_after_cursor_with_bodies(mongo):
+    ids = store(40)
+    first = asyncio.run(list_emails("u", limit=25))
+
+    async def streamed():
+        return [email_item async for email_item in iter_emails("u", cursor=first["next_cursor"], batch_size=4)]
+    emails = asyncio.run(streamed())
+    assert [email_item["id"] for email_item in emails] == ids[25:]
+    assert emails[0]["body"] == "Body 25" and "body_codec" not in emails[0]
+
+
+def test_bad_cursor_is_rejected(mongo):
+    with pytest.raises(ValueError):
+        asyncio.run(list_emails("u", cursor="not-a-cursor"))
+    with pytest.raises(ValueError):
+        iter_emails("u", cursor=encode_cursor({"score": 1.0}))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the (score, _id) keyset pagination of search_emails in backend/app/email_store.py.
+"""
+
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app import email_store
+from app.email_store import search_emails, encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    _id = ObjectId()
+    assert decode_cursor(encode_cursor({"score": 1.5, "_id": _id}), ("score", "_id")) == {"score": 1.5, "_id": _id}
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor({"score": 1.5, "_id": "zz"}), ("score", "_id"))
+
+
+class RecordingCollection:
+    """Stands in for emails_collection: mongomock has no $text, so search hits are canned."""
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return self
+
+    async def to_list(self, length):
+        return self.hits[:length]
+
+
+def test_search_pages_by_score_and_id(monkeypatch):
+    hits = [{"_id": ObjectId(), "id": f"msg{index}", "subject": "s", "snippet": "s", "score": 2.0} for index in range(3)]
+    collection = RecordingCollection(hits)
+    monkeypatch.setattr(email_store, "emails_collection", collection)
+
+    page = asyncio.run(search_emails("u", "invoice", limit=2))
+    assert [hit["id"] for hit in page["results"]] == ["msg0", "msg1"]
+    assert collection.pipelines[0][-1] == {"$limit": 3}
+
+    asyncio.run(search_emails("u", "invoice", limit=2, cursor=page["next_cursor"]))
+    after = collection.pipelines[1][2]["$match"]["$or"]
+    assert after == [
+        {"score": {"$lt": 2.0}},
+        {"score": 2.0, "_id": {"$gt": hits[1]["_id"]}},
+    ]
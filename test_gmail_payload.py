@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Tests for the messages.get payload modes of fetch_emails_by_id in backend/app/gmail.py.
+"""
+
+import asyncio
+
+from app.gmail import fetch_emails_by_id, GmailFetchStats, GmailQuotaBucket
+from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service, nest_message
+
+
+def fetch(http, payload_mode):
+    stats = GmailFetchStats()
+    emails = asyncio.run(fetch_emails_by_id(
+        build_fake_service(http), 'me', [m["id"] for m in http.messages], fetch_mode="batch",
+        stats=stats, quota_bucket=GmailQuotaBucket(units_per_second=1e9), payload_mode=payload_mode
+    ))
+    return {e["id"]: e["body"] for e in emails}, stats
+
+
+def test_masked_matches_full_for_shallow_messages():
+    http = FakeGmailHttp(10, latency=0)
+    full, full_stats = fetch(http, "full")
+    masked, masked_stats = fetch(http, "masked")
+    assert masked == full
+    assert masked_stats.refetched == 0
+    assert 0 < masked_stats.bytes_received < full_stats.bytes_received
+
+
+def test_masked_fetches_deeply_nested_messages_again():
+    http = FakeGmailHttp(10, latency=0)
+    for message in http.messages[::3]:
+        nest_message(message, 4)
+    full, _ = fetch(http, "full")
+    masked, stats = fetch(http, "masked")
+    assert all("synthetic email number" in body for body in full.values())
+    assert masked == full
+    assert stats.refetched == 4
+    assert stats.get_calls == 14
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the Retry-After aware retry policy of Gmail calls in backend/app/gmail.py.
+"""
+
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from app import gmail, utils
+from app.gmail import fetch_emails, GmailFetchStats, GmailQuotaBucket
+from app.utils import RetryConfig
+from benchmarks.fake_gmail import FakeGmailHttp, build_fake_service
+
+
+def http_error(status, retry_after=None, reason=None):
+    headers = {"status": str(status)}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    errors = f'[{{"reason": "{reason}"}}]' if reason else '[]'
+    content = f'{{"error": {{"code": {status}, "message": "x", "errors": {errors}}}}}'.encode()
+    return HttpError(httplib2.Response(headers), content)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays passed to asyncio.sleep, which returns at once."""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(utils.asyncio, "sleep", sleep)
+    return delays
+
+
+def test_retry_after_seconds_and_http_date():
+    assert gmail._retry_after_seconds(http_error(429, "7")) == 7.0
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < gmail._retry_after_seconds(http_error(429, format_datetime(when, usegmt=True))) <= 30
+    assert gmail._retry_after_seconds(http_error(429, "100000")) == gmail.GMAIL_RETRY_AFTER_MAX
+    assert gmail._retry_after_seconds(http_error(429, "soon")) is None
+    assert gmail._retry_after_seconds(http_error(429)) is None
+
+
+def test_waits_at_least_retry_after(monkeypatch, sleeps):
+    monkeypatch.setattr(gmail, "GMAIL_RETRY_CONFIG", RetryConfig(max_attempts=4, delay=0.01, jitter=True))
+    failures = [http_error(429, "5"), http_error(403, "3", reason="userRateLimitExceeded")]
+
+    async def call():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    stats = GmailFetchStats()
+    assert asyncio.run(gmail._retry_gmail_call(call, stats, "test call")) == "ok"
+    assert sleeps[0] >= 5 and sleeps[1] >= 3
+    assert stats.retries == 2 and stats.rate_limited == 2
+    assert stats.backoff_seconds == pytest.approx(sum(sleeps))
+
+
+def test_final_errors_are_not_retried(sleeps):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise http_error(404)
+
+    with pytest.raises(HttpError):
+        asyncio.run(gmail._retry_gmail_call(call, GmailFetchStats(), "test call"))
+    assert len(calls) == 1 and sleeps == []
+
+
+@pytest.mark.parametrize("mode", ["batch", "concurrent"])
+def test_throttled_fetch_gets_every_message(monkeypatch, sleeps, mode):
+    monkeypatch.setattr(gmail, "GMAIL_RETRY_CONFIG", RetryConfig(max_attempts=10, delay=0.01))
+    http = FakeGmailHttp(60, latency=0, throttle_rate=0.2, retry_after=2, seed=3)
+    stats = GmailFetchStats()
+    emails = asyncio.run(fetch_emails(
+        build_fake_service(http), 'me', max_results=60, fetch_mode=mode, stats=stats,
+        quota_bucket=GmailQuotaBucket(units_per_second=1e9)
+    ))
+    assert len(emails) == 60 and stats.failed == 0
+    assert http.throttled > 0 and stats.retries > 0
+    assert stats.backoff_seconds >= 2 * stats.retries
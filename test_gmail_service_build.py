@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Tests for building Gmail services from the cached discovery document in backend/app/gmail.py.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from google.oauth2.credentials import Credentials
+
+from app import gmail
+
+
+def test_builds_do_not_share_the_discovery_document():
+    document = gmail.get_gmail_discovery_document()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        services = list(pool.map(
+            lambda index: gmail.gmail_service_for_credentials(Credentials(token=f"token{index}")), range(16)
+        ))
+    assert gmail.get_gmail_discovery_document() == document
+    assert len({id(service._resourceDesc) for service in services}) == 16
+    request = services[3].users().messages().get(userId="me", id="abc", format="full")
+    assert "/users/me/messages/abc" in request.uri
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming HTML to text converter in backend/app/html_to_text.py. The
+chunking tests reuse the inputs of backend/benchmarks/bench_html_to_text.py.
+"""
+
+import pytest
+
+from app.html_to_text import html_to_text, HTMLToText
+from benchmarks.bench_html_to_text import CORPUS, STYLE_MARKER, SCRIPT_MARKER
+
+
+def test_script_style_head_and_comments_are_dropped():
+    document = (
+        "<html><HEAD><title>T</title></HEAD><body><style type='text/css'>p { color: red }</style>"
+        "Hello<!-- hidden <p> --> <SCRIPT>var x = '</p>';</SCRIPT>world</body></html>"
+    )
+    assert html_to_text(document) == "Hello world"
+    text = html_to_text(CORPUS["marketing"])
+    assert STYLE_MARKER not in text and SCRIPT_MARKER not in text
+    assert "Product 7 – now 20% off" in text
+
+
+def test_elements_with_skipped_prefixes_are_kept():
+    assert html_to_text("<header>Top</header><scripts>x</scripts>") == "Top\nx"
+
+
+def test_entities_are_unescaped():
+    assert html_to_text("Fish &amp; chips &pound;5&nbsp;each &#8211; &#x41;&lt;b&gt;") == "Fish & chips £5 each – A<b>"
+    assert html_to_text("AT&T and &bogus; stay") == "AT&T and &bogus; stay"
+
+
+@pytest.mark.parametrize("document, expected", [
+    ("<p>Hello</p><p>World</p>", "Hello\nWorld"),
+    ("a<br>b<BR/>c", "a\nb\nc"),
+    ("<table><tr><td>c</td><td>d</td></tr><tr><th>e</th></tr></table>", "c d\ne"),
+    ("<ul><li>one</li><li>two</li></ul><h2>Title</h2>", "one\ntwo\nTitle"),
+    ("<div>one\n  two</div>\n\n<div><br></div><div>three</div>", "one two\nthree"),
+    ("x<span>y</span> <b>z</b>", "xy z"),
+])
+def test_block_and_cell_tags_separate_text(document, expected):
+    assert html_to_text(document) == expected
+
+
+def test_malformed_markup_is_text():
+    assert html_to_text("1 < 2 and 3 <4, a<b") == "1 < 2 and 3 <4, a"
+    assert html_to_text("<a<br>b>") == "<a\nb>"
+    assert html_to_text("text <!-- never closed") == "text"
+
+
+def test_max_chars_stops_conversion():
+    document = "<p>" + "word " * 1000 + "</p>" + "<p>more</p>" * 10000
+    converter = HTMLToText(max_chars=100)
+    assert converter.feed(document) is False
+    text = converter.close()
+    assert len(text) == 100 and text.startswith("word word")
+    assert html_to_text(document, max_chars=100) == text
+
+
+@pytest.mark.parametrize("name", list(CORPUS))
+def test_output_does_not_depend_on_chunking(name):
+    document = CORPUS[name][:20000]
+    expected = html_to_text(document)
+    for chunk_size in (1, 2, 3, 7, 64, 1000):
+        assert html_to_text(document, chunk_size=chunk_size) == expected
+
+
+def test_split_points_inside_every_construct():
+    document = (
+        "<div>A &amp; B</div><!-- c --><scRipt>s</script><td>x</td><td>y</td>"
+        "<p class='long'>" + "z" * 50 + "</p>&#8211;<br/>end &nbsp;"
+    )
+    expected = html_to_text(document)
+    assert expected == "A & B\nx y\n" + "z" * 50 + "\n–\nend"
+    for cut in range(1, len(document)):
+        converter = HTMLToText()
+        converter.feed(document[:cut])
+        converter.feed(document[cut:])
+        assert converter.close() == expected, cut
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the historyId based incremental sync in backend/app/main.py and
+fetch_history_changes in backend/app/gmail.py, against the fake Gmail API.
+"""
+
+import asyncio
+
+from app import main
+
+
+def sync(user_id="u"):
+    return asyncio.run(main._trigger_and_process_user_emails(user_id, access_token="token", max_results=100))
+
+
+def stored_ids(mongo, user_id="u"):
+    async def ids():
+        return {email_item["id"] async for email_item in mongo.emails.find({"user_id": user_id}, {"id": 1})}
+    return asyncio.run(ids())
+
+
+def history_id(mongo, user_id="u"):
+    return asyncio.run(mongo.users.find_one({"user_id": user_id}))["gmail_history_id"]
+
+
+def start(mongo, gmail):
+    asyncio.run(mongo.users.insert_one({"user_id": "u", "fetched_email": False}))
+    result = sync()
+    assert result["sync_mode"] == "full" and result["count"] == 40
+    assert history_id(mongo) == str(gmail.history_id)
+
+
+def test_applies_added_and_deleted_messages(mongo, gmail, mem0):
+    start(mongo, gmail)
+    added = [gmail.add_message(), gmail.add_message()]
+    deleted = gmail.messages[-1]["id"]
+    gmail.delete_message(deleted)
+
+    result = sync()
+    assert result["sync_mode"] == "incremental"
+    assert result["count"] == 2 and result["deleted_count"] == 1
+    ids = stored_ids(mongo)
+    assert set(added) <= ids and deleted not in ids and len(ids) == 41
+    assert history_id(mongo) == str(gmail.history_id)
+
+
+def test_expired_history_falls_back_to_full_sync(mongo, gmail, mem0):
+    start(mongo, gmail)
+    new_id = gmail.add_message()
+    gmail.oldest_history_id = gmail.history_id + 1
+
+    result = sync()
+    assert result["sync_mode"] == "full"
+    assert new_id in stored_ids(mongo)
+    assert history_id(mongo) == str(gmail.history_id)
+
+
+def test_failed_fetch_keeps_history_id(mongo, gmail, mem0):
+    start(mongo, gmail)
+    old_history_id = history_id(mongo)
+    fetched, failing = gmail.add_message(), gmail.add_message()
+    gmail.errors[failing] = 403
+
+    result = sync()
+    assert result["sync_mode"] == "incremental" and result["count"] == 1
+    assert history_id(mongo) == old_history_id
+    assert fetched in stored_ids(mongo) and failing not in stored_ids(mongo)
+
+    del gmail.errors[failing]
+    result = sync()
+    assert result["count"] == 2
+    assert result["storage"]["skipped"] == 1
+    assert failing in stored_ids(mongo)
+    assert history_id(mongo) == str(gmail.history_id)
+
+
+def test_spam_trash_and_drafts_are_not_synced(mongo, gmail, mem0):
+    start(mongo, gmail)
+    trashed = gmail.messages[0]["id"]
+    gmail.relabel_message(trashed, add=["TRASH"], remove=["INBOX"])
+    spam = gmail.add_message()
+    gmail.relabel_message(spam, add=["SPAM"], remove=["INBOX"])
+    draft = gmail.add_message()
+    gmail.relabel_message(draft, add=["DRAFT"], remove=["INBOX"])
+
+    sync()
+    ids = stored_ids(mongo)
+    assert trashed not in ids and spam not in ids and draft not in ids
+
+    gmail.relabel_message(trashed, add=["INBOX"], remove=["TRASH"])
+    result = sync()
+    assert result["count"] == 1
+    assert trashed in stored_ids(mongo)
+
+
+def test_other_label_changes_are_ignored(mongo, gmail, mem0):
+    start(mongo, gmail)
+    gmail.relabel_message(gmail.messages[0]["id"], add=["STARRED"], remove=["UNREAD"])
+
+    result = sync()
+    assert result["count"] == 0 and result["deleted_count"] == 0
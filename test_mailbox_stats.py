@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-user sync statistics in backend/app/mailbox_stats.py.
+"""
+
+import asyncio
+
+from app import main
+from app.mailbox_stats import get_mailbox_stats
+
+
+def sync(user_id="u"):
+    return asyncio.run(main._trigger_and_process_user_emails(user_id, access_token="token", max_results=100))
+
+
+def test_full_sync_counts_every_stored_email(mongo, gmail, mem0, monkeypatch):
+    asyncio.run(mongo.users.insert_one({"user_id": "u", "fetched_email": False}))
+    monkeypatch.setattr(main, "GMAIL_INCREMENTAL_SYNC", False)
+    sync()
+    assert asyncio.run(get_mailbox_stats("u"))["total_emails"] == 40
+
+    # An email that fails to download is still listed, so its stored copy is kept
+    gmail.errors[gmail.messages[3]["id"]] = 404
+    result = sync()
+    assert result["status"] == "success" and result["count"] == 39
+    stats = asyncio.run(get_mailbox_stats("u"))
+    assert stats["last_sync_mode"] == "full" and stats["total_emails"] == 40
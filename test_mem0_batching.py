@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tests for packing emails into Mem0 adds while linking every email to its own memories,
+and for replacing those memories when an email changes, in upload_emails_to_mem0 of
+backend/app/mem0_agent.py.
+"""
+
+import asyncio
+
+import pytest
+
+from app import main, mem0_agent
+from app.email_store import content_hash
+from app.mem0_agent import upload_emails_to_mem0
+
+
+def make_emails(count, start=0):
+    emails = [
+        {"id": f"msg{index:06d}", "subject": f"Subject {index}", "snippet": f"Snippet {index}",
+         "body": f"Body of email number {index}. " * 5}
+        for index in range(start, start + count)
+    ]
+    for email_item in emails:
+        email_item["content_hash"] = content_hash(email_item)
+    return emails
+
+
+def upload(emails, ledger=None):
+    return asyncio.run(upload_emails_to_mem0("u", emails, ledger))
+
+
+@pytest.fixture
+def batched(monkeypatch):
+    monkeypatch.setattr(mem0_agent, "MEM0_UPLOAD_BATCH_SIZE", 4)
+    monkeypatch.setattr(mem0_agent, "MEM0_UPLOAD_BATCH_MAX_CHARS", 20000)
+
+
+def test_new_emails_are_packed_one_memory_each(mem0, batched):
+    emails = make_emails(10)
+    result = upload(emails)
+    assert result["uploaded"] == [email_item["id"] for email_item in emails]
+    assert result["requests"] == 3 and result["requests_saved"] == 7
+    assert [len(call["messages"]) for call in mem0.calls] == [4, 4, 2]
+    assert all(call["infer"] is False for call in mem0.calls)
+    assert mem0.calls[0]["email_ids"] == [email_item["id"] for email_item in emails[:4]]
+    # Each email is linked to its own memory only
+    linked = [memory_id for memory_ids in result["memory_ids"].values() for memory_id in memory_ids]
+    assert all(len(memory_ids) == 1 for memory_ids in result["memory_ids"].values())
+    assert len(set(linked)) == 10
+
+
+def test_batches_are_capped_by_characters(mem0, batched, monkeypatch):
+    emails = make_emails(4)
+    # Room for one email's content but not two
+    contents, _ = mem0_agent._email_content(emails[0])
+    monkeypatch.setattr(mem0_agent, "MEM0_UPLOAD_BATCH_MAX_CHARS", len(contents[0]) + 10)
+    result = upload(emails)
+    assert result["requests"] == 4
+    # An email sent alone is extracted as usual and tagged with its Gmail id
+    assert [call["email_ids"] for call in mem0.calls] == [[email_item["id"]] for email_item in emails]
+    assert all(call["infer"] is True for call in mem0.calls)
+
+
+def test_emails_split_into_chunks_go_alone(mem0, batched, monkeypatch):
+    monkeypatch.setattr(mem0_agent, "_email_content", lambda email_data: (
+        ["part 1", "part 2"] if email_data["id"] == "msg000001" else [email_data["subject"]],
+        {"chars_in": 0, "chars_out": 0, "tokens_in": 0, "tokens_out": 0},
+    ))
+    upload(make_emails(3))
+    assert sorted(call["email_ids"] for call in mem0.calls) == [["msg000000", "msg000002"], ["msg000001"]]
+
+
+def test_changed_emails_replace_their_old_memories(mem0, batched):
+    emails = make_emails(6)
+    ledger = {
+        email_item["id"]: {"content_hash": "old", "mem0_content_hash": "old", "mem0_memory_ids": [f"old-{email_item['id']}"]}
+        for email_item in emails[:2]
+    }
+    # Unchanged since the last upload: nothing to send and nothing to delete
+    ledger[emails[2]["id"]] = {
+        "content_hash": emails[2]["content_hash"], "mem0_content_hash": emails[2]["content_hash"], "mem0_memory_ids": ["kept"],
+    }
+
+    result = upload(emails, ledger)
+    assert result["skipped"] == 1 and len(result["uploaded"]) == 5
+    assert sorted(mem0.deleted) == [f"old-{emails[0]['id']}", f"old-{emails[1]['id']}"]
+    assert result["replaced"] == 2
+    # Replaced emails can share an add like new ones
+    assert mem0.calls[0]["email_ids"] == [email_item["id"] for email_item in emails[:2] + emails[3:5]]
+
+
+def test_old_memories_are_kept_when_the_upload_fails(mem0, batched, monkeypatch):
+    emails = make_emails(3)
+    ledger = {
+        email_item["id"]: {"content_hash": "old", "mem0_content_hash": "old", "mem0_memory_ids": [f"old-{email_item['id']}"]}
+        for email_item in emails
+    }
+    mem0.failing.add(emails[1]["id"])
+    monkeypatch.setattr(mem0_agent, "MEM0_UPLOAD_BATCH_SIZE", 1)
+
+    result = upload(emails, ledger)
+    assert result["uploaded"] == [emails[0]["id"], emails[2]["id"]]
+    assert result["failed"] == 1 and result["errors"][0]["email_id"] == emails[1]["id"]
+    assert sorted(mem0.deleted) == [f"old-{emails[0]['id']}", f"old-{emails[2]['id']}"]
+
+
+def test_unattributable_memories_are_dropped(mem0, batched, monkeypatch):
+    async def add(messages, user_id, **kwargs):
+        # One memory however many emails were sent
+        return {"results": [{"id": f"merged{len(messages)}", "event": "ADD"}]}
+    monkeypatch.setattr(mem0, "add", add)
+
+    emails = make_emails(5)
+    result = upload(emails)
+    assert result["uploaded"] == [emails[4]["id"]] and result["failed"] == 4
+    assert mem0.deleted == ["merged4"]
+
+
+def test_sync_records_memory_ids_and_replaces_them(mongo, gmail, mem0, batched, monkeypatch):
+    monkeypatch.setattr(main, "GMAIL_INCREMENTAL_SYNC", False)
+    monkeypatch.setattr(main, "MEM0_OUTBOX_ENABLED", False)
+
+    def sync():
+        return asyncio.run(main._trigger_and_process_user_emails("u", access_token="token", max_results=100))
+
+    def stored_memory_ids():
+        return {
+            email_item["id"]: email_item["mem0_memory_ids"]
+            for email_item in asyncio.run(mongo.emails.find({"user_id": "u"}).to_list(None))
+        }
+
+    assert sync()["upload"]["requests"] == 10
+    before = stored_memory_ids()
+    assert len({tuple(memory_ids) for memory_ids in before.values()}) == 40
+
+    changed = gmail.messages[0]
+    changed["snippet"] = "Updated snippet"
+    result = sync()
+    assert result["upload"]["uploaded"] == 1
+    after = stored_memory_ids()
+    assert mem0.deleted == before[changed["id"]]
+    assert after[changed["id"]] != before[changed["id"]]
+    assert {email_id: ids for email_id, ids in after.items() if email_id != changed["id"]} == \
+        {email_id: ids for email_id, ids in before.items() if email_id != changed["id"]}
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tests for preparing email bodies for Mem0 in backend/app/mem0_ingest.py: stripping quoted
+replies, signatures and client footers, and splitting bodies by tokens with tiktoken or
+with the length estimate used without it.
+"""
+
+import re
+
+import pytest
+
+from app import mem0_ingest
+from app.mem0_ingest import strip_quotes_and_signature, split_by_tokens, count_tokens, preprocess_body
+
+
+class FakeEncoding:
+    """Stands in for cl100k_base: tokens are up to three characters, whitespace leading."""
+
+    _TOKEN = re.compile(r'\s*\S{1,3}|\s+')
+
+    def __init__(self):
+        self.vocab = []
+        self.ids = {}
+
+    def encode(self, text, disallowed_special=()):
+        tokens = []
+        for piece in self._TOKEN.findall(text):
+            if piece not in self.ids:
+                self.ids[piece] = len(self.vocab)
+                self.vocab.append(piece)
+            tokens.append(self.ids[piece])
+        return tokens
+
+    def decode(self, tokens):
+        return ''.join(self.vocab[token] for token in tokens)
+
+    def decode_single_token_bytes(self, token):
+        return self.vocab[token].encode('utf-8')
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    fake = FakeEncoding()
+    monkeypatch.setattr(mem0_ingest, "_encoding", fake)
+    monkeypatch.setattr(mem0_ingest, "_encoding_loaded", True)
+    return fake
+
+
+@pytest.fixture
+def no_encoding(monkeypatch):
+    monkeypatch.setattr(mem0_ingest, "_encoding", None)
+    monkeypatch.setattr(mem0_ingest, "_encoding_loaded", True)
+
+
+WORDS = " ".join(f"alpha{index}" for index in range(400))
+
+
+@pytest.mark.parametrize("reply", [
+    "On Mon, Jan 1, 2024 at 10:00 AM Alice <alice@example.com> wrote:\n> Are we on?\n> A",
+    "On Mon, Jan 1, 2024 at 10:00 AM Alice Example\n<alice@example.com> wrote:\n\nAre we on?",
+    "-----Original Message-----\nFrom: Alice\nSubject: Plan\n\nAre we on?",
+    "From: Alice <alice@example.com>\nTo: Bob <bob@example.com>\nSent: Monday\nSubject: Plan\n\nAre we on?",
+])
+def test_quoted_replies_are_dropped(reply):
+    body, quotes_stripped, signature_stripped = strip_quotes_and_signature("Yes, see you at 10.\n\n" + reply)
+    assert body == "Yes, see you at 10."
+    assert quotes_stripped and not signature_stripped
+
+
+def test_quoted_lines_are_dropped_inline():
+    body, quotes_stripped, _ = strip_quotes_and_signature("> Are we on?\nYes.\n> And lunch?\nSure.")
+    assert body == "Yes.\nSure." and quotes_stripped
+
+
+def test_signature_after_the_delimiter_is_dropped():
+    body, quotes_stripped, signature_stripped = strip_quotes_and_signature(
+        "Numbers attached.\n-- \nBob Example\nAcme Corp\n+1 555 0100"
+    )
+    assert body == "Numbers attached."
+    assert signature_stripped and not quotes_stripped
+
+
+@pytest.mark.parametrize("text", [
+    "Results\n--\nrow 1\n--\nrow 2",
+    "| name | total |\n|------|-------|\n| a    | 1     |\n--\nend of table",
+    "Minutes\n-- \n" + "\n".join(f"item {index}" for index in range(mem0_ingest.MAX_SIGNATURE_LINES + 2)),
+])
+def test_separators_that_are_not_signatures_are_kept(text):
+    assert strip_quotes_and_signature(text) == (text, False, False)
+
+
+@pytest.mark.parametrize("footer", ["Sent from my iPhone", "Get Outlook for Android", "Sent from Mail for Windows"])
+def test_client_footers_are_dropped(footer):
+    body, _, signature_stripped = strip_quotes_and_signature(f"Running late.\n\n{footer}")
+    assert body == "Running late." and signature_stripped
+
+
+def test_body_that_would_be_empty_is_kept():
+    assert strip_quotes_and_signature("> only a quote") == ("> only a quote", False, False)
+
+
+def test_token_chunks_cut_at_whitespace_within_the_budget(encoding):
+    chunks, cut = split_by_tokens(WORDS, budget=50, max_chunks=100)
+    assert not cut and len(chunks) > 1
+    assert ''.join(chunks) == WORDS
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    # A word is never split across chunks
+    assert all(chunk[:1] == " " for chunk in chunks[1:])
+
+
+def test_token_chunks_past_max_chunks_are_cut(encoding):
+    chunks, cut = split_by_tokens(WORDS, budget=50, max_chunks=2)
+    assert cut and len(chunks) == 2
+    assert WORDS.startswith(''.join(chunks))
+    assert split_by_tokens("short text", budget=50, max_chunks=1) == (["short text"], False)
+
+
+def test_chunks_are_estimated_from_length_without_tiktoken(no_encoding):
+    assert count_tokens("x" * 10) == 3
+    chunks, cut = split_by_tokens(WORDS, budget=50, max_chunks=1000)
+    assert not cut and len(chunks) > 1 and ''.join(chunks) == WORDS
+    assert all(len(chunk) <= 50 * mem0_ingest.CHARS_PER_TOKEN for chunk in chunks)
+    assert all(chunk.endswith(" ") for chunk in chunks[:-1])
+    # Without whitespace to cut at, the piece is cut at the size
+    chunks, _ = split_by_tokens("x" * 100, budget=10, max_chunks=10)
+    assert [len(chunk) for chunk in chunks] == [40, 40, 20]
+
+
+def test_missing_or_unloadable_tiktoken_falls_back(monkeypatch):
+    monkeypatch.setattr(mem0_ingest, "_encoding", None)
+    monkeypatch.setattr(mem0_ingest, "_encoding_loaded", False)
+    monkeypatch.setattr(mem0_ingest, "tiktoken", None)
+    assert count_tokens("x" * 8) == 2
+
+    class OfflineTiktoken:
+        @staticmethod
+        def get_encoding(name):
+            raise OSError("no network")
+    monkeypatch.setattr(mem0_ingest, "_encoding_loaded", False)
+    monkeypatch.setattr(mem0_ingest, "tiktoken", OfflineTiktoken)
+    assert count_tokens("x" * 8) == 2
+    assert mem0_ingest._encoding is None
+
+
+def test_preprocess_body_reports_what_it_dropped(no_encoding, monkeypatch):
+    chunks, flags = preprocess_body(
+        "Done.\n\nOn Tue, Alice wrote:\n> Is it done?\n\nSent from my iPhone", token_budget=50, max_chunks=1
+    )
+    assert chunks == ["Done."]
+    assert flags == {"quotes_stripped": True, "signature_stripped": False, "truncated": False}
+
+    monkeypatch.setattr(mem0_ingest, "MEM0_INGEST_STRIP_QUOTES", False)
+    chunks, flags = preprocess_body(WORDS, token_budget=10, max_chunks=2)
+    assert len(chunks) == 2 and flags["truncated"] and not flags["quotes_stripped"]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the MongoDB outbox of Mem0 uploads in backend/app/mem0_outbox.py: claims and
+leases, retries with backoff, dead-lettering and the worker pool.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import main, mem0_outbox
+from app.email_store import upsert_emails
+from app.mem0_outbox import (
+    enqueue_mem0_uploads, claim_uploads, process_uploads, outbox_counts, requeue_dead_uploads,
+    start_outbox_workers, stop_outbox_workers
+)
+from app.utils import RetryConfig
+
+
+def store(user_id, count, start=0):
+    """Store count emails for user_id and queue their uploads; returns their ids."""
+    emails = [
+        {"id": f"msg{index:06d}", "subject": f"Subject {index}", "snippet": "s", "body": f"Body of email {index}."}
+        for index in range(start, start + count)
+    ]
+    asyncio.run(upsert_emails(user_id, emails))
+    asyncio.run(enqueue_mem0_uploads(user_id, emails))
+    return [email_item["id"] for email_item in emails]
+
+
+def entries(mongo, **query):
+    return asyncio.run(mongo.mem0_outbox.find(query).to_list(None))
+
+
+def test_sync_only_enqueues(mongo, gmail, mem0, monkeypatch):
+    monkeypatch.setattr(main, "MEM0_OUTBOX_ENABLED", True)
+    result = asyncio.run(main._trigger_and_process_user_emails("u", access_token="token", max_results=100))
+    assert result["upload"]["enqueued"] == 40 and result["upload"]["uploaded"] == 0
+    assert mem0.calls == []
+    assert asyncio.run(outbox_counts("u")) == {"pending": 40, "leased": 0, "dead": 0}
+
+
+def test_claims_take_one_user_and_never_overlap(mongo, mem0):
+    store("a", 5)
+    store("b", 3, start=100)
+    first = asyncio.run(claim_uploads("w1", limit=3))
+    second = asyncio.run(claim_uploads("w2", limit=3))
+    assert {entry["user_id"] for entry in first} == {entry["user_id"] for entry in second} == {"a"}
+    assert len(first) == 3 and len(second) == 2
+    assert not {entry["email_id"] for entry in first} & {entry["email_id"] for entry in second}
+    assert all(entry["status"] == "leased" and entry["attempts"] == 1 for entry in first + second)
+    assert first[0]["leased_by"].startswith("w1:")
+    # Only b is left to claim
+    assert {entry["user_id"] for entry in asyncio.run(claim_uploads("w3"))} == {"b"}
+    assert asyncio.run(claim_uploads("w4")) == []
+
+
+def test_expired_lease_is_claimed_again(mongo, mem0):
+    store("u", 2)
+    stale = asyncio.run(claim_uploads("w1"))
+    asyncio.run(mongo.mem0_outbox.update_many({}, {"$set": {"available_at": datetime.now() - timedelta(seconds=1)}}))
+    fresh = asyncio.run(claim_uploads("w2"))
+    assert len(fresh) == 2 and all(entry["attempts"] == 2 for entry in fresh)
+
+    # The worker that lost its lease settles nothing
+    mem0.failing.add(stale[0]["email_id"])
+    asyncio.run(process_uploads(stale))
+    assert all(entry["leased_by"] == fresh[0]["leased_by"] for entry in entries(mongo))
+
+    mem0.failing.clear()
+    counts = asyncio.run(process_uploads(fresh))
+    assert counts["uploaded"] == 2 and entries(mongo) == []
+
+
+def test_uploaded_entries_are_deleted_and_missing_emails_dropped(mongo, mem0):
+    ids = store("u", 3)
+    asyncio.run(mongo.emails.delete_one({"user_id": "u", "id": ids[2]}))
+    counts = asyncio.run(process_uploads(asyncio.run(claim_uploads("w1"))))
+    assert counts["uploaded"] == 2 and counts["dropped"] == 1 and counts["failed"] == 0
+    assert entries(mongo) == []
+    stored = asyncio.run(mongo.emails.find_one({"user_id": "u", "id": ids[0]}))
+    assert stored["mem0_content_hash"] == stored["content_hash"]
+
+
+def test_failures_back_off_then_dead_letter(mongo, mem0, monkeypatch):
+    monkeypatch.setattr(mem0_outbox, "MEM0_OUTBOX_RETRY_CONFIG", RetryConfig(max_attempts=3, delay=60, max_delay=60))
+    ids = store("u", 2)
+    mem0.failing.add(ids[0])
+
+    counts = asyncio.run(process_uploads(asyncio.run(claim_uploads("w1"))))
+    assert counts["uploaded"] == 1 and counts["failed"] == 1
+    [entry] = entries(mongo)
+    assert entry["status"] == "pending" and entry["attempts"] == 1
+    assert "fake Mem0 failure" in entry["last_error"]
+    # Not due again until the backoff has passed
+    assert entry["available_at"] > datetime.now() + timedelta(seconds=30)
+    assert asyncio.run(claim_uploads("w1")) == []
+
+    for _ in range(2):
+        asyncio.run(mongo.mem0_outbox.update_many({}, {"$set": {"available_at": datetime.now()}}))
+        asyncio.run(process_uploads(asyncio.run(claim_uploads("w1"))))
+    [entry] = entries(mongo)
+    assert entry["status"] == "dead" and entry["attempts"] == 3
+    assert asyncio.run(claim_uploads("w1")) == []
+
+    mem0.failing.clear()
+    assert asyncio.run(requeue_dead_uploads("u")) == 1
+    assert asyncio.run(outbox_counts("u")) == {"pending": 1, "leased": 0, "dead": 0}
+    assert asyncio.run(process_uploads(asyncio.run(claim_uploads("w1"))))["uploaded"] == 1
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_workers_drain_the_outbox(mongo, mem0, monkeypatch, workers):
+    monkeypatch.setattr(mem0_outbox, "MEM0_OUTBOX_BATCH_SIZE", 7)
+    monkeypatch.setattr(mem0_outbox, "MEM0_OUTBOX_POLL_SECONDS", 0.01)
+    ids = store("a", 20) + store("b", 20, start=100)
+
+    async def drain():
+        tasks = start_outbox_workers(workers)
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if await mongo.mem0_outbox.count_documents({}) == 0:
+                break
+        await stop_outbox_workers(tasks)
+    asyncio.run(drain())
+    assert sorted(email_id for call in mem0.calls for email_id in call["email_ids"]) == sorted(ids)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Correctness tests for the Gmail MIME body extraction in backend/app/mime_extract.py.
+"""
+
+import sys
+import os
+import base64
+
+# Add the backend/app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend', 'app'))
+
+from mime_extract import extract_body, decode_part_data, is_attachment
+
+
+def b64(raw):
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def text_part(mime_type, text, charset=None, encoding='utf-8'):
+    part = {"mimeType": mime_type, "filename": "", "body": {"data": b64(text.encode(encoding))}}
+    if charset:
+        part["headers"] = [{"name": "Content-Type", "value": f'{mime_type}; charset="{charset}"'}]
+    return part
+
+
+def multipart(mime_type, *parts):
+    return {"mimeType": mime_type, "filename": "", "body": {"size": 0}, "parts": list(parts)}
+
+
+def test_single_part_plain():
+    payload = text_part("text/plain", "Hello world")
+    assert extract_body(payload) == ("Hello world", "text/plain")
+
+
+def test_prefers_plain_over_html():
+    payload = multipart("multipart/alternative",
+                        text_part("text/html", "<p>html</p>"),
+                        text_part("text/plain", "plain"))
+    assert extract_body(payload) == ("plain", "text/plain")
+
+
+def test_nested_alternative_inside_mixed():
+    payload = multipart("multipart/mixed",
+                        multipart("multipart/related",
+                                  multipart("multipart/alternative",
+                                            text_part("text/plain", "nested plain"),
+                                            text_part("text/html", "<p>nested</p>"))),
+                        {"mimeType": "application/pdf", "filename": "a.pdf", "body": {"attachmentId": "att1", "size": 1000}})
+    assert extract_body(payload) == ("nested plain", "text/plain")
+
+
+def test_html_only():
+    payload = multipart("multipart/mixed",
+                        multipart("multipart/alternative", text_part("text/html", "<b>only html</b>")))
+    assert extract_body(payload) == ("<b>only html</b>", "text/html")
+
+
+def test_part_charset_is_honoured():
+    payload = multipart("multipart/alternative",
+                        text_part("text/plain", "Grüße aus Köln", charset="iso-8859-1", encoding='latin-1'))
+    assert extract_body(payload) == ("Grüße aus Köln", "text/plain")
+
+
+def test_single_part_uses_top_level_charset():
+    payload = text_part("text/plain", "Привет", charset="koi8-r", encoding='koi8-r')
+    assert extract_body(payload) == ("Привет", "text/plain")
+
+
+def test_unknown_charset_falls_back_to_utf8():
+    payload = text_part("text/plain", "café", charset="x-made-up")
+    assert extract_body(payload) == ("café", "text/plain")
+
+
+def test_invalid_bytes_are_replaced():
+    payload = {"mimeType": "text/plain", "body": {"data": b64(b"ok \xff\xfe end")}}
+    text, _ = extract_body(payload)
+    assert text.startswith("ok ") and text.endswith(" end") and "�" in text
+
+
+def test_text_attachment_is_skipped():
+    attachment = text_part("text/plain", "attached notes")
+    attachment["filename"] = "notes.txt"
+    disposition = text_part("text/plain", "inline-less notes")
+    disposition["headers"] = [{"name": "Content-Disposition", "value": 'attachment; filename="x.txt"'}]
+    payload = multipart("multipart/mixed", attachment, disposition, text_part("text/html", "<p>real</p>"))
+    assert is_attachment(attachment) and is_attachment(disposition)
+    assert extract_body(payload) == ("<p>real</p>", "text/html")
+
+
+def test_attachment_data_is_never_decoded():
+    attachment = {"mimeType": "text/plain", "filename": "bad.txt", "body": {"data": "!!! not base64 !!!"}}
+    payload = multipart("multipart/mixed", attachment, text_part("text/plain", "body"))
+    assert extract_body(payload) == ("body", "text/plain")
+
+
+def test_max_bytes_caps_output():
+    payload = text_part("text/plain", "x" * 100000)
+    text, _ = extract_body(payload, max_bytes=1000)
+    assert text == "x" * 1000
+
+
+def test_max_bytes_does_not_split_multibyte_characters():
+    # "é" is two bytes in UTF-8; a 7-byte cap lands in the middle of the fourth one
+    text = decode_part_data(b64("éééé"), max_bytes=7)
+    assert text == "ééé"
+
+
+def test_unpadded_base64_is_accepted():
+    data = b64("padding test!").rstrip("=")
+    assert decode_part_data(data) == "padding test!"
+
+
+def test_no_text_part():
+    payload = multipart("multipart/mixed",
+                        {"mimeType": "image/png", "filename": "a.png", "body": {"attachmentId": "att1"}})
+    assert extract_body(payload) == ("", None)
+
+
+def test_empty_payload():
+    assert extract_body({}) == ("", None)
+
+
+if __name__ == "__main__":
+    print("🧪 Testing MIME body extraction")
+    print("=" * 50)
+
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e!r}")
+
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for resuming interrupted full syncs from their checkpoint (backend/app/sync_checkpoints.py)
+and for handing syncs whose heartbeat stopped back to the scheduler.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app import gmail as gmail_api, main, sync_checkpoints
+from app.sync_checkpoints import (
+    load_sync_checkpoint, start_sync_checkpoint, save_sync_checkpoint, reset_interrupted_syncs,
+    sync_checkpoint_heartbeat, STAGE_FINALIZING
+)
+
+
+def sync(user_id="u"):
+    return asyncio.run(main._trigger_and_process_user_emails(user_id, access_token="token", max_results=100))
+
+
+def stored_ids(mongo, user_id="u"):
+    async def ids():
+        return {email_item["id"] async for email_item in mongo.emails.find({"user_id": user_id}, {"id": 1})}
+    return asyncio.run(ids())
+
+
+def add_user(mongo, user_id="u", fetched_email=False):
+    asyncio.run(mongo.users.insert_one({"user_id": user_id, "fetched_email": fetched_email}))
+
+
+def test_failed_sync_resumes_from_checkpoint(mongo, gmail, mem0, monkeypatch):
+    monkeypatch.setattr(gmail_api, "GMAIL_STREAM_CHUNK_SIZE", 10)
+    upsert_emails = main.upsert_emails
+    calls = []
+
+    async def failing_upsert(user_id, chunk, ledger):
+        calls.append(len(chunk))
+        if len(calls) == 3:
+            raise RuntimeError("MongoDB went away")
+        return await upsert_emails(user_id, chunk, ledger)
+
+    monkeypatch.setattr(main, "upsert_emails", failing_upsert)
+    add_user(mongo)
+    assert sync()["status"] == "error"
+    checkpoint = asyncio.run(load_sync_checkpoint("u"))
+    assert checkpoint is not None and checkpoint["history_id"] == str(gmail.history_id)
+    processed = set(checkpoint["processed_ids"])
+    assert len(processed) < 40 and processed <= set(checkpoint["listed_ids"])
+
+    result = sync()
+    assert result["status"] == "success" and result["count"] == 40
+    assert len(stored_ids(mongo)) == 40
+    assert asyncio.run(load_sync_checkpoint("u")) is None
+    # Emails already recorded in the checkpoint are not downloaded again
+    assert sum(calls[3:]) == 40 - len(processed)
+
+
+def test_resume_skips_processed_ids(mongo, gmail, mem0):
+    add_user(mongo)
+    processed = [message["id"] for message in gmail.messages[:15]]
+    asyncio.run(start_sync_checkpoint("u", "777"))
+    asyncio.run(save_sync_checkpoint("u", position={"page_token": None, "listed_count": 0}, processed_ids=processed))
+    requests_before = gmail.sub_requests
+
+    result = sync()
+    assert result["count"] == 40 and result["history_id"] == "777"
+    # One messages.list and a messages.get for each of the 25 remaining emails
+    assert gmail.sub_requests - requests_before == 26
+    assert stored_ids(mongo) == {message["id"] for message in gmail.messages[15:]}
+    assert asyncio.run(mongo.users.find_one({"user_id": "u"}))["gmail_history_id"] == "777"
+
+
+def test_resume_keeps_emails_listed_before_the_interruption(mongo, gmail, mem0, monkeypatch):
+    add_user(mongo)
+    sync()
+    ids = [message["id"] for message in gmail.messages]
+    monkeypatch.setattr(main, "GMAIL_INCREMENTAL_SYNC", False)
+    # The interrupted run listed the first page of 20, but one of its emails failed to fetch
+    failed = ids[5]
+    asyncio.run(start_sync_checkpoint("u", "777"))
+    asyncio.run(save_sync_checkpoint(
+        "u", position={"page_token": "20", "listed_count": 20},
+        processed_ids=[email_id for email_id in ids[:20] if email_id != failed], listed_ids=ids[:20]
+    ))
+
+    result = sync()
+    assert result["status"] == "success"
+    assert result["storage"]["deleted"] == 0
+    assert failed in stored_ids(mongo)
+
+
+def test_finalizing_checkpoint_only_completes_the_user(mongo, gmail, mem0):
+    add_user(mongo)
+    asyncio.run(start_sync_checkpoint("u", "777"))
+    asyncio.run(save_sync_checkpoint("u", stage=STAGE_FINALIZING, processed_ids=["a", "b"]))
+    requests_before = gmail.sub_requests
+
+    result = sync()
+    assert result["count"] == 2
+    assert gmail.sub_requests == requests_before
+    assert asyncio.run(load_sync_checkpoint("u")) is None
+
+
+def test_old_checkpoints_are_discarded(mongo):
+    asyncio.run(start_sync_checkpoint("u", "777"))
+    started = datetime.now() - timedelta(seconds=sync_checkpoints.SYNC_CHECKPOINT_MAX_AGE_SECONDS + 60)
+    asyncio.run(mongo.sync_checkpoints.update_one({"user_id": "u"}, {"$set": {"started_at": started}}))
+    assert asyncio.run(load_sync_checkpoint("u")) is None
+    assert asyncio.run(mongo.sync_checkpoints.count_documents({})) == 0
+
+
+def test_reset_only_syncs_without_heartbeat(mongo):
+    stale = datetime.now() - timedelta(seconds=sync_checkpoints.SYNC_CHECKPOINT_STALE_SECONDS + 60)
+    for user_id in ("running", "dead", "legacy"):
+        add_user(mongo, user_id, fetched_email=True)
+        asyncio.run(start_sync_checkpoint(user_id, "777"))
+    # A sync that started long ago but is still beating is left alone
+    asyncio.run(mongo.sync_checkpoints.update_one(
+        {"user_id": "running"}, {"$set": {"started_at": stale, "updated_at": stale}}
+    ))
+    asyncio.run(mongo.sync_checkpoints.update_one({"user_id": "dead"}, {"$set": {"heartbeat_at": stale}}))
+    asyncio.run(mongo.sync_checkpoints.update_one(
+        {"user_id": "legacy"}, {"$set": {"updated_at": stale}, "$unset": {"heartbeat_at": ""}}
+    ))
+
+    assert sorted(asyncio.run(reset_interrupted_syncs())) == ["dead", "legacy"]
+    fetched = {user["user_id"]: user["fetched_email"] for user in asyncio.run(mongo.users.find().to_list(None))}
+    assert fetched == {"running": True, "dead": False, "legacy": False}
+
+
+def test_heartbeat_keeps_slow_sync_alive(mongo):
+    asyncio.run(start_sync_checkpoint("u", "777"))
+    stale = datetime.now() - timedelta(hours=1)
+    asyncio.run(mongo.sync_checkpoints.update_one({"user_id": "u"}, {"$set": {"heartbeat_at": stale}}))
+
+    async def slow_stage():
+        async with sync_checkpoint_heartbeat("u", interval=0.01):
+            await asyncio.sleep(0.05)
+
+    asyncio.run(slow_stage())
+    assert asyncio.run(reset_interrupted_syncs(stale_seconds=60)) == []